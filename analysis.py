@@ -0,0 +1,668 @@
+"""
+Análisis de pallets sin dependencia de Streamlit.
+
+Incluye la clasificación de severidad/estado compartida por el análisis completo,
+el súper análisis en formato largo (SuperAnalysisStore) y el modo incremental
+(IncrementalAnalysis), que guarda agregados parciales por pallet para incorporar
+un día nuevo sin recalcular todo el histórico.
+"""
+import numpy as np
+import pandas as pd
+
+# Claves de fila del súper análisis (tabla pivote pallets × fechas)
+PALLET_KEYS = ["Codigo", "Nombre", "ID_Pallet", "Almacen"]
+
+ANALYSIS_COLUMNS = [
+    "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
+    "Primera_Aparicion", "Ultima_Aparicion", "Veces_Reportado",
+    "Cantidad_Promedio", "Cantidad_Minima", "Cantidad_Maxima", "Cantidad_Suma"
+]
+
+RECURRENCE_COLUMNS = [
+    "ID_Unico_Pallet", "Codigo", "Nombre", "Almacen", "Fechas", "Huecos", "Hueco_Maximo_Dias"
+]
+
+# Multiplicador para combinar los hashes de Codigo e ID_Pallet en una clave de 64 bits
+_KEY_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _category_hashes(serie):
+    """Hash estable (uint64) por fila calculado una sola vez por valor distinto"""
+    cat = serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+    categorias = cat.cat.categories.astype(str).to_numpy(dtype=object)
+    return pd.util.hash_array(categorias)[cat.cat.codes.to_numpy()]
+
+
+def pallet_key(codigo, id_pallet):
+    """
+    Clave de pallet de 64 bits equivalente a Codigo + "_" + ID_Pallet
+
+    Se deriva del texto de cada valor (no de los códigos de categoría), por lo
+    que es estable entre cargas distintas y permite combinar días nuevos.
+    """
+    with np.errstate(over="ignore"):
+        clave = (_category_hashes(codigo) * _KEY_MIX) ^ _category_hashes(id_pallet)
+    return pd.Series(clave.view("int64"), index=codigo.index)
+
+
+def compact_pallet_frame(df):
+    """
+    Representación compacta de un df normalizado
+
+    Codigo, ID_Pallet, Almacen y Nombre pasan a categóricas (códigos enteros más
+    un diccionario de valores distintos) e ID_Unico_Pallet a una clave int64.
+    """
+    for col in PALLET_KEYS:
+        df[col] = df[col].astype("category")
+    df["ID_Unico_Pallet"] = pallet_key(df["Codigo"], df["ID_Pallet"])
+    return df
+
+
+def is_compact(df):
+    """True si el df usa la clave de pallet entera en lugar del texto"""
+    return "ID_Unico_Pallet" in df.columns and pd.api.types.is_integer_dtype(df["ID_Unico_Pallet"])
+
+
+def pallet_labels(codigo, id_pallet):
+    """Texto Codigo_IDPallet para mostrar/exportar"""
+    return codigo.astype(str) + "_" + id_pallet.astype(str)
+
+
+def with_pallet_labels(df):
+    """
+    Devuelve una copia con texto en lugar de tipos compactos (para mostrar/exportar)
+
+    ID_Unico_Pallet vuelve a ser "Codigo_IDPallet" y las columnas categóricas
+    de pallet se convierten a texto. Si el df ya usa texto se devuelve tal cual.
+    """
+    if not is_compact(df) and not any(
+        isinstance(df[c].dtype, pd.CategoricalDtype) for c in PALLET_KEYS if c in df.columns
+    ):
+        return df
+    df = df.copy()
+    if is_compact(df):
+        df["ID_Unico_Pallet"] = pallet_labels(df["Codigo"], df["ID_Pallet"])
+    for col in PALLET_KEYS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    return df
+
+
+def concat_frames(frames):
+    """
+    pd.concat que conserva las columnas categóricas unificando sus categorías
+
+    Las categorías unificadas quedan ordenadas: los agrupamientos por código de
+    categoría (pivot_table, SuperAnalysisStore) dan el mismo orden que con texto.
+    """
+    frames = [f for f in frames if f is not None]
+    categoricas = [
+        c for c in frames[0].columns
+        if isinstance(frames[0][c].dtype, pd.CategoricalDtype)
+        and all(c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype) for f in frames)
+    ]
+    if categoricas:
+        frames = [f.copy() for f in frames]
+        for col in categoricas:
+            categorias = pd.api.types.union_categoricals([f[col] for f in frames], sort_categories=True).categories
+            for f in frames:
+                f[col] = f[col].cat.set_categories(categorias)
+    return pd.concat(frames, ignore_index=True)
+
+
+def classify_severity(magnitudes):
+    """
+    Severidad por magnitud del negativo - Versión robusta
+
+    Args:
+        magnitudes: Series con |Cantidad_Promedio| por pallet
+
+    Returns:
+        Valor asignable a la columna "Severidad" (Series o escalar)
+    """
+    if len(magnitudes) == 0:
+        # Sin datos
+        return pd.Series(dtype="category")
+    elif magnitudes.nunique() == 1:
+        # Todos los valores son iguales
+        return "Medio"
+    elif len(magnitudes) < 4:
+        # Muy pocos datos: categorización simple
+        median_val = magnitudes.median()
+        return magnitudes.apply(
+            lambda x: "Crítico" if x > median_val else "Bajo"
+        )
+
+    # Suficientes datos: categorización completa
+    try:
+        # Intentar con percentiles
+        q25, q50, q75 = np.percentile(magnitudes, [25, 50, 75])
+
+        # Verificar si hay bins únicos suficientes
+        bins = [-1, q25, q50, q75, float("inf")]
+        unique_bins = sorted(set(bins))
+
+        if len(unique_bins) < 3:
+            # No hay suficientes bins únicos, usar categorización simple
+            median_val = magnitudes.median()
+            return magnitudes.apply(
+                lambda x: "Alto" if x > median_val * 1.5 else ("Medio" if x > median_val else "Bajo")
+            )
+
+        # Usar pd.qcut que maneja automáticamente los duplicados
+        return pd.qcut(
+            magnitudes,
+            q=[0, 0.25, 0.5, 0.75, 1.0],
+            labels=["Bajo", "Medio", "Alto", "Crítico"],
+            duplicates='drop'
+        )
+    except Exception:
+        # Si todo falla, usar categorización simple por mediana
+        median_val = magnitudes.median()
+        return magnitudes.apply(
+            lambda x: "Alto" if x > median_val * 1.5 else ("Medio" if x > median_val else "Bajo")
+        )
+
+
+def finalize_analysis(analisis, fecha_ultimo):
+    """
+    Completa el análisis por pallet con días acumulados, severidad, estado y score
+
+    Args:
+        analisis: DataFrame con ANALYSIS_COLUMNS (un registro por pallet)
+        fecha_ultimo: fecha más reciente cargada (define qué pallets siguen activos)
+    """
+    analisis["Dias_Acumulados"] = (analisis["Ultima_Aparicion"] - analisis["Primera_Aparicion"]).dt.days + 1
+
+    magnitudes = np.abs(analisis["Cantidad_Promedio"])
+    analisis["Severidad"] = classify_severity(magnitudes)
+
+    # Estado (activo/resuelto)
+    analisis["Estado"] = np.where(analisis["Ultima_Aparicion"] == fecha_ultimo, "Activo", "Resuelto")
+
+    # Score de criticidad
+    analisis["Score_Criticidad"] = analisis["Dias_Acumulados"] * np.abs(analisis["Cantidad_Promedio"])
+
+    return analisis
+
+
+def build_pallet_analysis(df_total):
+    """Análisis principal de pallets (un registro por ID_Unico_Pallet)"""
+    analisis = df_total.groupby("ID_Unico_Pallet").agg({
+        "Codigo": "first",
+        "Nombre": "first", 
+        "ID_Pallet": "first",
+        "Almacen": "first",
+        "Fecha_Reporte": ["min", "max", "count"],
+        "Cantidad_Negativa": ["mean", "min", "max", "sum"]
+    }).reset_index()
+    
+    analisis.columns = [
+        "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
+        "Primera_Aparicion", "Ultima_Aparicion", "Veces_Reportado", 
+        "Cantidad_Promedio", "Cantidad_Minima", "Cantidad_Maxima", "Cantidad_Suma"
+    ]
+    
+    if is_compact(df_total):
+        # Texto Codigo_IDPallet solo en la tabla por pallet (mostrar/exportar)
+        analisis = with_pallet_labels(analisis).sort_values("ID_Unico_Pallet", ignore_index=True)
+    
+    # Días acumulados, severidad, estado y score de criticidad
+    fecha_ultimo = df_total["Fecha_Reporte"].max()
+    analisis = finalize_analysis(analisis, fecha_ultimo)
+    
+    return analisis
+
+
+def _join_fechas(pares):
+    """
+    Texto "dd-mm-aaaa, ..." por pallet a partir de pares ordenados por pallet y fecha
+
+    Cada fecha distinta se formatea una sola vez y los grupos se cortan por
+    posición, evitando un groupby con función Python por pallet.
+    """
+    ids = pares["ID_Unico_Pallet"].to_numpy()
+    if len(ids) == 0:
+        return pd.Series(dtype=object)
+    codigos, unicas = pd.factorize(pares["Fecha_Reporte"])
+    textos = np.asarray(pd.DatetimeIndex(unicas).strftime("%d-%m-%Y"), dtype=object)[codigos]
+    inicios = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    grupos = np.split(textos, inicios[1:])
+    return pd.Series([", ".join(g) for g in grupos], index=ids[inicios])
+
+
+def _pallet_dates(df_total):
+    """
+    Fechas únicas por pallet ordenadas, con la distancia a la aparición anterior
+
+    Returns:
+        DataFrame con ID_Unico_Pallet, Fecha_Reporte y Distancia (Timedelta,
+        NaT en la primera aparición de cada pallet)
+    """
+    pares = (
+        df_total[["ID_Unico_Pallet", "Fecha_Reporte"]]
+        .drop_duplicates()
+        .sort_values(["ID_Unico_Pallet", "Fecha_Reporte"], ignore_index=True)
+    )
+    mismo_pallet = pares["ID_Unico_Pallet"].eq(pares["ID_Unico_Pallet"].shift())
+    pares["Distancia"] = pares["Fecha_Reporte"].diff().where(mismo_pallet)
+    return pares
+
+
+def _gap_stats(pares):
+    """Número de huecos (> 1 día entre apariciones) y hueco máximo en días por pallet"""
+    hueco = pares["Distancia"] > pd.Timedelta(days=1)
+    por_pallet = pares["ID_Unico_Pallet"]
+    return pd.DataFrame({
+        "Huecos": hueco.groupby(por_pallet).sum().astype("int64"),
+        "Hueco_Maximo_Dias": (
+            pares["Distancia"].where(hueco).dt.days.groupby(por_pallet).max().fillna(0).astype("int64")
+        ),
+    })
+
+
+def recurrence_table(df_total):
+    """
+    Reincidencias vectorizadas: pallets que reaparecen tras más de un día ausentes
+
+    Ordena una sola vez las fechas únicas por pallet y calcula los huecos con
+    una diferencia contra la fila anterior, sin recorrer los grupos en Python.
+
+    Returns:
+        DataFrame con RECURRENCE_COLUMNS (una fila por pallet reincidente)
+    """
+    pares = _pallet_dates(df_total)
+    hueco = pares["Distancia"] > pd.Timedelta(days=1)
+    reincidente = hueco.groupby(pares["ID_Unico_Pallet"]).transform("any")
+
+    huecos = _gap_stats(pares)
+    huecos = huecos[huecos["Huecos"] > 0]
+    fechas = _join_fechas(pares[reincidente])
+
+    primeros = df_total.groupby("ID_Unico_Pallet")[["Codigo", "Nombre", "ID_Pallet", "Almacen"]].first()
+    tabla = primeros.join(huecos, how="inner")
+    tabla["Fechas"] = fechas
+    tabla = tabla.reset_index()
+
+    if is_compact(tabla):
+        tabla["ID_Unico_Pallet"] = pallet_labels(tabla["Codigo"], tabla["ID_Pallet"])
+        tabla = tabla.sort_values("ID_Unico_Pallet")
+    return with_pallet_labels(tabla[RECURRENCE_COLUMNS].reset_index(drop=True))
+
+
+def _pallet_partials(df):
+    """Agregados mergeables por pallet (first, min/max fecha, count, sum, min, max)"""
+    parciales = df.groupby("ID_Unico_Pallet").agg(
+        Codigo=("Codigo", "first"),
+        Nombre=("Nombre", "first"),
+        ID_Pallet=("ID_Pallet", "first"),
+        Almacen=("Almacen", "first"),
+        Primera_Aparicion=("Fecha_Reporte", "min"),
+        Ultima_Aparicion=("Fecha_Reporte", "max"),
+        Veces_Reportado=("Fecha_Reporte", "count"),
+        Cantidad_Suma=("Cantidad_Negativa", "sum"),
+        Cantidad_Minima=("Cantidad_Negativa", "min"),
+        Cantidad_Maxima=("Cantidad_Negativa", "max"),
+    )
+    # Un registro por pallet: texto plano para poder combinar días con categorías distintas
+    return with_pallet_labels(parciales)
+
+
+def _plain_index(index):
+    """Convierte a texto los niveles categóricos de un MultiIndex de pallets"""
+    return pd.MultiIndex.from_arrays(
+        [index.get_level_values(i).astype(str) for i in range(index.nlevels)],
+        names=index.names
+    )
+
+
+def _day_column(df_dia):
+    """Columna del súper análisis para un día (aggfunc="first" por clave de pallet)"""
+    columna = df_dia.groupby(PALLET_KEYS, observed=True)["Cantidad_Negativa"].first()
+    columna.index = _plain_index(columna.index)
+    return columna
+
+
+class SuperAnalysisStore:
+    """
+    Súper análisis en formato largo (disperso)
+
+    En lugar de la tabla pallets × fechas (casi toda NaN) guarda solo las celdas
+    con dato en tres arrays paralelos (fila, fecha, valor) más la tabla de
+    claves de pallet. La vista ancha se construye bajo demanda solo para las
+    filas y fechas que se muestran o exportan (ver wide).
+    """
+
+    def __init__(self):
+        self.filas = pd.DataFrame({col: pd.Series(dtype=object) for col in PALLET_KEYS})
+        self.fechas = []
+        self._bloques = []
+        self._ordenado = True
+
+    @classmethod
+    def from_frame(cls, df_total):
+        """Construye el almacén a partir de un df_total normalizado (aggfunc="first")"""
+        store = cls()
+        df = df_total[df_total["Cantidad_Negativa"].notna()]
+        grupos = df.groupby(PALLET_KEYS, observed=True, sort=True)
+        fila = grupos.ngroup().to_numpy(dtype=np.int64)
+        fecha, fechas = pd.factorize(df["Fecha_Reporte"], sort=True)
+
+        # Primera aparición de cada celda (pallet, fecha), como aggfunc="first"
+        celda = fila * max(len(fechas), 1) + fecha
+        primera = ~pd.Series(celda).duplicated().to_numpy()
+
+        store.filas = _plain_index(grupos.size().index).to_frame(index=False, name=PALLET_KEYS)
+        store.fechas = list(fechas)
+        store._bloques = [(
+            fila[primera].astype(np.int32),
+            fecha[primera].astype(np.int32),
+            df["Cantidad_Negativa"].to_numpy(dtype=np.float64)[primera],
+        )]
+        return store
+
+    def __len__(self):
+        return len(self.filas)
+
+    def __reduce__(self):
+        # Estado explícito: lo usan pickle y el hash de argumentos de st.cache_data
+        return (SuperAnalysisStore, (), dict(self.__dict__))
+
+    @property
+    def nnz(self):
+        """Número de celdas con dato"""
+        return sum(len(valor) for _, _, valor in self._bloques)
+
+    def append_day(self, fecha, columna):
+        """
+        Agrega la columna de un día posterior a los ya cargados
+
+        Args:
+            fecha: Timestamp del día
+            columna: Series indexada por PALLET_KEYS (ver _day_column)
+        """
+        columna = columna[columna.notna()]
+        posiciones = pd.MultiIndex.from_frame(self.filas).get_indexer(columna.index)
+        nuevas = posiciones == -1
+        if nuevas.any():
+            posiciones[nuevas] = len(self.filas) + np.arange(nuevas.sum())
+            self.filas = pd.concat(
+                [self.filas, columna.index[nuevas].to_frame(index=False)], ignore_index=True
+            )
+            # Las filas nuevas quedan al final hasta la próxima vista
+            self._ordenado = False
+
+        self._bloques.append((
+            posiciones.astype(np.int32),
+            np.full(len(posiciones), len(self.fechas), dtype=np.int32),
+            columna.to_numpy(dtype=np.float64),
+        ))
+        self.fechas.append(fecha)
+
+    def _consolidar(self):
+        """Une los bloques en un único juego de arrays y ordena las filas por clave"""
+        if len(self._bloques) > 1:
+            self._bloques = [tuple(np.concatenate(partes) for partes in zip(*self._bloques))]
+        if not self._ordenado:
+            orden = self.filas.sort_values(PALLET_KEYS).index.to_numpy()
+            nueva_pos = np.empty(len(orden), dtype=np.int32)
+            nueva_pos[orden] = np.arange(len(orden), dtype=np.int32)
+            fila, fecha, valor = self._bloques[0]
+            self._bloques = [(nueva_pos[fila], fecha, valor)]
+            self.filas = self.filas.iloc[orden].reset_index(drop=True)
+            self._ordenado = True
+        if not self._bloques:
+            vacio = np.empty(0, dtype=np.int32)
+            return vacio, vacio, np.empty(0, dtype=np.float64)
+        return self._bloques[0]
+
+    def keys(self):
+        """Claves de pallet en el orden de la vista ancha (índice = posición de fila)"""
+        self._consolidar()
+        return self.filas
+
+    def wide(self, filas=None, fechas=None):
+        """
+        Vista ancha (mismas columnas que create_super_analysis) de un subconjunto
+
+        Args:
+            filas: máscara booleana o posiciones sobre keys(); None = todas
+            fechas: fechas a incluir; None = todas
+
+        Returns:
+            DataFrame con PALLET_KEYS y una columna por fecha
+        """
+        fila, fecha, valor = self._consolidar()
+
+        if filas is None:
+            sel_filas = np.arange(len(self.filas))
+        else:
+            sel_filas = np.asarray(filas)
+            if sel_filas.dtype == bool:
+                sel_filas = np.flatnonzero(sel_filas)
+        sel_fechas = self.fechas if fechas is None else sorted(fechas)
+
+        mapa_fila = np.full(len(self.filas), -1, dtype=np.int64)
+        mapa_fila[sel_filas] = np.arange(len(sel_filas))
+        posicion_fecha = {f: i for i, f in enumerate(self.fechas)}
+        mapa_fecha = np.full(len(self.fechas), -1, dtype=np.int64)
+        mapa_fecha[[posicion_fecha[f] for f in sel_fechas]] = np.arange(len(sel_fechas))
+
+        r = mapa_fila[fila]
+        c = mapa_fecha[fecha]
+        dentro = (r >= 0) & (c >= 0)
+        matriz = np.full((len(sel_filas), len(sel_fechas)), np.nan)
+        matriz[r[dentro], c[dentro]] = valor[dentro]
+
+        tabla = self.filas.iloc[sel_filas].reset_index(drop=True)
+        valores = pd.DataFrame(matriz, columns=pd.DatetimeIndex(sel_fechas, name="Fecha_Reporte"))
+        return pd.concat([tabla, valores], axis=1)
+
+    def to_long(self):
+        """Celdas con dato en formato largo (PALLET_KEYS, Fecha_Reporte, Cantidad_Negativa)"""
+        fila, fecha, valor = self._consolidar()
+        tabla = self.filas.iloc[fila].reset_index(drop=True)
+        tabla["Fecha_Reporte"] = pd.DatetimeIndex(self.fechas)[fecha] if len(self.fechas) else pd.NaT
+        tabla["Cantidad_Negativa"] = valor
+        return tabla.sort_values(PALLET_KEYS + ["Fecha_Reporte"], ignore_index=True)
+
+    def iter_wide(self, chunk_rows=50000):
+        """Vista ancha completa por bloques de filas (para exportar sin materializarla entera)"""
+        self._consolidar()
+        for inicio in range(0, max(len(self.filas), 1), chunk_rows):
+            yield self.wide(np.arange(inicio, min(inicio + chunk_rows, len(self.filas))))
+
+    def totals_by_date(self):
+        """Suma de cantidades por fecha (Series indexada por fecha)"""
+        _, fecha, valor = self._consolidar()
+        totales = np.bincount(fecha, weights=valor, minlength=len(self.fechas))
+        return pd.Series(totales, index=pd.DatetimeIndex(self.fechas))
+
+    def totals_by_row(self):
+        """Suma de cantidades por pallet (alineada con keys())"""
+        fila, _, valor = self._consolidar()
+        return pd.Series(np.bincount(fila, weights=valor, minlength=len(self.filas)))
+
+
+def super_dates(super_analisis):
+    """Columnas de fecha del súper análisis (formato ancho o SuperAnalysisStore)"""
+    if isinstance(super_analisis, SuperAnalysisStore):
+        return list(super_analisis.fechas)
+    return sorted(c for c in super_analisis.columns if isinstance(c, pd.Timestamp))
+
+
+def super_keys(super_analisis):
+    """Columnas de clave del súper análisis, sin copiar las columnas de fecha"""
+    if isinstance(super_analisis, SuperAnalysisStore):
+        return super_analisis.keys()
+    return super_analisis[PALLET_KEYS]
+
+
+def super_wide(super_analisis, filas=None, fechas=None):
+    """
+    Vista ancha de las filas (máscara sobre super_keys) y fechas pedidas
+
+    Con SuperAnalysisStore la tabla se construye solo para esa selección.
+    """
+    if isinstance(super_analisis, SuperAnalysisStore):
+        return super_analisis.wide(filas, fechas)
+    tabla = super_analisis if filas is None else super_analisis[np.asarray(filas)]
+    if fechas is not None:
+        tabla = tabla[PALLET_KEYS + sorted(fechas)]
+    return tabla
+
+
+def super_long(super_analisis):
+    """
+    Súper análisis en formato largo: solo celdas con dato
+
+    Returns:
+        DataFrame con PALLET_KEYS, Fecha_Reporte y Cantidad_Negativa
+    """
+    if isinstance(super_analisis, SuperAnalysisStore):
+        return super_analisis.to_long()
+    tabla = super_analisis.melt(
+        id_vars=PALLET_KEYS, value_vars=super_dates(super_analisis),
+        var_name="Fecha_Reporte", value_name="Cantidad_Negativa"
+    ).dropna(subset=["Cantidad_Negativa"])
+    tabla["Fecha_Reporte"] = pd.to_datetime(tabla["Fecha_Reporte"])
+    return tabla.sort_values(PALLET_KEYS + ["Fecha_Reporte"], ignore_index=True)
+
+
+def super_totals(super_analisis):
+    """
+    Totales del súper análisis para los gráficos
+
+    Returns:
+        tuple: (Series por fecha, Series por almacén)
+    """
+    fechas = super_dates(super_analisis)
+    if isinstance(super_analisis, SuperAnalysisStore):
+        por_fecha = super_analisis.totals_by_date()
+        por_fila = super_analisis.totals_by_row()
+    else:
+        por_fecha = super_analisis[fechas].sum(skipna=True)
+        por_fila = super_analisis[fechas].sum(axis=1, skipna=True)
+    por_almacen = por_fila.groupby(super_keys(super_analisis)["Almacen"].to_numpy()).sum()
+    return por_fecha, por_almacen
+
+
+class IncrementalAnalysis:
+    """
+    Estado acumulado del análisis de pallets para carga incremental por días
+
+    Guarda por pallet agregados parciales que se pueden combinar (primera y
+    última aparición, conteo, suma, mínimo y máximo, fechas y huecos)
+    junto con el súper análisis en formato largo. Agregar un día nuevo solo
+    procesa las filas de ese día; severidad y estado se reclasifican sobre los
+    agregados (un registro por pallet), no sobre todas las filas.
+    """
+
+    def __init__(self):
+        self.parciales = None
+        self.store = None
+        self.fechas = []
+        self.archivos = set()
+
+    @classmethod
+    def from_frame(cls, df_total):
+        """Construye el estado completo a partir de un df_total normalizado"""
+        state = cls()
+        state.parciales = _pallet_partials(df_total)
+
+        # Fechas únicas por pallet, ordenadas, para detectar huecos > 1 día
+        pares = _pallet_dates(df_total)
+        state.parciales = state.parciales.join(_gap_stats(pares))
+        state.parciales["Fechas"] = _join_fechas(pares)
+
+        state.store = SuperAnalysisStore.from_frame(df_total)
+        state.fechas = sorted(df_total["Fecha_Reporte"].unique())
+        state.archivos = set(df_total["Archivo_Origen"].unique()) if "Archivo_Origen" in df_total.columns else set()
+        return state
+
+    def can_append(self, df_nuevo):
+        """True si todas las fechas nuevas son posteriores a las ya cargadas"""
+        if self.parciales is None or not self.fechas:
+            return False
+        return bool((df_nuevo["Fecha_Reporte"] > self.fechas[-1]).all())
+
+    def append(self, df_nuevo):
+        """
+        Incorpora filas normalizadas de uno o más días nuevos
+
+        Las fechas deben ser posteriores a las ya cargadas (ver can_append);
+        cada día se combina con los agregados existentes en orden cronológico.
+        """
+        if not self.can_append(df_nuevo):
+            raise ValueError("Las fechas nuevas deben ser posteriores a las ya analizadas")
+
+        for fecha, df_dia in df_nuevo.groupby("Fecha_Reporte", sort=True):
+            self._append_day(fecha, df_dia)
+
+        if "Archivo_Origen" in df_nuevo.columns:
+            self.archivos.update(df_nuevo["Archivo_Origen"].unique())
+
+    def _append_day(self, fecha, df_dia):
+        """Combina los agregados de un único día con el estado acumulado"""
+        dia = _pallet_partials(df_dia)
+        idx = self.parciales.index.union(dia.index)
+        prev = self.parciales.reindex(idx)
+        dia = dia.reindex(idx)
+
+        nuevo = prev["Veces_Reportado"].isna()
+        en_dia = dia["Veces_Reportado"].notna()
+        fecha_str = fecha.strftime("%d-%m-%Y")
+
+        merged = pd.DataFrame(index=idx)
+        for col in PALLET_KEYS:
+            merged[col] = prev[col].where(~nuevo, dia[col])
+        merged["Primera_Aparicion"] = prev["Primera_Aparicion"].fillna(dia["Primera_Aparicion"])
+        merged["Ultima_Aparicion"] = dia["Ultima_Aparicion"].fillna(prev["Ultima_Aparicion"])
+        merged["Veces_Reportado"] = (
+            prev["Veces_Reportado"].fillna(0) + dia["Veces_Reportado"].fillna(0)
+        ).astype("int64")
+        merged["Cantidad_Suma"] = prev["Cantidad_Suma"].fillna(0) + dia["Cantidad_Suma"].fillna(0)
+        merged["Cantidad_Minima"] = np.fmin(prev["Cantidad_Minima"], dia["Cantidad_Minima"])
+        merged["Cantidad_Maxima"] = np.fmax(prev["Cantidad_Maxima"], dia["Cantidad_Maxima"])
+
+        # Reincidencia: el pallet vuelve a aparecer tras más de un día ausente
+        distancia = fecha - prev["Ultima_Aparicion"]
+        hueco = en_dia & ~nuevo & (distancia > pd.Timedelta(days=1))
+        merged["Huecos"] = (prev["Huecos"].fillna(0) + hueco).astype("int64")
+        merged["Hueco_Maximo_Dias"] = np.fmax(
+            prev["Hueco_Maximo_Dias"].fillna(0),
+            distancia.dt.days.where(hueco, 0)
+        ).astype("int64")
+        merged["Fechas"] = np.where(
+            en_dia,
+            np.where(nuevo, fecha_str, prev["Fechas"].fillna("") + ", " + fecha_str),
+            prev["Fechas"]
+        )
+        self.parciales = merged
+
+        # Nueva columna del súper análisis: solo las celdas del día
+        self.store.append_day(fecha, _day_column(df_dia))
+        self.fechas.append(fecha)
+
+    def analysis(self):
+        """Tabla de análisis por pallet (mismas columnas que analyze_pallets_data)"""
+        analisis = self.parciales.reset_index()
+        analisis["Cantidad_Promedio"] = analisis["Cantidad_Suma"] / analisis["Veces_Reportado"]
+        compacto = is_compact(analisis)
+        analisis = with_pallet_labels(analisis[ANALYSIS_COLUMNS])
+        if compacto:
+            # Mismo orden que con la clave de texto
+            analisis = analisis.sort_values("ID_Unico_Pallet", ignore_index=True)
+        return finalize_analysis(analisis.copy(), self.fechas[-1])
+
+    def super_analysis(self):
+        """Súper análisis en formato ancho (mismas columnas que create_super_analysis)"""
+        return self.store.wide()
+
+    def recurrences(self):
+        """Reincidencias: pallets con algún hueco de más de un día entre apariciones"""
+        reinc = self.parciales[self.parciales["Huecos"] > 0].reset_index()
+        if is_compact(reinc):
+            reinc["ID_Unico_Pallet"] = pallet_labels(reinc["Codigo"], reinc["ID_Pallet"])
+            reinc = reinc.sort_values("ID_Unico_Pallet")
+        return reinc[RECURRENCE_COLUMNS].reset_index(drop=True)
@@ -5,15 +5,32 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import io
 import base64
 from datetime import datetime, timedelta
 import warnings
 from pathlib import Path
 import zipfile
-import sqlite3
-import requests
-import tempfile
+from functools import partial
+
+from ingestion import (
+    read_report_file, default_ingest_workers, normalize_report_frame, expand_zip_files, has_report_date,
+    DEFAULT_READER_ENGINE,
+)
+from erp import read_erp_export, cached_preprocessed_report, preprocess_erp_batch, stamp_export_date
+from analysis import (
+    build_pallet_analysis, is_compact, with_pallet_labels, concat_frames,
+    super_dates, super_keys, super_wide, super_totals,
+)
+from pipeline import InventoryAnalyzer
+from reporting import (
+    BUNDLE_FORMATS, LARGE_REPORT_ROWS, cached_report_path, default_bundle_format, write_data_bundle,
+)
+from disk_cache import content_hash, dataset_fingerprint
+from historico_db import (
+    HISTORICO_DB_PATH, HISTORICO_DB_URL, REMOTE_CHECK_SECONDS, fetch_historico_db, historico_db_version,
+    historico_summary, load_erp_into_historico, query_historico
+)
+from report_jobs import ReportJob
 
 warnings.filterwarnings("ignore")
 
@@ -21,162 +38,25 @@ warnings.filterwarnings("ignore")
 pd.set_option('display.precision', 2)
 pd.set_option('mode.chained_assignment', None)
 
+# Top N: la hoja Excel admite miles de pallets; el gráfico de barras se limita
+MAX_TOP_N = 5000
+MAX_CHART_TOP_N = 50
+
 # Funciones auxiliares con caché
 @st.cache_data
-def process_excel_file(file_content, filename):
+def process_excel_file(file_content, filename, engine=DEFAULT_READER_ENGINE):
     """Procesa un archivo Excel individual"""
-    try:
-        # Detectar fecha en nombre archivo
-        parts = filename.split("_")
-        fecha_str = next((p for p in parts if p.isdigit() and len(p) == 8), None)
-        
-        if fecha_str:
-            fecha_reporte = datetime.strptime(fecha_str, "%Y%m%d")
-        else:
-            fecha_reporte = datetime.now()
-        
-        # Leer Excel
-        df = pd.read_excel(io.BytesIO(file_content), sheet_name=1)  # Segunda hoja por defecto
-        df["Fecha_Reporte"] = pd.to_datetime(fecha_reporte)
-        df["Archivo_Origen"] = filename
-        
-        return df, True, None
-        
-    except Exception as e:
-        return None, False, str(e)
+    return read_report_file(file_content, filename, engine=engine)
 
 @st.cache_data
-def normalize_dataframe(df):
-    """Normaliza nombres de columnas y limpia datos"""
-    # Normalización de columnas
-    df = df.rename(columns={
-        "Código": "Codigo",
-        "Código Producto": "Codigo",
-        "ID de Pallet": "ID_Pallet",
-        "Inventario Físico": "Cantidad_Negativa",
-        "Nombre": "Nombre",
-        "Descripción": "Nombre",
-        "Almacén": "Almacen",
-        "Almacen": "Almacen",
-        "Warehouse": "Almacen",
-        "Ubicación": "Almacen",
-        "Ubicacion": "Almacen",
-    })
-    
-    # Limpiar códigos y pallets
-    for col in ["Codigo", "ID_Pallet"]:
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", "", regex=False)
-                .str.split(".").str[0]
-                .str.strip()
-            )
-        else:
-            df[col] = "N/A"
-    
-    # Campos obligatorios
-    if "Nombre" not in df.columns:
-        df["Nombre"] = ""
-    if "Almacen" not in df.columns:
-        df["Almacen"] = "N/A"
-
-    # Convertir Almacen y Nombre a string para evitar problemas de tipos mixtos
-    df["Almacen"] = df["Almacen"].astype(str)
-    df["Nombre"] = df["Nombre"].astype(str)
-    
-    # Cantidad negativa
-    if "Cantidad_Negativa" not in df.columns:
-        for alt in ["Cantidad", "Qty", "Inventario", "Stock"]:
-            if alt in df.columns:
-                df["Cantidad_Negativa"] = df[alt]
-                break
-    
-    df["Cantidad_Negativa"] = pd.to_numeric(df["Cantidad_Negativa"], errors="coerce").fillna(0)
-    
-    # Solo negativos
-    df = df[df["Cantidad_Negativa"] < 0].copy()
-    
-    # ID único pallet
-    df["ID_Unico_Pallet"] = df["Codigo"].astype(str) + "_" + df["ID_Pallet"].astype(str)
-    
-    return df
+def normalize_dataframe(df, compact=False):
+    """Normaliza nombres de columnas y limpia datos (ver ingestion.normalize_report_frame)"""
+    return normalize_report_frame(df, compact)
 
 @st.cache_data
 def analyze_pallets_data(df_total):
     """Análisis principal de pallets con caché"""
-    analisis = df_total.groupby("ID_Unico_Pallet").agg({
-        "Codigo": "first",
-        "Nombre": "first", 
-        "ID_Pallet": "first",
-        "Almacen": "first",
-        "Fecha_Reporte": ["min", "max", "count"],
-        "Cantidad_Negativa": ["mean", "min", "max", "sum"]
-    }).reset_index()
-    
-    analisis.columns = [
-        "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
-        "Primera_Aparicion", "Ultima_Aparicion", "Veces_Reportado", 
-        "Cantidad_Promedio", "Cantidad_Minima", "Cantidad_Maxima", "Cantidad_Suma"
-    ]
-    
-    analisis["Dias_Acumulados"] = (analisis["Ultima_Aparicion"] - analisis["Primera_Aparicion"]).dt.days + 1
-    
-    # Severidad por magnitud del negativo - Versión robusta
-    magnitudes = np.abs(analisis["Cantidad_Promedio"])
-    
-    if len(magnitudes) == 0:
-        # Sin datos
-        analisis["Severidad"] = pd.Series(dtype="category")
-    elif magnitudes.nunique() == 1:
-        # Todos los valores son iguales
-        analisis["Severidad"] = "Medio"
-    elif len(magnitudes) < 4:
-        # Muy pocos datos: categorización simple
-        median_val = magnitudes.median()
-        analisis["Severidad"] = magnitudes.apply(
-            lambda x: "Crítico" if x > median_val else "Bajo"
-        )
-    else:
-        # Suficientes datos: categorización completa
-        try:
-            # Intentar con percentiles
-            q25, q50, q75 = np.percentile(magnitudes, [25, 50, 75])
-            
-            # Verificar si hay bins únicos suficientes
-            bins = [-1, q25, q50, q75, float("inf")]
-            unique_bins = sorted(set(bins))
-            
-            if len(unique_bins) < 3:
-                # No hay suficientes bins únicos, usar categorización simple
-                median_val = magnitudes.median()
-                analisis["Severidad"] = magnitudes.apply(
-                    lambda x: "Alto" if x > median_val * 1.5 else ("Medio" if x > median_val else "Bajo")
-                )
-            else:
-                # Usar pd.qcut que maneja automáticamente los duplicados
-                analisis["Severidad"] = pd.qcut(
-                    magnitudes,
-                    q=[0, 0.25, 0.5, 0.75, 1.0],
-                    labels=["Bajo", "Medio", "Alto", "Crítico"],
-                    duplicates='drop'
-                )
-        except Exception:
-            # Si todo falla, usar categorización simple por mediana
-            median_val = magnitudes.median()
-            analisis["Severidad"] = magnitudes.apply(
-                lambda x: "Alto" if x > median_val * 1.5 else ("Medio" if x > median_val else "Bajo")
-            )
-    
-    # Estado (activo/resuelto)
-    fecha_ultimo = df_total["Fecha_Reporte"].max()
-    analisis["Estado"] = np.where(analisis["Ultima_Aparicion"] == fecha_ultimo, "Activo", "Resuelto")
-    
-    # Score de criticidad
-    analisis["Score_Criticidad"] = analisis["Dias_Acumulados"] * np.abs(analisis["Cantidad_Promedio"])
-    
-    return analisis
+    return build_pallet_analysis(df_total)
 
 # Configuración de la página
 st.set_page_config(
@@ -365,101 +245,17 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Clase adaptada del análisis
-class InventoryAnalyzerWeb:
-    def __init__(self):
-        self.logger_messages = []
-    
+class InventoryAnalyzerWeb(InventoryAnalyzer):
+    """InventoryAnalyzer con caché de Streamlit y log en el placeholder de progreso"""
+
+    read_file = staticmethod(process_excel_file)
+    normalize_frame = staticmethod(normalize_dataframe)
+    pallet_analysis = staticmethod(analyze_pallets_data)
+
     def log(self, message):
-        self.logger_messages.append(f"{datetime.now().strftime('%H:%M:%S')} - {message}")
+        super().log(message)
         if 'progress_placeholder' in st.session_state:
             st.session_state.progress_placeholder.text('\n'.join(self.logger_messages[-5:]))
-    
-    def process_uploaded_files(self, uploaded_files):
-        """Procesa archivos subidos y normaliza datos"""
-        if not uploaded_files:
-            raise ValueError("No se subieron archivos")
-        
-        self.log(f"Procesando {len(uploaded_files)} archivos...")
-        
-        all_dfs = []
-        for uploaded_file in uploaded_files:
-            # Leer el contenido del archivo
-            file_content = uploaded_file.read()
-            filename = uploaded_file.name
-            
-            # Usar función cacheada
-            df, success, error = process_excel_file(file_content, filename)
-            
-            if success:
-                all_dfs.append(df)
-                self.log(f"✅ Procesado: {filename} ({len(df)} registros)")
-            else:
-                self.log(f"⚠️ Error en {filename}: {error}")
-                continue
-        
-        if not all_dfs:
-            raise ValueError("No se pudieron procesar archivos válidos")
-        
-        df_total = pd.concat(all_dfs, ignore_index=True)
-        return self.normalize_data(df_total)
-    
-    def normalize_data(self, df):
-        """Normaliza nombres de columnas y limpia datos"""
-        # Usar función cacheada
-        normalized_df = normalize_dataframe(df)
-        self.log(f"📊 Datos normalizados: {len(normalized_df)} registros negativos")
-        return normalized_df
-    
-    def analyze_pallets(self, df_total):
-        """Análisis principal de pallets"""
-        self.log("🔍 Analizando pallets...")
-        
-        # Usar función cacheada
-        analisis = analyze_pallets_data(df_total)
-        
-        self.log(f"✅ Análisis completado: {len(analisis)} pallets únicos")
-        return analisis
-    
-    def create_super_analysis(self, df_total):
-        """Crea tabla pivote con evolución temporal"""
-        self.log("📈 Creando súper análisis...")
-        
-        tabla = df_total.pivot_table(
-            index=["Codigo", "Nombre", "ID_Pallet", "Almacen"],
-            columns="Fecha_Reporte", 
-            values="Cantidad_Negativa",
-            aggfunc="first"
-        ).reset_index()
-        
-        # Ordenar columnas por fecha
-        fecha_cols = sorted([c for c in tabla.columns if isinstance(c, pd.Timestamp)])
-        otras = [c for c in tabla.columns if not isinstance(c, pd.Timestamp)]
-        tabla = tabla[otras + fecha_cols]
-        
-        self.log(f"📊 Súper análisis: {tabla.shape[0]} × {tabla.shape[1]}")
-        return tabla
-    
-    def detect_recurrences(self, df_total):
-        """Detecta reincidencias"""
-        self.log("🔄 Detectando reincidencias...")
-        
-        reincidencias = []
-        for pallet, data in df_total.groupby("ID_Unico_Pallet"):
-            fechas = sorted(pd.to_datetime(data["Fecha_Reporte"]).unique())
-            if len(fechas) < 2:
-                continue
-            gaps = np.diff(fechas)
-            if any(gap > np.timedelta64(1, "D") for gap in gaps):
-                reincidencias.append({
-                    "ID_Unico_Pallet": pallet,
-                    "Codigo": data["Codigo"].iloc[0],
-                    "Nombre": data["Nombre"].iloc[0],
-                    "Almacen": data["Almacen"].iloc[0],
-                    "Fechas": ", ".join(pd.Series(fechas).dt.strftime("%d-%m-%Y"))
-                })
-        
-        self.log(f"🔄 Reincidencias detectadas: {len(reincidencias)}")
-        return pd.DataFrame(reincidencias)
 
 # Función para crear gráficos
 @st.cache_data
@@ -504,11 +300,12 @@ def create_charts(analisis, super_analisis, top_n=10):
     fig1.update_layout(xaxis_tickangle=-45, height=400)
     
     # 2. Evolución Total por Fecha
-    date_cols = [c for c in super_analisis.columns if isinstance(c, pd.Timestamp)]
+    date_cols = super_dates(super_analisis)
+    totales_fecha, totales_almacen = super_totals(super_analisis)
     if date_cols:
         evolution_data = []
-        for fecha in sorted(date_cols):
-            total = super_analisis[fecha].sum(skipna=True)
+        for fecha in date_cols:
+            total = totales_fecha[fecha]
             evolution_data.append({"Fecha": fecha, "Total_Negativo": abs(total)})
         
         evolution_df = pd.DataFrame(evolution_data)
@@ -528,12 +325,10 @@ def create_charts(analisis, super_analisis, top_n=10):
     
     # 3. Distribución por Almacén
     almacen_totals = {}
-    for almacen in super_analisis["Almacen"].dropna().unique():
+    for almacen, total_almacen in totales_almacen.items():
         # Filtrar valores NaN, "nan", "N/A" y vacíos
         if pd.isna(almacen) or str(almacen).lower() in ['nan', 'n/a', 'none', '']:
             continue
-        subset = super_analisis[super_analisis["Almacen"] == almacen]
-        total_almacen = subset[date_cols].sum().sum(skipna=True) if date_cols else 0
         if total_almacen != 0:
             almacen_totals[almacen] = abs(total_almacen)
     
@@ -574,454 +369,172 @@ def create_charts(analisis, super_analisis, top_n=10):
     
     return fig1, fig2, fig3, fig4
 
-# Función para generar reporte Excel
-@st.cache_data
-def generate_excel_report(analisis, super_analisis, reincidencias, df_total, top_n=10):
-    """Genera reporte Excel descargable con hoja Top N"""
-    buffer = io.BytesIO()
-    
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        # Escribir hojas principales
-        activos = analisis[analisis["Estado"] == "Activo"].copy()
-        resueltos = analisis[analisis["Estado"] == "Resuelto"].copy()
-        
-        activos.to_excel(writer, sheet_name="Problemas Activos", index=False)
-        resueltos.to_excel(writer, sheet_name="Resueltos", index=False) 
-        reincidencias.to_excel(writer, sheet_name="Reincidencias", index=False)
-        super_analisis.to_excel(writer, sheet_name="Super Análisis", index=False)
-        df_total.to_excel(writer, sheet_name="Datos Crudos", index=False)
-        
-        # NUEVA HOJA: Top N
-        create_top_n_sheet(writer, super_analisis, analisis, top_n)
-        
-        # Formato básico para todas las hojas
-        workbook = writer.book
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#1F4E78',
-            'font_color': 'white',
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-        
-        # Aplicar formato a todas las hojas
-        for sheet_name in writer.sheets:
-            worksheet = writer.sheets[sheet_name]
-            worksheet.set_row(0, 22, header_format)
-    
-    buffer.seek(0)
-    return buffer
-
-def create_top_n_sheet(writer, super_analisis, analisis, top_n):
-    """Crea hoja dedicada Top N con evolución temporal"""
-    workbook = writer.book
-    worksheet = workbook.add_worksheet("Top N")
-    worksheet.set_zoom(120)
-    
-    # Obtener Top N por criticidad
-    top_data = analisis.sort_values("Score_Criticidad", ascending=False).head(top_n).copy()
-    
-    # Preparar columnas base
-    cols_base = [
-        "Rank", "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
-        "Score_Criticidad", "Dias_Acumulados", "Cantidad_Promedio", "Severidad",
-        "Primera_Aparicion", "Ultima_Aparicion", "Estado"
-    ]
-    
-    # Formato de encabezados
-    header_format = workbook.add_format({
-        'bold': True, 
-        'font_size': 11, 
-        'bg_color': '#27466B', 
-        'font_color': 'white',
-        'align': 'center', 
-        'valign': 'vcenter', 
-        'border': 1
-    })
-    
-    # Escribir encabezados base
-    for j, col in enumerate(cols_base):
-        worksheet.write(0, j, col, header_format)
-    
-    # Obtener columnas de fechas del super análisis
-    date_cols = [c for c in super_analisis.columns if isinstance(c, pd.Timestamp)]
-    
-    # Escribir encabezados de fechas
-    for j, fecha in enumerate(sorted(date_cols), start=len(cols_base)):
-        worksheet.write(0, j, fecha.strftime("%Y-%m-%d"), header_format)
-    
-    # Preparar mapeo para obtener datos de evolución temporal
-    super_copy = super_analisis.copy()
-    super_copy["_ID_UNICO_"] = super_copy["Codigo"].astype(str) + "_" + super_copy["ID_Pallet"].astype(str)
-    
-    # Formatos para datos
-    number_format = workbook.add_format({'num_format': '#,##0.00'})
-    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
-    
-    # Escribir datos del Top N
-    for i, (_, row) in enumerate(top_data.iterrows(), start=1):
-        # Datos base
-        worksheet.write_number(i, 0, i)  # Rank
-        worksheet.write(i, 1, row["ID_Unico_Pallet"])
-        worksheet.write(i, 2, str(row["Codigo"]))
-        worksheet.write(i, 3, str(row["Nombre"]) if pd.notna(row["Nombre"]) else "")
-        worksheet.write(i, 4, str(row["ID_Pallet"]))
-        worksheet.write(i, 5, str(row["Almacen"]))
-        worksheet.write_number(i, 6, float(row["Score_Criticidad"]), number_format)
-        worksheet.write_number(i, 7, int(row["Dias_Acumulados"]))
-        worksheet.write_number(i, 8, float(row["Cantidad_Promedio"]), number_format)
-        worksheet.write(i, 9, str(row["Severidad"]) if pd.notna(row["Severidad"]) else "")
-        worksheet.write_datetime(i, 10, pd.to_datetime(row["Primera_Aparicion"]), date_format)
-        worksheet.write_datetime(i, 11, pd.to_datetime(row["Ultima_Aparicion"]), date_format)
-        worksheet.write(i, 12, str(row["Estado"]))
-        
-        # Datos de evolución temporal
-        fila_super = super_copy[super_copy["_ID_UNICO_"] == row["ID_Unico_Pallet"]]
-        if not fila_super.empty:
-            row_super = fila_super.iloc[0]
-            for j, fecha in enumerate(sorted(date_cols), start=len(cols_base)):
-                val = row_super.get(fecha, np.nan)
-                if pd.notna(val) and val != "":
-                    try:
-                        val_num = pd.to_numeric(val, errors='coerce')
-                        if pd.notna(val_num):
-                            worksheet.write_number(i, j, float(val_num), number_format)
-                        else:
-                            worksheet.write_blank(i, j, None)
-                    except:
-                        worksheet.write_blank(i, j, None)
-                else:
-                    worksheet.write_blank(i, j, None)
-    
-    # Ajustar anchos de columnas
-    worksheet.set_column(0, 0, 6)   # Rank
-    worksheet.set_column(1, 1, 24)  # ID_Unico_Pallet
-    worksheet.set_column(2, 3, 12)  # Codigo, Nombre
-    worksheet.set_column(4, 5, 12)  # ID_Pallet, Almacen
-    worksheet.set_column(6, 8, 14)  # Scores y promedios
-    worksheet.set_column(9, 9, 10)  # Severidad
-    worksheet.set_column(10, 12, 12) # Fechas y estado
-    
-    # Columnas de evolución temporal
-    if date_cols:
-        worksheet.set_column(len(cols_base), len(cols_base) + len(date_cols) - 1, 10)
+# Reporte Excel: se genera a pedido en segundo plano
+def discard_report_job():
+    """Descarta el reporte Excel en curso o terminado (p. ej. tras un nuevo análisis)"""
+    job = st.session_state.pop('reporte_excel_job', None)
+    if job is not None:
+        job.discard()
+
+def report_job_status(job):
+    """Progreso por hoja y descarga del reporte; el fragmento se refresca solo mientras se genera"""
+    sondeando = job.running
+
+    @st.fragment(run_every=1.0 if sondeando else None)
+    def estado_reporte():
+        if job.running:
+            st.progress(
+                job.fraction(),
+                text=f"⏳ Generando reporte Excel: {job.descripcion} ({job.paso + 1}/{job.total_pasos})"
+            )
+        elif sondeando:
+            # Terminó: una ejecución completa detiene el refresco y muestra la descarga
+            st.rerun()
+        elif job.failed:
+            st.error(f"❌ Error al generar el reporte: {job.error}")
+            if st.button("🔄 Reintentar"):
+                discard_report_job()
+                st.rerun()
+        else:
+            st.download_button(
+                label="📥 Descargar Reporte Excel",
+                data=job.read_bytes,
+                file_name=f"Reporte_Inventarios_Negativos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+            if job.desde_cache:
+                st.caption("✅ Reporte servido desde la caché en disco")
+            else:
+                st.caption(f"✅ Reporte generado en {job.segundos:.1f}s")
 
-# ========== NUEVAS FUNCIONES PARA PREPROCESAMIENTO DE ERP ==========
+    estado_reporte()
 
-@st.cache_data
-def preprocess_erp_raw_data(file_content, filename, sheet_index=0):
-    """
-    Procesa archivo crudo del ERP y lo convierte al formato esperado
-
-    Mapeo de columnas ERP -> App:
-    - Código de artículo -> Código
-    - Nombre del producto -> Nombre
-    - Almacén -> Almacén
-    - Id de pallet -> ID de Pallet
-    - Inventario físico -> Inventario Físico
-    - Física disponible -> Disponible
-
-    Filtros aplicados:
-    - Solo filas con inventario negativo
-    - Solo filas con ID de pallet válido (no vacío)
+def excel_report_panel(analisis, super_analisis, reincidencias, df_total, top_n=10, en_disco=False, rendimiento=None,
+                       huella=None, opciones=()):
     """
-    try:
-        # Leer Excel desde el archivo crudo
-        df = pd.read_excel(io.BytesIO(file_content), sheet_name=sheet_index)
-
-        # Guardar df original para stats
-        df_original = df.copy()
-
-        # Normalizar nombres de columnas del ERP
-        column_mapping = {
-            "Código de artículo": "Codigo",
-            "Código": "Codigo",
-            "Codigo de artículo": "Codigo",
-            "Nombre del producto": "Nombre",
-            "Nombre": "Nombre",
-            "Almacén": "Almacen",
-            "Almacen": "Almacen",
-            "Id de pallet": "ID_Pallet",
-            "ID de Pallet": "ID_Pallet",
-            "Id Pallet": "ID_Pallet",
-            "Inventario físico": "Inventario_Fisico",
-            "Inventario Físico": "Inventario_Fisico",
-            "Inventario fisico": "Inventario_Fisico",
-            "Física disponible": "Disponible",
-            "Fisica disponible": "Disponible",
-            "Disponible": "Disponible"
-        }
+    Botón para generar el reporte Excel en segundo plano (ver report_jobs.ReportJob)
 
-        # Renombrar columnas
-        df = df.rename(columns=column_mapping)
-
-        # Verificar que tenemos las columnas esenciales
-        required_cols = ["Codigo", "Nombre", "Almacen", "ID_Pallet", "Inventario_Fisico"]
-        missing_cols = [col for col in required_cols if col not in df.columns]
-
-        if missing_cols:
-            return None, False, f"Faltan columnas requeridas: {', '.join(missing_cols)}", None
-
-        # Filtrar solo negativos en Inventario Físico
-        df["Inventario_Fisico"] = pd.to_numeric(df["Inventario_Fisico"], errors='coerce')
-        df_negativos = df[df["Inventario_Fisico"] < 0].copy()
-
-        # Filtrar solo filas con ID de pallet válido
-        df_negativos = df_negativos[df_negativos["ID_Pallet"].notna()]
-        df_negativos = df_negativos[df_negativos["ID_Pallet"].astype(str).str.strip() != ""]
-
-        # Limpiar formato de números (quitar comas y puntos decimales innecesarios)
-        for col in ["Codigo", "ID_Pallet"]:
-            if col in df_negativos.columns:
-                df_negativos[col] = (
-                    df_negativos[col]
-                    .astype(str)
-                    .str.replace(",", "", regex=False)
-                    .str.split(".").str[0]
-                    .str.strip()
-                )
+    El reporte se genera una vez por análisis, Top N y modo; mientras tanto el
+    dashboard sigue respondiendo y solo el panel de progreso se actualiza. Con la
+    huella de los archivos subidos, un reporte que ya está en la caché en disco
+    se ofrece directamente para descargar. `opciones` son las demás opciones que
+    cambian el contenido del reporte en caché (p. ej. el motor de lectura).
+    """
+    clave = (top_n, en_disco)
+    job = st.session_state.get('reporte_excel_job')
+    if job is not None and job.clave != clave:
+        # El reporte ya no corresponde a la configuración actual
+        discard_report_job()
+        job = None
+
+    if job is None:
+        if huella is not None and cached_report_path(huella, top_n, opciones) is not None:
+            # Ya generado (en esta u otra sesión): solo se lee de la caché
+            rendimiento = None
+        elif not st.button(
+            "📊 Generar Reporte Excel",
+            help="Genera el reporte en segundo plano; puedes seguir usando el dashboard mientras tanto"
+        ):
+            return
+        job = ReportJob(clave, to_disk=en_disco, fingerprint=huella, opciones=opciones).start(
+            analisis, super_analisis, reincidencias, df_total, top_n, metrics=rendimiento
+        )
+        st.session_state.reporte_excel_job = job
 
-        # Convertir Almacen y Nombre a string para evitar problemas de tipos mixtos
-        df_negativos["Almacen"] = df_negativos["Almacen"].astype(str)
-        df_negativos["Nombre"] = df_negativos["Nombre"].astype(str)
-
-        # Convertir Codigo y ID_Pallet a enteros (como en archivos antiguos)
-        df_negativos["Codigo"] = pd.to_numeric(df_negativos["Codigo"], errors='coerce').fillna(0).astype(int)
-        df_negativos["ID_Pallet"] = pd.to_numeric(df_negativos["ID_Pallet"], errors='coerce').fillna(0).astype(int)
-
-        # Si hay columna Disponible, agregarla
-        if "Disponible" not in df_negativos.columns:
-            df_negativos["Disponible"] = df_negativos["Inventario_Fisico"]
-
-        # Renombrar columnas al formato final esperado (igual a archivos antiguos)
-        df_final = df_negativos.rename(columns={
-            "Codigo": "Código",
-            "ID_Pallet": "ID de Pallet",
-            "Inventario_Fisico": "Inventario Físico",
-            "Almacen": "Almacén"
-        })
-
-        # Seleccionar solo columnas necesarias con nombres exactos de archivos antiguos
-        final_columns = ["Código", "Nombre", "Almacén", "ID de Pallet", "Inventario Físico", "Disponible"]
-        df_final = df_final[[col for col in final_columns if col in df_final.columns]]
-
-        # Estadísticas
-        stats = {
-            "total_productos": len(df_original),
-            "productos_negativos": len(df_negativos),
-            "total_inventario_fisico": df_original["Inventario_Fisico"].sum() if "Inventario_Fisico" in df_original.columns else 0,
-            "pallets_unicos": df_negativos["ID_Pallet"].nunique() if len(df_negativos) > 0 else 0,
-            "fecha_exportacion": datetime.now(),
-            "filas_filtradas": len(df_final)
-        }
+    report_job_status(job)
 
-        return df_final, True, None, stats
+# ========== NUEVAS FUNCIONES PARA PREPROCESAMIENTO DE ERP ==========
 
-    except Exception as e:
-        return None, False, str(e), None
+@st.cache_data
+def preprocess_erp_raw_data(file_content, filename, sheet_index=0, engine=DEFAULT_READER_ENGINE):
+    """Procesa archivo crudo del ERP (ver erp.read_erp_export)"""
+    return read_erp_export(file_content, filename, sheet_index, engine)
 
 @st.cache_data
-def export_preprocessed_report(df_procesado, stats, fecha_suffix=None):
-    """
-    Exporta archivo Excel con formato compatible con el resto de la app
+def preprocess_erp_batch_cached(files, sheet_index=0, engine=DEFAULT_READER_ENGINE, fecha_default=None, max_workers=None):
+    """Preprocesa un lote de archivos crudos y devuelve (zip_buffer, df_stats) (ver erp.preprocess_erp_batch)"""
+    return preprocess_erp_batch(files, sheet_index, engine, fecha_default, max_workers)
 
-    Estructura:
-    - Hoja 1: Estadísticas Generales
-    - Hoja 2: Datos procesados (negativos con ID pallet)
+# ========== NUEVAS FUNCIONES PARA HISTÓRICO DB ==========
 
-    Nombre: reporte_all_YYYYMMDD_HHMMSS.xlsx
+def download_and_connect_db(progress=None):
     """
-    buffer = io.BytesIO()
-
-    # Generar nombre de archivo
-    if fecha_suffix is None:
-        fecha_suffix = datetime.now().strftime("%Y%m%d_%H%M%S")
+    Copia local de la DB de GitHub (repositorio privado) usando GitHub API
 
-    filename = f"reporte_all_{fecha_suffix}.xlsx"
-
-    try:
-        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-            workbook = writer.book
-
-            # === HOJA 1: Estadísticas Generales ===
-            worksheet_stats = workbook.add_worksheet("Estadísticas")
-
-            # Formatos
-            title_format = workbook.add_format({
-                'bold': True,
-                'font_size': 14,
-                'bg_color': '#1F4E78',
-                'font_color': 'white',
-                'align': 'left',
-                'valign': 'vcenter'
-            })
-
-            label_format = workbook.add_format({
-                'bold': True,
-                'align': 'left'
-            })
-
-            value_format = workbook.add_format({
-                'align': 'left',
-                'num_format': '#,##0.00'
-            })
-
-            # Escribir título
-            worksheet_stats.merge_range('A1:B1', 'Estadísticas Generales', title_format)
-
-            # Escribir estadísticas
-            row = 2
-            worksheet_stats.write(row, 0, 'Total de Productos', label_format)
-            worksheet_stats.write(row, 1, stats['total_productos'], value_format)
-
-            row += 1
-            worksheet_stats.write(row, 0, 'Productos con Inventario Negativo', label_format)
-            worksheet_stats.write(row, 1, stats['productos_negativos'], value_format)
-
-            row += 1
-            worksheet_stats.write(row, 0, 'Total de Inventario Físico', label_format)
-            worksheet_stats.write(row, 1, stats['total_inventario_fisico'], value_format)
-
-            row += 1
-            worksheet_stats.write(row, 0, 'Pallets Únicos', label_format)
-            worksheet_stats.write(row, 1, stats['pallets_unicos'], value_format)
-
-            row += 2
-            fecha_formato = stats['fecha_exportacion'].strftime("%d de %B de %Y, %H:%M")
-            worksheet_stats.write(row, 0, 'Fecha de Exportación', label_format)
-            worksheet_stats.write(row, 1, fecha_formato)
-
-            row += 1
-            worksheet_stats.write(row, 0, 'Última Actualización', label_format)
-            worksheet_stats.write(row, 1, fecha_formato)
-
-            # Ajustar columnas
-            worksheet_stats.set_column('A:A', 35)
-            worksheet_stats.set_column('B:B', 25)
-
-            # === HOJA 2: Datos procesados (nombre igual a archivos antiguos) ===
-            df_procesado.to_excel(writer, sheet_name="Inventario Completo (Actual)", index=False)
-
-            # Formatear hoja de datos
-            worksheet_data = writer.sheets["Inventario Completo (Actual)"]
-
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#1F4E78',
-                'font_color': 'white',
-                'align': 'center',
-                'valign': 'vcenter',
-                'border': 1
-            })
-
-            # Aplicar formato a encabezados
-            for col_num, value in enumerate(df_procesado.columns.values):
-                worksheet_data.write(0, col_num, value, header_format)
-
-            # Ajustar anchos
-            worksheet_data.set_column('A:A', 12)  # Codigo
-            worksheet_data.set_column('B:B', 35)  # Nombre
-            worksheet_data.set_column('C:C', 10)  # Almacen
-            worksheet_data.set_column('D:D', 18)  # ID_Pallet
-            worksheet_data.set_column('E:F', 15)  # Inventario y Disponible
-
-        buffer.seek(0)
-        return buffer, filename, True, None
-
-    except Exception as e:
-        return None, None, False, str(e)
+    Requiere GITHUB_TOKEN en Streamlit secrets para acceder a repositorio privado.
+    La copia persiste entre reinicios y solo se vuelve a descargar si el archivo
+    cambió en GitHub, como mucho una comprobación cada 15 minutos (ver
+    historico_db.fetch_historico_db). Sin st.cache_data: la comprobación ya se
+    limita en disco y así la barra de progreso se actualiza durante la descarga.
 
-# ========== NUEVAS FUNCIONES PARA HISTÓRICO DB ==========
+    Args:
+        progress: callable(bytes_recibidos, bytes_totales, descripcion)
 
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def download_and_connect_db():
-    """
-    Descarga DB desde GitHub (repositorio privado) usando GitHub API
-    
-    Requiere GITHUB_TOKEN en Streamlit secrets para acceder a repositorio privado.
-    
     Returns:
-        tuple: (db_path, success, error_message)
+        tuple: (db_path, success, error_message); con success y error_message
+            se está usando la copia local porque GitHub no respondió
     """
-    # Usar GitHub API en lugar de raw.githubusercontent.com para repos privados
-    api_url = "https://api.github.com/repos/Sinsapiar1/alsina-negativos-db/contents/negativos_inventario.db"
-    
     try:
         # Verificar que existe el token
         if not (hasattr(st, 'secrets') and 'GITHUB_TOKEN' in st.secrets):
             return None, False, "Token de GitHub no configurado. Ve a Settings → Secrets en Streamlit Cloud y agrega GITHUB_TOKEN"
-        
-        # Preparar headers con autenticación
-        headers = {
-            'Authorization': f"token {st.secrets['GITHUB_TOKEN']}",
-            'Accept': 'application/vnd.github.v3.raw'  # Obtener contenido raw directamente
-        }
-        
-        # Descargar archivo usando GitHub API
-        response = requests.get(api_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        # Guardar en archivo temporal
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        temp_file.write(response.content)
-        temp_file.close()
-        
-        # Verificar que se puede conectar
-        conn = sqlite3.connect(temp_file.name)
-        cursor = conn.cursor()
-        # Verificar que existe la tabla inventario
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='inventario'")
-        if not cursor.fetchone():
-            conn.close()
-            return None, False, "La tabla 'inventario' no existe en la base de datos"
-        conn.close()
-        
-        return temp_file.name, True, None
-        
-    except requests.HTTPError as e:
-        if e.response.status_code == 404:
-            return None, False, f"Archivo no encontrado (404). Verifica que el archivo 'negativos_inventario.db' existe en el repositorio"
-        elif e.response.status_code == 401:
-            return None, False, f"Token inválido o sin permisos (401). Verifica que el token tenga scope 'repo'"
-        else:
-            return None, False, f"Error HTTP {e.response.status_code}: {str(e)}"
-    except requests.RequestException as e:
-        return None, False, f"Error de red: {str(e)}"
-    except sqlite3.Error as e:
-        return None, False, f"Error de base de datos: {str(e)}"
+
+        db_path, success, error, _info = fetch_historico_db(
+            HISTORICO_DB_URL, st.secrets['GITHUB_TOKEN'], max_age=REMOTE_CHECK_SECONDS, progress=progress
+        )
+        return db_path, success, error
+
     except Exception as e:
         return None, False, f"Error inesperado: {str(e)}"
 
+
+def download_progress_bar(barra):
+    """Callback de progreso de la descarga para una barra st.progress"""
+    def progress(recibidos, total, descripcion):
+        mb = recibidos / 1024 / 1024
+        if total:
+            barra.progress(min(recibidos / total, 1.0), text=f"📡 {descripcion}: {mb:.1f} de {total / 1024 / 1024:.1f} MB")
+        else:
+            barra.progress(0.0, text=f"📡 {descripcion}: {mb:.1f} MB")
+    return progress
+
 @st.cache_data(ttl=3600)
-def load_historico_data(db_path):
+def load_historico_summary(db_path, db_version=None):
     """
-    Carga datos desde la base de datos SQLite y retorna DataFrame
-    
+    Resumen del histórico (registros, fechas, zonas y almacenes) para la
+    cabecera y las opciones de los filtros; ver historico_db.historico_summary
+
     Args:
         db_path: Path del archivo de base de datos
-        
+        db_version: historico_db_version(db_path); solo forma parte de la clave
+            de caché para releer la base tras una carga local
+
+    Returns:
+        tuple: (resumen, success, error_message)
+    """
+    return historico_summary(db_path)
+
+@st.cache_data(ttl=3600, max_entries=32)
+def load_historico_data(db_path, db_version=None, **filtros):
+    """
+    Carga desde la base de datos SQLite solo las filas que cumplen los filtros
+
+    Los filtros se resuelven en SQL (historico_db.query_historico) y el
+    resultado se cachea por combinación de filtros: volver a una selección ya
+    vista no consulta la base. Los códigos llegan como categorías (agrupar con
+    observed=True), Stock como int32 y fecha ya como datetime.
+
+    Args:
+        db_path: Path del archivo de base de datos
+        db_version: historico_db_version(db_path); solo forma parte de la clave
+            de caché para releer la base tras una carga local
+        **filtros: ver historico_db.build_historico_where (valores hashables:
+            tuplas ordenadas para que la misma selección use la misma entrada)
+
     Returns:
         tuple: (df_historico, success, error_message)
     """
-    try:
-        conn = sqlite3.connect(db_path)
-        query = "SELECT * FROM inventario ORDER BY fecha DESC"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        
-        # Convertir fecha a datetime
-        df['fecha'] = pd.to_datetime(df['fecha'])
-        
-        # Convertir tipos de datos
-        df['Stock'] = pd.to_numeric(df['Stock'], errors='coerce').fillna(0)
-        # NO rellenar CostStock con 0, mantener NaN para detectar problemas
-        df['CostStock'] = pd.to_numeric(df['CostStock'], errors='coerce')
-        
-        return df, True, None
-        
-    except Exception as e:
-        return None, False, f"Error al cargar datos: {str(e)}"
+    return query_historico(db_path, **filtros)
 
 # INTERFAZ PRINCIPAL
 def main():
@@ -1051,23 +564,25 @@ def main():
         **Este módulo transforma los datos crudos del ERP** en el formato requerido para el análisis.
 
         **Proceso:**
-        1. Sube el archivo Excel crudo del ERP
+        1. Sube el archivo Excel crudo del ERP (o varios archivos / un .zip para procesar un lote)
         2. El sistema filtra automáticamente:
            - ✅ Solo inventarios negativos
            - ✅ Solo registros con ID de pallet válido
-        3. Genera un archivo descargable listo para análisis
+        3. Genera un archivo descargable listo para análisis (en lote, un .zip con un reporte por archivo)
         """)
 
-        # Upload del archivo ERP
-        erp_file = st.file_uploader(
-            "📁 Subir archivo crudo del ERP",
-            type=['xlsx', 'xls'],
-            help="Archivo Excel directo del ERP con todas las columnas originales",
+        # Upload de archivos ERP (uno, varios o un .zip)
+        erp_files = st.file_uploader(
+            "📁 Subir archivo(s) crudo(s) del ERP",
+            type=['xlsx', 'xls', 'zip'],
+            accept_multiple_files=True,
+            help="Archivos Excel directos del ERP con todas las columnas originales. Varios archivos o un .zip se procesan como lote",
             key="erp_uploader"
         )
+        erp_inputs = expand_zip_files([(f.getvalue(), f.name) for f in erp_files]) if erp_files else []
 
         # Configuración
-        col1, col2 = st.columns(2)
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
             sheet_idx_erp = st.number_input(
                 "📋 Índice de hoja a procesar",
@@ -1081,19 +596,38 @@ def main():
             fecha_manual = st.date_input(
                 "📅 Fecha del reporte",
                 value=datetime.now(),
-                help="Se usará para el nombre del archivo exportado"
+                help="Se usará para el nombre del archivo exportado. En lote, solo para archivos sin fecha en el nombre"
+            )
+
+        with col3:
+            erp_engine = st.selectbox(
+                "🧮 Motor de lectura",
+                options=["fast", "pandas"],
+                format_func=lambda e: "Rápido (solo columnas necesarias)" if e == "fast" else "Completo (todas las columnas)",
+                key="erp_engine",
+                help="Rápido: lee solo las columnas mapeadas y descarta filas no negativas durante la lectura"
+            )
+
+        with col4:
+            erp_workers = st.number_input(
+                "⚡ Procesos en paralelo (lote)",
+                min_value=1,
+                max_value=32,
+                value=default_ingest_workers(),
+                help="Número de archivos crudos que se procesan a la vez al subir un lote"
             )
 
-        if erp_file:
+        if len(erp_inputs) == 1:
             st.markdown("---")
             st.subheader("📊 Vista Previa y Procesamiento")
 
             # Procesar archivo
-            file_content = erp_file.read()
+            file_content, erp_filename = erp_inputs[0]
             df_procesado, success, error, stats = preprocess_erp_raw_data(
                 file_content,
-                erp_file.name,
-                sheet_idx_erp
+                erp_filename,
+                sheet_idx_erp,
+                erp_engine
             )
 
             if success and df_procesado is not None:
@@ -1119,6 +653,7 @@ def main():
 
                 with tab_stats:
                     st.markdown("### Resumen del Filtrado")
+                    st.write(f"- **Hoja leída**: {stats['hoja']}")
                     st.write(f"- **Filas originales**: {stats['total_productos']:,}")
                     st.write(f"- **Filas con inventario negativo**: {stats['productos_negativos']:,}")
                     st.write(f"- **Filas con ID pallet válido**: {stats['filas_filtradas']:,}")
@@ -1136,18 +671,22 @@ def main():
 
                 fecha_str = fecha_manual.strftime("%Y%m%d")
                 hora_str = datetime.now().strftime("%H%M%S")
-                fecha_suffix = f"{fecha_str}_{hora_str}"
+                filename = f"reporte_all_{fecha_str}_{hora_str}.xlsx"
 
-                buffer, filename, export_success, export_error = export_preprocessed_report(
+                # Caché en disco por huella del archivo crudo (ver erp.cached_preprocessed_report)
+                ruta_reporte, export_success, export_error = cached_preprocessed_report(
                     df_procesado,
                     stats,
-                    fecha_suffix
+                    dataset_fingerprint([(file_content, erp_filename)]),
+                    sheet_idx_erp,
+                    erp_engine
                 )
 
                 if export_success:
                     st.download_button(
                         label="📥 Descargar Reporte Procesado",
-                        data=buffer,
+                        # La fecha de exportación se escribe al descargar (el archivo en caché no la tiene)
+                        data=lambda: stamp_export_date(ruta_reporte, datetime.now()),
                         file_name=filename,
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                         width='stretch'
@@ -1164,6 +703,31 @@ def main():
                 else:
                     st.error(f"❌ Error al generar archivo: {export_error}")
 
+                # Carga directa en la base histórica local (sin pasar por el Excel)
+                st.markdown("---")
+                st.subheader("🗄️ Guardar en Histórico Local")
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    zona_erp = st.text_input(
+                        "Zona (CompanyId)",
+                        help="El export del ERP no incluye la zona; se guarda en la columna CompanyId"
+                    )
+                with col2:
+                    st.write("")
+                    guardar_historico = st.button("💾 Guardar en histórico", width='stretch', disabled=not zona_erp)
+
+                if guardar_historico:
+                    with st.spinner("Guardando en la base histórica..."):
+                        resumen, ok, error_db = load_erp_into_historico(df_procesado, fecha_manual, zona_erp)
+                    if ok:
+                        st.success(
+                            f"✅ {resumen['filas']:,} filas del {fecha_manual:%Y-%m-%d} guardadas en {resumen['segundos']:.2f}s "
+                            f"({resumen['nuevas']:,} nuevas, {resumen['actualizadas']:,} actualizadas). "
+                            "Disponibles en el modo 🗄️ Histórico DB con la fuente 💻 Base local."
+                        )
+                    else:
+                        st.error(f"❌ Error al guardar en el histórico: {error_db}")
+
             else:
                 st.error(f"❌ Error al procesar archivo: {error}")
                 st.info("""
@@ -1180,6 +744,66 @@ def main():
                 - Inventario físico
                 """)
 
+        elif len(erp_inputs) > 1:
+            st.markdown("---")
+            st.subheader("📦 Procesamiento por Lote")
+
+            with st.spinner(f"Procesando {len(erp_inputs)} archivos con {min(erp_workers, len(erp_inputs))} procesos..."):
+                zip_buffer, df_lote = preprocess_erp_batch_cached(
+                    erp_inputs,
+                    sheet_idx_erp,
+                    erp_engine,
+                    fecha_manual,
+                    erp_workers
+                )
+
+            procesados = df_lote["estado"] == "ok"
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Archivos Procesados", f"{procesados.sum()} / {len(df_lote)}")
+            with col2:
+                st.metric("Total Productos (Original)", f"{int(df_lote['total_productos'].sum()):,}")
+            with col3:
+                st.metric("Filas Procesadas", f"{int(df_lote['filas_filtradas'].sum()):,}")
+            with col4:
+                st.metric("Tiempo de Proceso", f"{df_lote['segundos'].sum():.1f}s")
+
+            if not procesados.all():
+                st.warning(f"⚠️ {(~procesados).sum()} archivo(s) con error. Revisa la columna 'error' de la tabla.")
+
+            st.markdown("### 📊 Estadísticas por Archivo")
+            st.dataframe(df_lote, width='stretch', hide_index=True)
+
+            st.markdown("---")
+            st.subheader("💾 Descargar Lote Procesado")
+            marca = datetime.now().strftime("%Y%m%d_%H%M")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    label=f"📦 Descargar {procesados.sum()} Reportes (.zip)",
+                    data=zip_buffer,
+                    file_name=f"reportes_preprocesados_{marca}.zip",
+                    mime="application/zip",
+                    disabled=not procesados.any(),
+                    width='stretch'
+                )
+            with col2:
+                st.download_button(
+                    label="📄 Descargar Estadísticas (.csv)",
+                    data=df_lote.to_csv(index=False).encode("utf-8"),
+                    file_name=f"estadisticas_preprocesado_{marca}.csv",
+                    mime="text/csv",
+                    width='stretch'
+                )
+
+            st.info("""
+            **Siguiente paso**: descomprime el .zip y sube los reportes en el modo "📊 Analizar Inventarios"
+            (o ejecuta `python cli.py analizar reportes_preprocesados.zip --salida resultados/`).
+            """)
+
+        elif erp_files:
+            st.warning("⚠️ El .zip no contiene archivos Excel")
+
     # ========== MODO 2: ANÁLISIS DE INVENTARIOS (ORIGINAL) ==========
     elif modo == "📊 Analizar Inventarios":
         # Sidebar para configuración
@@ -1195,8 +819,29 @@ def main():
             )
 
             # Configuraciones
-            top_n = st.slider("🔝 Top N para análisis", 5, 50, 10)
+            top_n = st.number_input(
+                "🔝 Top N para análisis",
+                min_value=5,
+                max_value=MAX_TOP_N,
+                value=10,
+                step=5,
+                help=f"Pallets de la hoja Top N del reporte Excel. El gráfico muestra como máximo {MAX_CHART_TOP_N}"
+            )
             sheet_index = st.number_input("📋 Índice de hoja Excel", 0, 10, 1)
+            ingest_workers = st.number_input(
+                "⚡ Procesos de lectura en paralelo",
+                min_value=1,
+                max_value=32,
+                value=default_ingest_workers(),
+                help="Número de archivos Excel que se leen a la vez. 1 = lectura secuencial con caché en memoria"
+            )
+            reader_engine = st.selectbox(
+                "🧮 Motor de lectura",
+                options=["fast", "pandas"],
+                format_func=lambda e: "Rápido (solo filas negativas)" if e == "fast" else "Completo (hoja entera)",
+                help="Rápido: descarta las filas no negativas durante la lectura; conserva todas las columnas. "
+                     "Completo: lee la hoja entera con pandas"
+            )
 
             # Filtros
             st.subheader("🔍 Filtros")
@@ -1207,6 +852,37 @@ def main():
             filter_severidad = st.selectbox("Severidad", ["Todas", "Crítico", "Alto", "Medio", "Bajo"])
             filter_estado = st.selectbox("Estado", ["Todos", "Activo", "Resuelto"])
 
+            modo_incremental = st.checkbox(
+                "➕ Modo incremental",
+                value=False,
+                help="Conserva agregados por pallet y, en la siguiente ejecución, solo procesa los archivos nuevos (días posteriores)"
+            )
+
+            super_disperso = st.checkbox(
+                "🧩 Súper análisis disperso",
+                value=False,
+                help="Guarda solo las celdas con dato (formato largo) y construye la tabla pallets × fechas solo para las filas y fechas que se muestran o exportan"
+            )
+
+            tipos_compactos = st.checkbox(
+                "🗜️ Tipos compactos (menos memoria)",
+                value=False,
+                help="Guarda Código, ID de Pallet, Almacén y Nombre como categorías y el ID único de pallet como entero de 64 bits. El texto se genera solo al mostrar o exportar"
+            )
+
+            medir_memoria = st.checkbox(
+                "📏 Medir memoria por etapa (tracemalloc)",
+                value=False,
+                help="Registra el pico de memoria asignada en cada etapa del panel Rendimiento. Añade sobrecarga a los tiempos"
+            )
+
+            reporte_grande = st.checkbox(
+                "📦 Reporte Excel en disco (memoria constante)",
+                value=False,
+                help=f"Escribe el reporte fila a fila en un archivo temporal en lugar de en memoria y descarga desde ese archivo. "
+                     f"Se usa siempre a partir de {LARGE_REPORT_ROWS:,} filas de datos crudos"
+            )
+
             # Botón de análisis
             analyze_button = st.button("🚀 Ejecutar Análisis", type="primary", width='stretch')
 
@@ -1214,24 +890,77 @@ def main():
         if analyze_button and uploaded_files:
             try:
                 # Inicializar analizador
-                analyzer = InventoryAnalyzerWeb()
+                analyzer = InventoryAnalyzerWeb(compact=tipos_compactos, sparse=super_disperso, trace_memory=medir_memoria)
 
                 # Placeholder para progreso
                 progress_placeholder = st.empty()
                 st.session_state.progress_placeholder = progress_placeholder
 
                 with st.spinner("Procesando archivos..."):
-                    # Procesar datos
-                    df_total = analyzer.process_uploaded_files(uploaded_files)
-                    analisis = analyzer.analyze_pallets(df_total)
-                    super_analisis = analyzer.create_super_analysis(df_total)
-                    reincidencias = analyzer.detect_recurrences(df_total)
+                    estado = st.session_state.get('estado_incremental')
+                    # Cada archivo se identifica por nombre (da la fecha) y hash de contenido:
+                    # un archivo corregido con el mismo nombre cuenta como distinto
+                    subidos = {f"{f.name}|{content_hash(f.getvalue())}": f for f in uploaded_files}
+                    analizados = st.session_state.get('archivos_analizados')
+                    if (modo_incremental and estado is not None and analizados is not None
+                            and 'df_total' in st.session_state
+                            and is_compact(st.session_state.df_total) == tipos_compactos
+                            and st.session_state.get('motor_lectura') == reader_engine
+                            and all(clave in subidos for clave in analizados)):
+                        # Solo leer los archivos que no forman parte del análisis anterior; si
+                        # falta alguno de los analizados (quitado o reemplazado) o cambió el motor
+                        # de lectura se rehace todo
+                        nuevos = [f for clave, f in subidos.items() if clave not in analizados]
+                        archivos_analizados = tuple(analizados) + tuple(c for c in subidos if c not in analizados)
+                        huella = st.session_state.get('huella_datos')
+                        if nuevos:
+                            if huella is not None:
+                                huella = dataset_fingerprint([(f.getvalue(), f.name) for f in nuevos], huella)
+                            df_nuevo = analyzer.process_uploaded_files(nuevos, int(ingest_workers), reader_engine)
+                            df_total = concat_frames([st.session_state.df_total, df_nuevo])
+                            estado, analisis, super_analisis, reincidencias = analyzer.analyze_incremental(
+                                df_nuevo, estado, df_total
+                            )
+                        else:
+                            analyzer.log("ℹ️ No hay archivos nuevos: se mantiene el análisis actual")
+                            df_total = st.session_state.df_total
+                            analisis = st.session_state.analisis
+                            super_analisis = st.session_state.super_analisis
+                            reincidencias = st.session_state.reincidencias
+                    else:
+                        # Procesar datos
+                        if modo_incremental and estado is not None:
+                            analyzer.log("🔄 Cambiaron los archivos o el motor de lectura: se rehace el análisis completo")
+                        archivos_analizados = tuple(subidos)
+                        huella = dataset_fingerprint([(f.getvalue(), f.name) for f in uploaded_files])
+                        df_total = analyzer.process_uploaded_files(uploaded_files, int(ingest_workers), reader_engine)
+                        if modo_incremental:
+                            # Construir agregados reutilizables para próximos días
+                            estado, analisis, super_analisis, reincidencias = analyzer.analyze_incremental(
+                                df_total, None, df_total
+                            )
+                        else:
+                            estado = None
+                            analisis = analyzer.analyze_pallets(df_total)
+                            super_analisis = analyzer.create_super_analysis(df_total)
+                            reincidencias = analyzer.detect_recurrences(df_total)
+
+                    if not all(has_report_date(f.name) for f in uploaded_files):
+                        # Sin fecha en el nombre se usa la fecha actual: el reporte cambia cada día
+                        huella = None
 
                     # Guardar en session state
                     st.session_state.df_total = df_total
                     st.session_state.analisis = analisis
                     st.session_state.super_analisis = super_analisis
                     st.session_state.reincidencias = reincidencias
+                    st.session_state.estado_incremental = estado
+                    st.session_state.archivos_analizados = archivos_analizados
+                    st.session_state.motor_lectura = reader_engine
+                    # Identifica los reportes en caché de estos datos
+                    st.session_state.huella_datos = huella
+                    st.session_state.rendimiento = analyzer.metrics
+                    discard_report_job()
 
                 progress_placeholder.success("✅ Análisis completado!")
 
@@ -1361,7 +1090,7 @@ def main():
             
             # Gráficos
             st.subheader("📈 Visualizaciones")
-            fig1, fig2, fig3, fig4 = create_charts(analisis_filtered, super_analisis, top_n)
+            fig1, fig2, fig3, fig4 = create_charts(analisis_filtered, super_analisis, min(top_n, MAX_CHART_TOP_N))
             
             col1, col2 = st.columns(2)
             with col1:
@@ -1408,7 +1137,7 @@ def main():
                 
                 with col3:
                     almacen_super = st.selectbox("Filtrar por almacén:", 
-                        ["Todos"] + list(super_analisis["Almacen"].unique()),
+                        ["Todos"] + list(super_keys(super_analisis)["Almacen"].unique()),
                         key="almacen_super")
                 
                 with col4:
@@ -1433,47 +1162,49 @@ def main():
                         )
                     
                     # Filtro por rango de fechas
-                    date_cols = [c for c in super_analisis.columns if isinstance(c, pd.Timestamp)]
+                    date_cols = super_dates(super_analisis)
                     if date_cols:
                         fecha_inicio = st.selectbox("Desde fecha:", [None] + sorted(date_cols), key="fecha_inicio")
                         fecha_fin = st.selectbox("Hasta fecha:", [None] + sorted(date_cols), key="fecha_fin")
                 
-                # Aplicar filtros al súper análisis
-                super_filtered = super_analisis.copy()
+                # Aplicar filtros sobre las claves; la tabla ancha se arma solo con el resultado
+                claves_super = super_keys(super_analisis)
+                mask_super = np.ones(len(claves_super), dtype=bool)
                 
                 # Filtro por búsqueda de código
                 if buscar_codigo:
-                    mask = super_filtered["Codigo"].astype(str).str.contains(buscar_codigo, case=False, na=False)
-                    super_filtered = super_filtered[mask]
+                    mask_super &= claves_super["Codigo"].astype(str).str.contains(buscar_codigo, case=False, na=False).to_numpy()
                 
                 # Filtro por almacén
                 if almacen_super != "Todos":
-                    super_filtered = super_filtered[super_filtered["Almacen"] == almacen_super]
+                    mask_super &= (claves_super["Almacen"] == almacen_super).to_numpy()
                 
                 # Filtro códigos a excluir
                 if codigos_excluir_super.strip():
                     codigos_excl = [c.strip() for c in codigos_excluir_super.split(",") if c.strip()]
-                    super_filtered = super_filtered[~super_filtered["Codigo"].astype(str).isin(codigos_excl)]
+                    mask_super &= ~claves_super["Codigo"].astype(str).isin(codigos_excl).to_numpy()
                 
                 # Filtro solo incluir códigos
                 if codigos_incluir_super.strip():
                     codigos_incl = [c.strip() for c in codigos_incluir_super.split(",") if c.strip()]
-                    super_filtered = super_filtered[super_filtered["Codigo"].astype(str).isin(codigos_incl)]
+                    mask_super &= claves_super["Codigo"].astype(str).isin(codigos_incl).to_numpy()
                 
                 # Filtro solo activos (tienen valor en última fecha)
                 if solo_activos and date_cols:
                     ultima_fecha = max(date_cols)
-                    super_filtered = super_filtered[super_filtered[ultima_fecha].notna() & (super_filtered[ultima_fecha] != 0)]
+                    ultima = super_wide(super_analisis, fechas=[ultima_fecha])[ultima_fecha].to_numpy()
+                    mask_super &= ~np.isnan(ultima) & (ultima != 0)
                 
                 # Filtro por rango de fechas
+                date_range = None
                 if date_cols and fecha_inicio and fecha_fin:
-                    cols_to_show = ["Codigo", "Nombre", "ID_Pallet", "Almacen"]
                     date_range = [d for d in sorted(date_cols) if fecha_inicio <= d <= fecha_fin]
-                    super_filtered = super_filtered[cols_to_show + date_range]
                     date_cols = date_range  # Actualizar date_cols para gráficos
                 
+                super_filtered = super_wide(super_analisis, mask_super, date_range)
+                
                 # Mostrar información de filtrado con mejor formato
-                st.info(f"📋 **Mostrando {len(super_filtered)} de {len(super_analisis)} registros** con los filtros aplicados")
+                st.info(f"📋 **Mostrando {len(super_filtered)} de {len(claves_super)} registros** con los filtros aplicados")
                 
                 # Procesar datos para visualización
                 if mostrar_vacios:
@@ -1721,19 +1452,19 @@ def main():
         
             with tab4:
                 st.subheader("Datos Crudos Procesados")
-                st.dataframe(df_total, width='stretch', height=400)
+                st.dataframe(with_pallet_labels(df_total), width='stretch', height=400)
             
             # Descarga de reporte
             st.subheader("💾 Descargar Reporte")
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             
+            rendimiento = st.session_state.get('rendimiento')
             with col1:
-                excel_buffer = generate_excel_report(analisis, super_analisis, reincidencias, df_total, top_n)
-                st.download_button(
-                    label="📊 Descargar Reporte Excel",
-                    data=excel_buffer,
-                    file_name=f"Reporte_Inventarios_Negativos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                # Historiales largos: reporte en disco con memoria constante
+                reporte_en_disco = reporte_grande or len(df_total) >= LARGE_REPORT_ROWS
+                excel_report_panel(
+                    analisis, super_analisis, reincidencias, df_total, top_n, reporte_en_disco, rendimiento,
+                    st.session_state.get('huella_datos'), (f"motor-{st.session_state.get('motor_lectura')}",)
                 )
             
             with col2:
@@ -1745,6 +1476,33 @@ def main():
                     mime="text/csv"
                 )
             
+            with col3:
+                # Todas las tablas en formato columnar; se serializan solo al descargar
+                formato_paquete = st.selectbox(
+                    "Formato del paquete",
+                    BUNDLE_FORMATS,
+                    index=BUNDLE_FORMATS.index(default_bundle_format()),
+                    help="Parquet/Feather para pandas o Arrow, CSV.gz si no hay pyarrow"
+                )
+                st.download_button(
+                    label=f"📦 Descargar Datos ({formato_paquete})",
+                    data=partial(write_data_bundle, analisis, super_analisis, reincidencias, df_total, formato_paquete),
+                    file_name=f"Datos_Inventarios_{datetime.now().strftime('%Y%m%d_%H%M')}.zip",
+                    mime="application/zip"
+                )
+            
+            # Panel de rendimiento por etapa
+            if rendimiento is not None and rendimiento.stages:
+                with st.expander("⏱️ Rendimiento", expanded=False):
+                    st.caption(f"Tiempo total medido: {rendimiento.total_seconds():.2f}s")
+                    st.dataframe(rendimiento.to_frame(), width='stretch', hide_index=True)
+                    st.download_button(
+                        label="📥 Descargar métricas (JSON)",
+                        data=rendimiento.to_json(),
+                        file_name=f"Rendimiento_{datetime.now().strftime('%Y%m%d_%H%M')}.json",
+                        mime="application/json"
+                    )
+            
             # Nota informativa sobre reportes
             st.markdown("---")
             st.info("""
@@ -1835,9 +1593,25 @@ def main():
         **Fuente de datos:** GitHub (repositorio privado con autenticación)
         """)
         
-        # Descargar y conectar DB
-        with st.spinner("📡 Conectando a base de datos en GitHub..."):
-            db_path, success, error = download_and_connect_db()
+        # Fuente: la base de GitHub o la copia local donde escribe el preprocesador ERP
+        fuente_db = "☁️ GitHub"
+        if HISTORICO_DB_PATH.exists():
+            fuente_db = st.sidebar.radio(
+                "Fuente de datos:",
+                ["☁️ GitHub", "💻 Base local"],
+                help=f"Base local: {HISTORICO_DB_PATH} (se actualiza con 💾 Guardar en histórico del preprocesador ERP)"
+            )
+
+        if fuente_db == "💻 Base local":
+            db_path, success, error = str(HISTORICO_DB_PATH), True, None
+        else:
+            # Descargar y conectar DB
+            barra = st.empty()
+            with st.spinner("📡 Conectando a base de datos en GitHub..."):
+                db_path, success, error = download_and_connect_db(download_progress_bar(barra))
+            barra.empty()
+            if success and error:
+                st.warning(f"⚠️ {error}")
         
         if not success:
             st.error(f"❌ Error conectando a la base de datos: {error}")
@@ -1890,18 +1664,25 @@ def main():
             - **Tipo:** Repositorio privado (requiere autenticación)
             """)
         else:
-            # Cargar datos
+            # Cargar resumen y último día; el resto se consulta con los filtros aplicados
+            db_version = historico_db_version(db_path)
             with st.spinner("📥 Cargando datos históricos..."):
-                df_historico, load_success, load_error = load_historico_data(db_path)
+                resumen_hist, load_success, load_error = load_historico_summary(db_path, db_version)
+                if load_success and not resumen_hist["fechas"]:
+                    load_success, load_error = False, "La base de datos no tiene registros"
+                if load_success:
+                    ultima_fecha = resumen_hist["fechas"][-1]
+                    df_ultimo_dia, load_success, load_error = load_historico_data(
+                        db_path, db_version, fecha_desde=ultima_fecha, fecha_hasta=ultima_fecha
+                    )
             
             if not load_success:
                 st.error(f"❌ Error al cargar datos: {load_error}")
             else:
-                st.success(f"✅ Base de datos cargada exitosamente: {len(df_historico):,} registros")
+                st.success(f"✅ Base de datos cargada exitosamente: {resumen_hist['registros']:,} registros")
+                zonas_almacenes = resumen_hist["zonas_almacenes"]
                 
-                # OBTENER ÚLTIMO DÍA DISPONIBLE (SIN FILTROS - todos los registros)
-                ultima_fecha = df_historico["fecha"].max()
-                df_ultimo_dia = df_historico[df_historico["fecha"] == ultima_fecha]
+                # ÚLTIMO DÍA DISPONIBLE (SIN FILTROS - todos los registros de esa fecha)
                 
                 # BANNER PROFESIONAL CON FECHA
                 st.markdown(f"""
@@ -1920,9 +1701,9 @@ def main():
                              help=f"Total de registros en {ultima_fecha.strftime('%Y-%m-%d')}")
                 
                 with col2:
-                    fechas_unicas = df_historico["fecha"].nunique()
-                    fecha_min = df_historico["fecha"].min().strftime("%Y-%m-%d")
-                    fecha_max = df_historico["fecha"].max().strftime("%Y-%m-%d")
+                    fechas_unicas = len(resumen_hist["fechas"])
+                    fecha_min = resumen_hist["fechas"][0].strftime("%Y-%m-%d")
+                    fecha_max = ultima_fecha.strftime("%Y-%m-%d")
                     st.metric("Días en Histórico", fechas_unicas, help=f"Desde {fecha_min} hasta {fecha_max}")
                 
                 with col3:
@@ -1956,7 +1737,7 @@ def main():
                 # (incluye Stock < 0 con costo Y Stock = 0 con costo negativo)
                 df_para_costos = df_ultimo_dia[df_ultimo_dia["CostStock"] < 0]
                 
-                costos_resumen = df_para_costos.groupby("CompanyId").agg({
+                costos_resumen = df_para_costos.groupby("CompanyId", observed=True).agg({
                     "CostStock": "sum",
                     "ProductId": "nunique",
                     "InventLocationId": "nunique",
@@ -2052,7 +1833,7 @@ def main():
                     
                     with col1:
                         st.markdown("**🏢 Zonas/Compañías**")
-                        todas_zonas = sorted(df_historico["CompanyId"].unique().tolist())
+                        todas_zonas = sorted(zonas_almacenes["CompanyId"].unique().tolist())
                         
                         # Multiselect simple - por defecto todas
                         zonas_seleccionadas = st.multiselect(
@@ -2078,7 +1859,7 @@ def main():
                         # FILTRO RELACIONADO: Solo mostrar almacenes de las zonas seleccionadas
                         if zonas_seleccionadas:
                             almacenes_disponibles = sorted(
-                                df_historico[df_historico["CompanyId"].isin(zonas_seleccionadas)]["InventLocationId"].unique().tolist()
+                                zonas_almacenes[zonas_almacenes["CompanyId"].isin(zonas_seleccionadas)]["InventLocationId"].unique().tolist()
                             )
                         else:
                             almacenes_disponibles = []
@@ -2189,7 +1970,7 @@ def main():
                         
                         # Rango de Fechas
                         st.markdown("#### 📅 Rango Temporal")
-                        fechas_disponibles = sorted(df_historico["fecha"].unique())
+                        fechas_disponibles = resumen_hist["fechas"]
                         if len(fechas_disponibles) > 0:
                             col1, col2, col3 = st.columns([2, 2, 1])
                             with col1:
@@ -2228,49 +2009,35 @@ def main():
                             st.markdown("#### ✨ Filtros Activos")
                             st.info(" • ".join(filtros_activos))
                 
-                # APLICAR FILTROS RELACIONADOS
-                df_filtered = df_historico.copy()
-                
-                # 1. Filtro de negativos - Incluir Stock < 0 O (Stock = 0 con CostStock < 0)
-                if solo_negativos_hist:
-                    df_filtered = df_filtered[
-                        (df_filtered["Stock"] < 0) | 
-                        ((df_filtered["Stock"] == 0) & (df_filtered["CostStock"] < 0))
-                    ]
-                
-                # 2. Filtro por Zonas (multiselect)
-                if zonas_seleccionadas:
-                    df_filtered = df_filtered[df_filtered["CompanyId"].isin(zonas_seleccionadas)]
-                else:
-                    # Si no hay zonas seleccionadas, no mostrar nada
-                    df_filtered = df_filtered[df_filtered["CompanyId"].isin([])]
-                
-                # 3. Filtro por Almacenes (multiselect relacionado)
-                if almacenes_seleccionados:
-                    df_filtered = df_filtered[df_filtered["InventLocationId"].isin(almacenes_seleccionados)]
-                else:
-                    # Si no hay almacenes seleccionados, no mostrar nada
-                    df_filtered = df_filtered[df_filtered["InventLocationId"].isin([])]
-                
-                # 4. Búsqueda de código
-                if buscar_codigo_hist:
-                    mask = df_filtered["ProductId"].astype(str).str.contains(buscar_codigo_hist, case=False, na=False)
-                    df_filtered = df_filtered[mask]
-                
-                # 5. Filtros de exclusión/inclusión
-                if codigos_excluir_hist and codigos_excluir_hist.strip():
-                    codigos_excl = [c.strip() for c in codigos_excluir_hist.split(",") if c.strip()]
-                    df_filtered = df_filtered[~df_filtered["ProductId"].astype(str).isin(codigos_excl)]
-                
-                if codigos_incluir_hist and codigos_incluir_hist.strip():
-                    codigos_incl = [c.strip() for c in codigos_incluir_hist.split(",") if c.strip()]
-                    df_filtered = df_filtered[df_filtered["ProductId"].astype(str).isin(codigos_incl)]
-                
+                # APLICAR FILTROS RELACIONADOS EN SQLITE
+                # Solo se leen las filas de la selección. Un filtro que abarca todo
+                # (todas las zonas, todo el rango) se omite: la consulta es más simple
+                # y comparte entrada de caché con las demás selecciones completas.
+                codigos_excl = tuple(sorted({c.strip() for c in codigos_excluir_hist.split(",") if c.strip()}))
+                codigos_incl = tuple(sorted({c.strip() for c in codigos_incluir_hist.split(",") if c.strip()}))
+                filtros_hist = {
+                    "zonas": None if set(zonas_seleccionadas) == set(todas_zonas) else tuple(sorted(zonas_seleccionadas)),
+                    "almacenes": (
+                        None if set(almacenes_seleccionados) == set(almacenes_disponibles)
+                        else tuple(sorted(almacenes_seleccionados))
+                    ),
+                    # 1. Negativos: Stock < 0 O (Stock = 0 con CostStock < 0)
+                    "solo_negativos": solo_negativos_hist,
+                    "buscar": buscar_codigo_hist or None,
+                    "excluir": codigos_excl,
+                    "incluir": codigos_incl,
+                }
                 if 'fecha_inicio_hist' in locals() and 'fecha_fin_hist' in locals():
-                    df_filtered = df_filtered[
-                        (df_filtered["fecha"].dt.date >= fecha_inicio_hist) &
-                        (df_filtered["fecha"].dt.date <= fecha_fin_hist)
-                    ]
+                    if fecha_inicio_hist > fechas_disponibles[0].date():
+                        filtros_hist["fecha_desde"] = fecha_inicio_hist
+                    if fecha_fin_hist < fechas_disponibles[-1].date():
+                        filtros_hist["fecha_hasta"] = fecha_fin_hist
+                
+                with st.spinner("🔎 Consultando la base de datos..."):
+                    df_filtered, filtro_ok, filtro_error = load_historico_data(db_path, db_version, **filtros_hist)
+                if not filtro_ok:
+                    st.error(f"❌ Error al aplicar los filtros: {filtro_error}")
+                    df_filtered = df_ultimo_dia.iloc[0:0]
                 
                 # GRÁFICO COMPARATIVO ENTRE ALMACENES SELECCIONADOS
                 if len(df_filtered) > 0:
@@ -2283,7 +2050,7 @@ def main():
                     df_comp_neg = df_comp  # Ya está filtrado
                     
                     if len(df_comp_neg) > 0 and len(almacenes_seleccionados) > 0:
-                        comparativa_alm = df_comp_neg.groupby("InventLocationId").agg({
+                        comparativa_alm = df_comp_neg.groupby("InventLocationId", observed=True).agg({
                             "Stock": "sum",
                             "CostStock": "sum",
                             "ProductId": "nunique"
@@ -2371,7 +2138,8 @@ def main():
                         index=["CompanyId", "ProductId", "ProductName_es", "LabelId", "InventLocationId"],
                         columns="fecha",
                         values="Stock",
-                        aggfunc="first"
+                        aggfunc="first",
+                        observed=True  # Códigos categóricos: solo combinaciones presentes
                     ).reset_index()
                     
                     historico_pivot = historico_pivot.rename(columns={
@@ -2704,7 +2472,7 @@ def main():
                             df_filtered_ultimo_dist = df_filtered[df_filtered["fecha"] == fecha_max_filtrada]
                             
                             # Distribución por Zona - Usar mismo filtro que todo (ya viene con CostStock < 0)
-                            zona_data_hist = df_filtered_ultimo_dist.groupby("CompanyId")["Stock"].sum().abs()
+                            zona_data_hist = df_filtered_ultimo_dist.groupby("CompanyId", observed=True)["Stock"].sum().abs()
                             zona_data_hist = zona_data_hist[zona_data_hist > 0]  # Solo positivos
                             
                             if len(zona_data_hist) > 0:
@@ -2725,7 +2493,7 @@ def main():
                             df_filtered_ultimo_viz = df_filtered[df_filtered["fecha"] == fecha_max_filtrada]
                             df_filtered_con_costo = df_filtered_ultimo_viz[df_filtered_ultimo_viz["CostStock"] < 0]
                             
-                            costos_por_zona = df_filtered_con_costo.groupby("CompanyId")["CostStock"].sum()
+                            costos_por_zona = df_filtered_con_costo.groupby("CompanyId", observed=True)["CostStock"].sum()
                             costos_por_zona = costos_por_zona.abs().sort_values(ascending=False).head(10)
                             if len(costos_por_zona) > 0:
                                 fig_costos_zona = px.bar(
@@ -2742,7 +2510,7 @@ def main():
                         with col2:
                             # Top Almacenes por Stock Negativo - SOLO ÚLTIMO DÍA
                             # Usar df_filtered_ultimo_viz (ya definido arriba)
-                            almacenes_stock = df_filtered_ultimo_viz.groupby("InventLocationId")["Stock"].sum().abs()
+                            almacenes_stock = df_filtered_ultimo_viz.groupby("InventLocationId", observed=True)["Stock"].sum().abs()
                             almacenes_stock = almacenes_stock.sort_values(ascending=False).head(10)
                             
                             if len(almacenes_stock) > 0:
@@ -0,0 +1,300 @@
+"""
+Benchmark del pipeline de carga de reportes diarios (fuera de Streamlit).
+
+Genera reportes sintéticos reporte_all_YYYYMMDD_HHMMSS.xlsx con el mismo formato
+que los reales (segunda hoja con Código, Nombre, ID de Pallet, Almacén e
+Inventario Físico) y mide tiempo y memoria de cada etapa:
+
+    process_excel_file -> normalize_dataframe -> analyze_pallets_data ->
+    create_super_analysis -> detect_recurrences -> generate_excel_report ->
+    write_data_bundle
+
+Uso:
+    python benchmark.py --pallets 20000 --dias 30 --almacenes 4 --ratio-negativos 0.15
+
+Cada ejecución agrega una fila por etapa a benchmark_results/resultados.csv y
+guarda el detalle en un JSON, de modo que se pueden comparar versiones.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis import build_pallet_analysis
+from ingestion import normalize_report_frame, read_report_file, read_report_files_parallel
+from instrumentation import PipelineMetrics, STAGE_COLUMNS, count_rows
+from pipeline import InventoryAnalyzer
+from reporting import write_data_bundle, write_excel_report
+
+RESULTS_DIR = Path("benchmark_results")
+
+CSV_COLUMNS = [
+    "fecha_ejecucion", "version", "etiqueta", "pallets", "dias", "almacenes",
+    "ratio_negativos", "motor", "procesos", "compacto", "disperso", "repeticion",
+] + STAGE_COLUMNS
+
+# Probabilidad diaria de que un pallet negativo se corrija (el resto sigue negativo)
+PROB_RESOLVER = 0.3
+
+
+def generate_reports(pallets, dias, almacenes, ratio_negativos, seed=0, fecha_inicio="2025-01-01"):
+    """
+    Genera reportes diarios sintéticos
+
+    Cada día se reporta el inventario completo (una fila por pallet). El estado
+    negativo de cada pallet sigue una cadena de Markov con proporción estable
+    `ratio_negativos`, por lo que hay rachas de días negativos, huecos y
+    reincidencias como en los datos reales.
+
+    Yields:
+        tuple: (file_content, filename)
+    """
+    rng = np.random.default_rng(seed)
+    codigos = 100000 + rng.integers(0, max(pallets // 4, 1), pallets)
+    id_pallets = 5000000 + np.arange(pallets)
+    nombres_almacen = np.array([f"ALM{i + 1:02d}" for i in range(almacenes)])
+    almacen = nombres_almacen[rng.integers(0, almacenes, pallets)]
+    nombres = np.array([f"Producto {c}" for c in codigos], dtype=object)
+
+    prob_entrar = min(1.0, ratio_negativos * PROB_RESOLVER / max(1 - ratio_negativos, 1e-9))
+    negativo = rng.random(pallets) < ratio_negativos
+    inicio = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+
+    for dia in range(dias):
+        if dia > 0:
+            azar = rng.random(pallets)
+            negativo = np.where(negativo, azar >= PROB_RESOLVER, azar < prob_entrar)
+
+        cantidad = np.where(
+            negativo,
+            -rng.integers(1, 500, pallets),
+            rng.integers(0, 1000, pallets)
+        ).astype(float)
+        detalle = pd.DataFrame({
+            "Código": codigos,
+            "Nombre": nombres,
+            "ID de Pallet": id_pallets,
+            "Almacén": almacen,
+            "Inventario Físico": cantidad,
+            "Lote": rng.integers(1, 10000, pallets),
+            "Unidad": "UN",
+        })
+
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            pd.DataFrame({"Total pallets": [pallets], "Negativos": [int(negativo.sum())]}).to_excel(
+                writer, sheet_name="Resumen", index=False
+            )
+            detalle.to_excel(writer, sheet_name="Inventario", index=False)
+
+        fecha = inicio + timedelta(days=dia)
+        yield buffer.getvalue(), f"reporte_all_{fecha:%Y%m%d}_080000.xlsx"
+
+
+def measure(metrics, etapa, func, filas_entrada):
+    """Ejecuta una etapa registrándola en metrics y devuelve su resultado"""
+    with metrics.stage(etapa, filas_entrada) as registro:
+        resultado = func()
+        registro["filas_salida"] = count_rows(resultado)
+    return resultado
+
+
+def run_pipeline(files, motor, procesos, compacto, disperso, top_n, usar_tracemalloc=True):
+    """
+    Ejecuta el pipeline completo sobre los archivos generados
+
+    Usa las funciones sin Streamlit (sin la caché de st.cache_data) y sin la
+    caché en disco, para medir el trabajo real.
+
+    Returns:
+        list: una medición por etapa
+    """
+    analyzer = InventoryAnalyzer(compact=compacto, sparse=disperso)
+    metrics = PipelineMetrics(trace_memory=usar_tracemalloc)
+
+    def leer():
+        if procesos > 1:
+            resultados = [r[1:] for r in read_report_files_parallel(files, procesos, motor, use_disk_cache=False)]
+        else:
+            resultados = [read_report_file(c, n, use_disk_cache=False, engine=motor) for c, n in files]
+        errores = [error for _, ok, error in resultados if not ok]
+        if errores:
+            raise RuntimeError(f"Error leyendo reportes: {errores[0]}")
+        return pd.concat([df for df, _, _ in resultados], ignore_index=True)
+
+    df_crudo = measure(metrics, "process_excel_file", leer, len(files))
+    df_total = measure(
+        metrics, "normalize_dataframe",
+        partial(normalize_report_frame, df_crudo, compacto), len(df_crudo)
+    )
+    del df_crudo
+
+    analisis = measure(
+        metrics, "analyze_pallets_data",
+        lambda: build_pallet_analysis(df_total), len(df_total)
+    )
+    super_analisis = measure(
+        metrics, "create_super_analysis",
+        lambda: analyzer.create_super_analysis(df_total), len(df_total)
+    )
+    reincidencias = measure(
+        metrics, "detect_recurrences",
+        lambda: analyzer.detect_recurrences(df_total), len(df_total)
+    )
+    measure(
+        metrics, "generate_excel_report",
+        lambda: write_excel_report(analisis, super_analisis, reincidencias, df_total, top_n),
+        len(analisis)
+    )
+    measure(
+        metrics, "write_data_bundle",
+        lambda: write_data_bundle(analisis, super_analisis, reincidencias, df_total),
+        len(df_total)
+    )
+    return metrics.stages
+
+
+def _version():
+    """Commit actual del repositorio (o "desconocida" fuera de git)"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def write_results(resultados, metadatos, output_dir):
+    """
+    Guarda los resultados en JSON (una ejecución) y los agrega al CSV acumulado
+
+    Returns:
+        tuple: (ruta_json, ruta_csv)
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+    ruta_json = output_dir / f"benchmark_{marca}.json"
+    with open(ruta_json, "w", encoding="utf-8") as f:
+        json.dump({"metadatos": metadatos, "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+    ruta_csv = output_dir / "resultados.csv"
+    nuevo = not ruta_csv.exists()
+    with open(ruta_csv, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        if nuevo:
+            writer.writeheader()
+        writer.writerows(resultados)
+
+    return ruta_json, ruta_csv
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de reportes diarios")
+    parser.add_argument("--pallets", type=int, default=5000, help="Pallets por reporte diario")
+    parser.add_argument("--dias", type=int, default=10, help="Número de reportes (días consecutivos)")
+    parser.add_argument("--almacenes", type=int, default=3, help="Número de almacenes")
+    parser.add_argument("--ratio-negativos", type=float, default=0.15, help="Proporción de pallets negativos por día")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla del generador")
+    parser.add_argument("--motor", choices=["fast", "pandas"], default="fast", help="Motor de lectura de Excel")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos de lectura en paralelo")
+    parser.add_argument("--compacto", action="store_true", help="Usar tipos compactos")
+    parser.add_argument("--disperso", action="store_true", help="Usar súper análisis disperso")
+    parser.add_argument("--top-n", type=int, default=10, help="Top N del reporte Excel")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Veces que se repite el pipeline")
+    parser.add_argument("--sin-tracemalloc", action="store_true",
+                        help="No medir memoria con tracemalloc (menos sobrecarga en los tiempos)")
+    parser.add_argument("--datos", help="Directorio donde guardar/reutilizar los reportes generados")
+    parser.add_argument("--salida", default=str(RESULTS_DIR), help="Directorio de resultados")
+    parser.add_argument("--etiqueta", default="", help="Texto libre para identificar la ejecución")
+    return parser.parse_args(argv)
+
+
+def _load_or_generate(args):
+    """
+    Genera los reportes (o los reutiliza desde --datos)
+
+    Returns:
+        tuple: ([(contenido, nombre)], generados)
+    """
+    directorio = Path(args.datos) if args.datos else None
+    if directorio is not None and directorio.exists() and any(directorio.glob("reporte_all_*.xlsx")):
+        return [(p.read_bytes(), p.name) for p in sorted(directorio.glob("reporte_all_*.xlsx"))], False
+
+    files = list(generate_reports(args.pallets, args.dias, args.almacenes, args.ratio_negativos, args.semilla))
+    if directorio is not None:
+        directorio.mkdir(parents=True, exist_ok=True)
+        for contenido, nombre in files:
+            (directorio / nombre).write_bytes(contenido)
+    return files, True
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    inicio = time.perf_counter()
+    files, generados = _load_or_generate(args)
+    print(f"Reportes: {len(files)} archivos ({sum(len(c) for c, _ in files) / 1024 ** 2:.1f} MB) "
+          f"en {time.perf_counter() - inicio:.1f}s")
+
+    metadatos = {
+        "fecha_ejecucion": datetime.now().isoformat(timespec="seconds"),
+        "version": _version(),
+        "etiqueta": args.etiqueta,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "datos": args.datos,
+        # Con reportes reutilizados los parámetros de generación no aplican
+        "pallets": args.pallets if generados else None,
+        "dias": len(files),
+        "almacenes": args.almacenes if generados else None,
+        "ratio_negativos": args.ratio_negativos if generados else None,
+        "motor": args.motor,
+        "procesos": args.procesos,
+        "compacto": args.compacto,
+        "disperso": args.disperso,
+    }
+
+    usar_tracemalloc = not args.sin_tracemalloc
+    if usar_tracemalloc:
+        tracemalloc.start()
+
+    resultados = []
+    for repeticion in range(1, args.repeticiones + 1):
+        mediciones = run_pipeline(
+            files, args.motor, args.procesos, args.compacto, args.disperso, args.top_n, usar_tracemalloc
+        )
+        for m in mediciones:
+            fila = {c: metadatos.get(c) for c in CSV_COLUMNS if c in metadatos}
+            fila.update(m, repeticion=repeticion)
+            resultados.append(fila)
+            print(f"[{repeticion}] {m['etapa']:<24} {m['segundos']:>9.3f}s  "
+                  f"filas {m['filas_entrada']} -> {m['filas_salida']}  "
+                  f"pico {m['tracemalloc_pico_mb']} MB")
+
+    if usar_tracemalloc:
+        tracemalloc.stop()
+
+    ruta_json, ruta_csv = write_results(resultados, metadatos, args.salida)
+    print(f"Resultados: {ruta_json} y {ruta_csv}")
+
+
+if __name__ == "__main__":
+    main()
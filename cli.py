@@ -0,0 +1,275 @@
+"""
+Línea de comandos (sin Streamlit) para el análisis de inventarios negativos.
+
+Permite precalcular análisis en un cron nocturno o en una máquina más grande
+con el mismo pipeline que la app web (pipeline.InventoryAnalyzer), sin la
+caché en memoria de Streamlit.
+
+Uso:
+    python cli.py analizar reportes/ --salida resultados/
+    python cli.py analizar reportes.zip --salida resultados/ --top-n 20 --procesos 4
+    python cli.py preprocesar crudos_erp/ --salida reportes/ --procesos 4
+    python cli.py cargar-historico crudos_erp/ --zona 61D
+
+`analizar` escribe en --salida el reporte Excel, las tablas intermedias (Parquet,
+o CSV si pyarrow no está instalado) y rendimiento.json con las métricas por etapa;
+con --paquete agrega un .zip columnar (Parquet/Feather/CSV.gz) legible con
+reporting.read_data_bundle.
+`preprocesar` convierte exportaciones crudas del ERP en reportes reporte_all_*.xlsx
+(sueltos o en un .zip con --zip) junto con estadisticas_preprocesado.csv.
+`cargar-historico` preprocesa las exportaciones y las guarda directamente en la
+base histórica SQLite local (tabla inventario) con un upsert por día.
+"""
+import argparse
+import importlib.util
+import sys
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+from analysis import SuperAnalysisStore, with_pallet_labels
+from erp import batch_stats_frame, erp_report_date, preprocess_erp_batch, preprocess_erp_files, read_erp_export
+from historico_db import HISTORICO_DB_PATH, load_erp_into_historico
+from ingestion import (
+    DEFAULT_READER_ENGINE, READER_ENGINES, default_ingest_workers, is_excel_name, read_zip_excel_files,
+    to_parquet_safe,
+)
+from pipeline import InventoryAnalyzer
+from reporting import (
+    BUNDLE_FORMATS, LARGE_REPORT_ROWS, default_bundle_format, write_data_bundle, write_excel_report,
+    write_excel_report_file,
+)
+
+
+def collect_report_files(ruta):
+    """
+    Lee los reportes diarios de una carpeta o de un .zip
+
+    Returns:
+        list: tuplas (file_content, filename) ordenadas por nombre
+
+    Raises:
+        ValueError: si la ruta no existe o no contiene archivos Excel
+    """
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        files = [(p.read_bytes(), p.name) for p in sorted(ruta.iterdir()) if p.is_file() and is_excel_name(p.name)]
+    elif ruta.is_file() and zipfile.is_zipfile(ruta):
+        files = read_zip_excel_files(ruta)
+    else:
+        raise ValueError(f"No existe la carpeta o archivo .zip: {ruta}")
+
+    if not files:
+        raise ValueError(f"No se encontraron archivos Excel en {ruta}")
+    return files
+
+
+def collect_erp_files(rutas):
+    """Lee exportaciones crudas del ERP desde archivos Excel, carpetas o .zip"""
+    files = []
+    for ruta in map(Path, rutas):
+        if ruta.is_file() and is_excel_name(ruta.name):
+            files.append((ruta.read_bytes(), ruta.name))
+        else:
+            files.extend(collect_report_files(ruta))
+    return files
+
+
+def _date_labels(df):
+    """Copia con las columnas de fecha (Timestamp) renombradas a texto YYYY-MM-DD"""
+    return df.rename(columns=lambda c: c.strftime("%Y-%m-%d") if hasattr(c, "strftime") else str(c))
+
+
+def write_table(df, ruta_base, formato):
+    """Escribe una tabla intermedia en Parquet o CSV y devuelve la ruta"""
+    df = _date_labels(df)
+    if formato == "parquet":
+        ruta = ruta_base.with_suffix(".parquet")
+        to_parquet_safe(df, ruta)
+    else:
+        ruta = ruta_base.with_suffix(".csv")
+        df.to_csv(ruta, index=False)
+    return ruta
+
+
+def run_analysis(args):
+    """Ejecuta el pipeline completo y escribe reporte, tablas y métricas en args.salida"""
+    salida = Path(args.salida)
+    salida.mkdir(parents=True, exist_ok=True)
+    log_sink = None if args.silencioso else print
+
+    analyzer = InventoryAnalyzer(
+        compact=args.compacto, sparse=args.disperso, trace_memory=args.medir_memoria, log_sink=log_sink
+    )
+    files = collect_report_files(args.entrada)
+
+    df_total = analyzer.process_files(files, args.procesos, args.motor)
+    analisis = analyzer.analyze_pallets(df_total)
+    super_analisis = analyzer.create_super_analysis(df_total)
+    reincidencias = analyzer.detect_recurrences(df_total)
+
+    marca = datetime.now().strftime("%Y%m%d_%H%M")
+    ruta_excel = salida / f"Reporte_Inventarios_Negativos_{marca}.xlsx"
+    with analyzer.metrics.stage("Reporte Excel", len(analisis)):
+        if args.memoria_constante or len(df_total) >= LARGE_REPORT_ROWS:
+            write_excel_report_file(analisis, super_analisis, reincidencias, df_total, args.top_n, ruta_excel)
+        else:
+            buffer = write_excel_report(analisis, super_analisis, reincidencias, df_total, args.top_n)
+            ruta_excel.write_bytes(buffer.getvalue())
+    analyzer.log(f"💾 Reporte Excel: {ruta_excel}")
+
+    if args.formato != "ninguno":
+        with analyzer.metrics.stage("Tablas intermedias", len(df_total)):
+            if isinstance(super_analisis, SuperAnalysisStore):
+                tabla_super = ("super_analisis_largo", super_analisis.to_long())
+            else:
+                tabla_super = ("super_analisis", super_analisis)
+            tablas = [
+                ("analisis", analisis),
+                ("reincidencias", reincidencias),
+                tabla_super,
+                ("datos_normalizados", with_pallet_labels(df_total)),
+            ]
+            for nombre, df in tablas:
+                ruta = write_table(df, salida / nombre, args.formato)
+                analyzer.log(f"💾 {nombre}: {ruta}")
+
+    if args.paquete:
+        ruta_paquete = salida / f"Datos_Inventarios_{marca}.zip"
+        with analyzer.metrics.stage("Paquete de datos", len(df_total)):
+            buffer = write_data_bundle(analisis, super_analisis, reincidencias, df_total, args.paquete)
+            ruta_paquete.write_bytes(buffer.getvalue())
+        analyzer.log(f"📦 Paquete de datos ({args.paquete}): {ruta_paquete}")
+
+    ruta_metricas = salida / "rendimiento.json"
+    ruta_metricas.write_text(analyzer.metrics.to_json(), encoding="utf-8")
+    analyzer.log(f"⏱️ Tiempo total: {analyzer.metrics.total_seconds():.2f}s ({ruta_metricas})")
+
+
+def run_preprocess(args):
+    """Preprocesa un lote de exportaciones del ERP y escribe los reportes en args.salida"""
+    salida = Path(args.salida)
+    salida.mkdir(parents=True, exist_ok=True)
+    log = (lambda *a: None) if args.silencioso else print
+
+    files = collect_erp_files(args.entrada)
+    fecha = datetime.strptime(args.fecha, "%Y-%m-%d").date() if args.fecha else None
+    log(f"📥 Preprocesando {len(files)} archivos con {min(args.procesos, len(files))} procesos")
+
+    if args.zip:
+        buffer, df_stats = preprocess_erp_batch(files, args.hoja, args.motor, fecha, args.procesos)
+        ruta_zip = salida / f"reportes_preprocesados_{datetime.now():%Y%m%d_%H%M}.zip"
+        ruta_zip.write_bytes(buffer.getvalue())
+        log(f"💾 {ruta_zip}")
+    else:
+        filas = []
+        for contenido, fila in preprocess_erp_files(files, args.hoja, args.motor, fecha, args.procesos):
+            if contenido is not None:
+                (salida / fila["reporte"]).write_bytes(contenido)
+                log(f"💾 {fila['archivo']} → {fila['reporte']} ({fila['filas_filtradas']} filas)")
+            filas.append(fila)
+        df_stats = batch_stats_frame(filas)
+
+    ruta_stats = salida / "estadisticas_preprocesado.csv"
+    df_stats.to_csv(ruta_stats, index=False)
+    errores = df_stats[df_stats["estado"] != "ok"]
+    for _, fila in errores.iterrows():
+        log(f"❌ {fila['archivo']}: {fila['error']}")
+    log(f"✅ {len(df_stats) - len(errores)}/{len(df_stats)} archivos procesados ({ruta_stats})")
+    if len(errores) == len(df_stats):
+        raise ValueError("Ningún archivo se pudo preprocesar")
+
+
+def run_load_historico(args):
+    """Preprocesa exportaciones del ERP y las carga en la base histórica local (un upsert por archivo)"""
+    log = (lambda *a: None) if args.silencioso else print
+    files = collect_erp_files(args.entrada)
+    fecha_default = datetime.strptime(args.fecha, "%Y-%m-%d").date() if args.fecha else datetime.now().date()
+
+    errores = 0
+    for file_content, filename in files:
+        df, ok, error, _ = read_erp_export(file_content, filename, args.hoja, args.motor)
+        if ok:
+            fecha = erp_report_date(filename, fecha_default)
+            resumen, ok, error = load_erp_into_historico(df, fecha, args.zona, args.db)
+        if ok:
+            log(f"💾 {filename} → {fecha:%Y-%m-%d}: {resumen['filas']} filas "
+                f"({resumen['nuevas']} nuevas, {resumen['actualizadas']} actualizadas) en {resumen['segundos']:.2f}s")
+        else:
+            errores += 1
+            log(f"❌ {filename}: {error}")
+
+    log(f"✅ {len(files) - errores}/{len(files)} archivos cargados en {args.db}")
+    if errores == len(files):
+        raise ValueError("Ningún archivo se pudo cargar en el histórico")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Analizador de inventarios negativos (sin interfaz web)")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    analizar = subparsers.add_parser("analizar", help="Analiza reportes diarios reporte_all_YYYYMMDD*.xlsx")
+    analizar.add_argument("entrada", help="Carpeta o archivo .zip con los reportes diarios")
+    analizar.add_argument("--salida", required=True, help="Directorio donde escribir resultados")
+    analizar.add_argument("--top-n", type=int, default=10, help="Pallets de la hoja Top N")
+    analizar.add_argument("--procesos", type=int, default=default_ingest_workers(),
+                          help="Procesos de lectura en paralelo")
+    analizar.add_argument("--motor", choices=READER_ENGINES, default=DEFAULT_READER_ENGINE,
+                          help="Motor de lectura de Excel")
+    analizar.add_argument("--compacto", action="store_true", help="Usar tipos compactos (menos memoria)")
+    analizar.add_argument("--disperso", action="store_true", help="Súper análisis en formato largo")
+    analizar.add_argument("--medir-memoria", action="store_true", help="Medir memoria por etapa con tracemalloc")
+    analizar.add_argument("--memoria-constante", action="store_true",
+                          help=f"Escribir el reporte Excel fila a fila directo a disco (automático desde {LARGE_REPORT_ROWS} filas)")
+    analizar.add_argument(
+        "--formato", choices=["parquet", "csv", "ninguno"],
+        default="parquet" if importlib.util.find_spec("pyarrow") else "csv",
+        help="Formato de las tablas intermedias"
+    )
+    analizar.add_argument(
+        "--paquete", nargs="?", choices=BUNDLE_FORMATS, const=default_bundle_format(),
+        help="Escribir además un .zip columnar con todas las tablas (por defecto parquet si hay pyarrow)"
+    )
+    analizar.add_argument("-q", "--silencioso", action="store_true", help="No mostrar el log")
+    analizar.set_defaults(func=run_analysis)
+
+    preprocesar = subparsers.add_parser("preprocesar", help="Convierte exportaciones crudas del ERP en reportes diarios")
+    preprocesar.add_argument("entrada", nargs="+", help="Archivos Excel, carpetas o .zip con exportaciones del ERP")
+    preprocesar.add_argument("--salida", required=True, help="Directorio donde escribir los reportes")
+    preprocesar.add_argument("--hoja", type=int, default=0, help="Índice de la hoja a procesar")
+    preprocesar.add_argument("--fecha", help="Fecha YYYY-MM-DD para archivos sin fecha en el nombre (por defecto hoy)")
+    preprocesar.add_argument("--procesos", type=int, default=default_ingest_workers(),
+                             help="Archivos que se procesan en paralelo")
+    preprocesar.add_argument("--motor", choices=READER_ENGINES, default=DEFAULT_READER_ENGINE,
+                             help="Motor de lectura de Excel")
+    preprocesar.add_argument("--zip", action="store_true", help="Empaquetar los reportes en un solo .zip")
+    preprocesar.add_argument("-q", "--silencioso", action="store_true", help="No mostrar el log")
+    preprocesar.set_defaults(func=run_preprocess)
+
+    historico = subparsers.add_parser(
+        "cargar-historico", help="Preprocesa exportaciones del ERP y las guarda en la base histórica local"
+    )
+    historico.add_argument("entrada", nargs="+", help="Archivos Excel, carpetas o .zip con exportaciones del ERP")
+    historico.add_argument("--zona", required=True, help="Zona (CompanyId) de las exportaciones")
+    historico.add_argument("--db", default=str(HISTORICO_DB_PATH), help="Archivo SQLite (se crea si no existe)")
+    historico.add_argument("--hoja", type=int, default=0, help="Índice de la hoja a procesar")
+    historico.add_argument("--fecha", help="Fecha YYYY-MM-DD para archivos sin fecha en el nombre (por defecto hoy)")
+    historico.add_argument("--motor", choices=READER_ENGINES, default=DEFAULT_READER_ENGINE,
+                           help="Motor de lectura de Excel")
+    historico.add_argument("-q", "--silencioso", action="store_true", help="No mostrar el log")
+    historico.set_defaults(func=run_load_historico)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
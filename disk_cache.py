@@ -0,0 +1,136 @@
+"""
+Caché persistente en disco con límite de tamaño y expulsión LRU.
+
+Cada entrada es un archivo <clave><sufijo> dentro de un directorio. La fecha de
+modificación del archivo se usa como "último uso": se actualiza en cada acierto
+y al superar el límite se borran primero las entradas más antiguas.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+# Directorio base configurable (montar un volumen aquí para sobrevivir a redeploys)
+CACHE_ROOT = Path(os.environ.get(
+    "INVENTORY_CACHE_DIR",
+    Path.home() / ".cache" / "inventory-analyzer"
+))
+
+
+def content_hash(data):
+    """Hash SHA-256 del contenido de un archivo (bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dataset_fingerprint(files, base=None):
+    """
+    Huella de un conjunto de archivos de entrada (nombre y hash de contenido, en orden)
+
+    Es encadenada: dataset_fingerprint(a + b) == dataset_fingerprint(b, dataset_fingerprint(a)),
+    de modo que un análisis incremental puede extender la huella del anterior
+    hasheando solo los archivos nuevos.
+
+    Args:
+        files: lista de tuplas (file_content, filename)
+        base: huella de los archivos ya incluidos (None si no hay)
+    """
+    huella = base or ""
+    for file_content, filename in files:
+        huella = hashlib.sha256(f"{huella}|{filename}|{content_hash(file_content)}".encode()).hexdigest()
+    return huella
+
+
+class DiskLRUCache:
+    """Caché de archivos en disco con tamaño máximo y expulsión LRU"""
+
+    def __init__(self, directory, max_bytes, suffix=""):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+
+    def path_for(self, key):
+        """Ruta del archivo asociado a una clave (exista o no)"""
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """
+        Devuelve la ruta de la entrada si existe y la marca como usada
+
+        Returns:
+            Path o None si no está en caché
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, writer):
+        """
+        Guarda una entrada de forma atómica
+
+        Args:
+            key: clave de la entrada
+            writer: función que recibe una ruta temporal y escribe el contenido
+
+        Returns:
+            Path de la entrada guardada
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            writer(tmp_path)
+            path = self.path_for(key)
+            # os.replace es atómico: un lector nunca ve un archivo a medio escribir
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # La entrada recién escrita se conserva aunque por sí sola supere el límite
+        self.evict(keep=path)
+        return path
+
+    def _entries(self):
+        """Lista (mtime, tamaño, ruta) de las entradas actuales"""
+        entries = []
+        if not self.directory.exists():
+            return entries
+        for path in self.directory.glob(f"*{self.suffix}"):
+            if path.name.endswith(".tmp"):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                # Borrada por otro proceso mientras listábamos
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        """Tamaño total ocupado por la caché en bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep=None):
+        """Borra las entradas menos usadas hasta respetar max_bytes (sin tocar `keep`)"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Elimina todas las entradas"""
+        for _, _, path in self._entries():
+            try:
+                path.unlink()
+            except OSError:
+                continue
@@ -0,0 +1,473 @@
+"""
+Preprocesado de exportaciones crudas del ERP sin dependencia de Streamlit.
+
+Convierte el Excel crudo del ERP en un reporte diario reporte_all_YYYYMMDD_HHMMSS.xlsx
+(solo negativos con ID de pallet) y permite procesar un lote de archivos en un
+pool de procesos. Como ingestion, debe poder importarse desde procesos worker.
+"""
+import io
+import multiprocessing
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from ingestion import (
+    DEFAULT_READER_ENGINE, ERP_COLUMN_MAP, ERP_REQUIRED_COLUMNS, default_ingest_workers, iter_negative_rows,
+    sniff_data_sheet,
+)
+from reporting import get_report_cache, report_cache_key
+
+# Columnas del export crudo que pasan al reporte (nombres normalizados)
+ERP_COLUMNS = ["Codigo", "Nombre", "Almacen", "ID_Pallet", "Inventario_Fisico", "Disponible"]
+
+# Filas negativas que se limpian juntas; acota la memoria de la lectura en
+# exportaciones grandes sin perder la vectorización
+ERP_CHUNK_ROWS = 50000
+
+# Fecha en el nombre de la exportación cruda: 20250131, 2025-01-31, 2025_01_31 o 2025.01.31
+_ERP_DATE_PATTERN = re.compile(r"(?<!\d)(20\d{2})[-_.]?(\d{2})[-_.]?(\d{2})(?!\d)")
+
+# Marca que ocupa la fecha de exportación en los reportes de la caché; se
+# reemplaza al descargar (stamp_export_date) para no servir la de la primera vez
+_FECHA_EXPORTACION_MARCA = "__fecha_exportacion__"
+
+BATCH_STATS_COLUMNS = [
+    "archivo", "reporte", "hoja", "estado", "error", "total_productos", "productos_negativos",
+    "pallets_unicos", "filas_filtradas", "total_inventario_fisico", "segundos",
+]
+
+
+def _valid_pallet_mask(serie):
+    """Filas con ID de pallet no nulo ni vacío (solo las columnas de texto se convierten a str)"""
+    validos = serie.notna()
+    if not pd.api.types.is_numeric_dtype(serie):
+        validos &= serie.astype(str).str.strip() != ""
+    return validos
+
+
+def _erp_id_to_int(serie):
+    """
+    Código / ID de pallet como entero, igual que en los archivos antiguos (0 si no es numérico)
+
+    Los valores numéricos se truncan directamente; solo el resto pasa por la
+    limpieza de texto (quitar comas y la parte decimal), en lugar de convertir
+    la columna entera a str y de vuelta a int.
+    """
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype(int)
+    if pd.api.types.is_numeric_dtype(serie):
+        return np.trunc(serie.astype(float)).fillna(0).astype(int)
+
+    es_numero = serie.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool))
+    numeros = pd.Series(np.nan, index=serie.index)
+    numeros[es_numero] = np.trunc(serie[es_numero].astype(float))
+    if not es_numero.all():
+        numeros[~es_numero] = pd.to_numeric(
+            serie[~es_numero]
+            .astype(str)
+            .str.replace(",", "", regex=False)
+            .str.split(".").str[0]
+            .str.strip(),
+            errors='coerce'
+        )
+    return numeros.fillna(0).astype(int)
+
+
+def _clean_erp_chunk(df):
+    """
+    Convierte un bloque de filas negativas al formato final de los archivos antiguos
+
+    Filtra los ID de pallet válidos y construye directamente las columnas finales
+    (Código, Nombre, Almacén, ID de Pallet, Inventario Físico, Disponible).
+    """
+    df = df[_valid_pallet_mask(df["ID_Pallet"])]
+    cantidad = df["Inventario_Fisico"]
+    return pd.DataFrame({
+        "Código": _erp_id_to_int(df["Codigo"]),
+        # Texto para evitar problemas de tipos mixtos
+        "Nombre": df["Nombre"].astype(str),
+        "Almacén": df["Almacen"].astype(str),
+        "ID de Pallet": _erp_id_to_int(df["ID_Pallet"]),
+        "Inventario Físico": cantidad,
+        # Sin columna Disponible se usa el inventario físico
+        "Disponible": df["Disponible"] if "Disponible" in df.columns else cantidad,
+    })
+
+
+def _read_erp_sheet(file_content, sheet_index):
+    """
+    Motor "pandas": lee la hoja completa y entrega sus filas negativas como un único bloque
+
+    Yields:
+        tuple: (df, filas_totales, suma_inventario) como ingestion.iter_negative_rows
+    """
+    df = pd.read_excel(io.BytesIO(file_content), sheet_name=sheet_index).rename(columns=ERP_COLUMN_MAP)
+
+    missing_cols = [col for col in ERP_REQUIRED_COLUMNS if col not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Faltan columnas requeridas: {', '.join(missing_cols)}")
+
+    cantidad = pd.to_numeric(df["Inventario_Fisico"], errors='coerce')
+    negativos = cantidad < 0
+    columnas = [c for c in ERP_COLUMNS if c in df.columns]
+    # Una sola selección (sin copia previa de la hoja para las estadísticas)
+    df_negativos = df.loc[negativos, columnas].assign(Inventario_Fisico=cantidad[negativos])
+    yield df_negativos, len(df), cantidad.sum()
+
+
+def read_erp_export(file_content, filename, sheet_index=0, engine=DEFAULT_READER_ENGINE,
+                    chunk_rows=ERP_CHUNK_ROWS):
+    """
+    Procesa archivo crudo del ERP y lo convierte al formato esperado
+
+    Mapeo de columnas ERP -> App:
+    - Código de artículo -> Código
+    - Nombre del producto -> Nombre
+    - Almacén -> Almacén
+    - Id de pallet -> ID de Pallet
+    - Inventario físico -> Inventario Físico
+    - Física disponible -> Disponible
+
+    Filtros aplicados:
+    - Solo filas con inventario negativo
+    - Solo filas con ID de pallet válido (no vacío)
+
+    Con engine="fast" la hoja se recorre una sola vez en modo read-only leyendo
+    solo las columnas mapeadas: las estadísticas se acumulan durante la lectura
+    y las filas negativas se limpian por bloques de `chunk_rows`, de modo que
+    nunca se materializa la hoja completa.
+
+    Antes de leer se validan los encabezados (ingestion.sniff_data_sheet): si la
+    hoja `sheet_index` no tiene las columnas del ERP se usa la primera que las
+    tenga (stats["hoja"]), y un archivo sin ellas falla sin parsearse.
+    """
+    try:
+        sheet_index, hoja = sniff_data_sheet(
+            file_content, sheet_index, ERP_COLUMN_MAP, ERP_REQUIRED_COLUMNS, ["Inventario_Fisico"]
+        )
+        if engine == "fast":
+            bloques = iter_negative_rows(
+                file_content, sheet_index, ERP_COLUMN_MAP, ERP_COLUMNS, ["Inventario_Fisico"],
+                required=ERP_REQUIRED_COLUMNS, chunk_rows=chunk_rows
+            )
+        else:
+            bloques = _read_erp_sheet(file_content, sheet_index)
+
+        partes = []
+        for df_bloque, total_filas, total_inventario in bloques:
+            partes.append(_clean_erp_chunk(df_bloque))
+
+        # Los bloques vacíos no entran en el concat para no alterar los dtypes
+        no_vacias = [p for p in partes if len(p)] or partes[-1:]
+        df_final = pd.concat(no_vacias, ignore_index=True)
+
+        # Estadísticas
+        stats = {
+            "total_productos": total_filas,
+            "productos_negativos": len(df_final),
+            "total_inventario_fisico": total_inventario,
+            "pallets_unicos": df_final["ID de Pallet"].nunique(),
+            "fecha_exportacion": datetime.now(),
+            "filas_filtradas": len(df_final),
+            "hoja": hoja,
+        }
+
+        return df_final, True, None, stats
+
+    except Exception as e:
+        return None, False, str(e), None
+
+
+def write_preprocessed_report(df_procesado, stats, fecha_suffix=None):
+    """
+    Exporta archivo Excel con formato compatible con el resto de la app
+
+    Estructura:
+    - Hoja 1: Estadísticas Generales
+    - Hoja 2: Datos procesados (negativos con ID pallet)
+
+    Nombre: reporte_all_YYYYMMDD_HHMMSS.xlsx
+
+    Con stats['fecha_exportacion'] = None la fecha queda como una marca que
+    completa stamp_export_date (reportes en caché).
+    """
+    buffer = io.BytesIO()
+
+    # Generar nombre de archivo
+    if fecha_suffix is None:
+        fecha_suffix = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    filename = f"reporte_all_{fecha_suffix}.xlsx"
+
+    try:
+        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+            workbook = writer.book
+
+            # === HOJA 1: Estadísticas Generales ===
+            worksheet_stats = workbook.add_worksheet("Estadísticas")
+
+            # Formatos
+            title_format = workbook.add_format({
+                'bold': True,
+                'font_size': 14,
+                'bg_color': '#1F4E78',
+                'font_color': 'white',
+                'align': 'left',
+                'valign': 'vcenter'
+            })
+
+            label_format = workbook.add_format({
+                'bold': True,
+                'align': 'left'
+            })
+
+            value_format = workbook.add_format({
+                'align': 'left',
+                'num_format': '#,##0.00'
+            })
+
+            # Escribir título
+            worksheet_stats.merge_range('A1:B1', 'Estadísticas Generales', title_format)
+
+            # Escribir estadísticas
+            row = 2
+            worksheet_stats.write(row, 0, 'Total de Productos', label_format)
+            worksheet_stats.write(row, 1, stats['total_productos'], value_format)
+
+            row += 1
+            worksheet_stats.write(row, 0, 'Productos con Inventario Negativo', label_format)
+            worksheet_stats.write(row, 1, stats['productos_negativos'], value_format)
+
+            row += 1
+            worksheet_stats.write(row, 0, 'Total de Inventario Físico', label_format)
+            worksheet_stats.write(row, 1, stats['total_inventario_fisico'], value_format)
+
+            row += 1
+            worksheet_stats.write(row, 0, 'Pallets Únicos', label_format)
+            worksheet_stats.write(row, 1, stats['pallets_unicos'], value_format)
+
+            row += 2
+            fecha_formato = _format_export_date(stats['fecha_exportacion'])
+            worksheet_stats.write(row, 0, 'Fecha de Exportación', label_format)
+            worksheet_stats.write(row, 1, fecha_formato)
+
+            row += 1
+            worksheet_stats.write(row, 0, 'Última Actualización', label_format)
+            worksheet_stats.write(row, 1, fecha_formato)
+
+            # Ajustar columnas
+            worksheet_stats.set_column('A:A', 35)
+            worksheet_stats.set_column('B:B', 25)
+
+            # === HOJA 2: Datos procesados (nombre igual a archivos antiguos) ===
+            df_procesado.to_excel(writer, sheet_name="Inventario Completo (Actual)", index=False)
+
+            # Formatear hoja de datos
+            worksheet_data = writer.sheets["Inventario Completo (Actual)"]
+
+            header_format = workbook.add_format({
+                'bold': True,
+                'bg_color': '#1F4E78',
+                'font_color': 'white',
+                'align': 'center',
+                'valign': 'vcenter',
+                'border': 1
+            })
+
+            # Aplicar formato a encabezados
+            for col_num, value in enumerate(df_procesado.columns.values):
+                worksheet_data.write(0, col_num, value, header_format)
+
+            # Ajustar anchos
+            worksheet_data.set_column('A:A', 12)  # Codigo
+            worksheet_data.set_column('B:B', 35)  # Nombre
+            worksheet_data.set_column('C:C', 10)  # Almacen
+            worksheet_data.set_column('D:D', 18)  # ID_Pallet
+            worksheet_data.set_column('E:F', 15)  # Inventario y Disponible
+
+        buffer.seek(0)
+        return buffer, filename, True, None
+
+    except Exception as e:
+        return None, None, False, str(e)
+
+
+def _format_export_date(fecha):
+    """Texto de la fecha de exportación; la marca de la caché si no hay fecha"""
+    if fecha is None:
+        return _FECHA_EXPORTACION_MARCA
+    return fecha.strftime("%d de %B de %Y, %H:%M")
+
+
+def cached_preprocessed_report(df_procesado, stats, fingerprint, sheet_index=0, engine=DEFAULT_READER_ENGINE):
+    """
+    Reporte preprocesado servido desde la caché de reportes en disco o exportado y guardado en ella
+
+    La clave es la huella del archivo crudo (disk_cache.dataset_fingerprint) con la
+    hoja y el motor, de modo que no hay que hashear df_procesado. El contenido no
+    depende del nombre del reporte: el llamador elige fecha_suffix al descargar.
+    La fecha de exportación tampoco se guarda: el archivo en caché tiene una
+    marca en su lugar y se descarga con stamp_export_date.
+
+    Returns:
+        tuple: (ruta, success, error_message)
+    """
+    cache = get_report_cache()
+    key = report_cache_key(fingerprint, "erp", sheet_index, engine)
+    path = cache.get(key)
+    if path is not None:
+        return path, True, None
+
+    buffer, _, success, error = write_preprocessed_report(df_procesado, {**stats, "fecha_exportacion": None})
+    if not success:
+        return None, False, error
+    return cache.put(key, lambda tmp_path: Path(tmp_path).write_bytes(buffer.getvalue())), True, None
+
+
+def stamp_export_date(path, fecha):
+    """
+    Bytes de un reporte de cached_preprocessed_report con la fecha de exportación
+
+    Solo se reescriben las partes XML del .xlsx que tienen la marca (las cadenas
+    compartidas); la hoja de datos se copia tal cual sin volver a generarla.
+    """
+    marca = _FECHA_EXPORTACION_MARCA.encode()
+    texto = escape(_format_export_date(fecha)).encode()
+    salida = io.BytesIO()
+    with zipfile.ZipFile(path) as origen, zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as destino:
+        for info in origen.infolist():
+            datos = origen.read(info)
+            if info.filename.endswith(".xml") and marca in datos:
+                datos = datos.replace(marca, texto)
+            destino.writestr(info, datos)
+    return salida.getvalue()
+
+
+def erp_report_date(filename, default=None):
+    """
+    Fecha de una exportación cruda a partir de su nombre
+
+    Returns:
+        date: la primera fecha válida del nombre, o `default` si no tiene
+    """
+    for match in _ERP_DATE_PATTERN.finditer(filename):
+        try:
+            return datetime.strptime("".join(match.groups()), "%Y%m%d").date()
+        except ValueError:
+            continue
+    return default
+
+
+def _preprocess_erp_task(args):
+    """
+    Preprocesa y exporta un archivo crudo (adaptador para executor.map)
+
+    Devuelve solo los bytes del reporte para no enviar el DataFrame entre procesos.
+
+    Returns:
+        tuple: (contenido_xlsx o None, fila de estadísticas)
+    """
+    file_content, filename, sheet_index, engine, fecha_suffix = args
+    inicio = time.perf_counter()
+    fila = {"archivo": filename, "reporte": None, "estado": "error", "error": None}
+
+    df_procesado, success, error, stats = read_erp_export(file_content, filename, sheet_index, engine)
+    if success:
+        buffer, reporte, success, error = write_preprocessed_report(df_procesado, stats, fecha_suffix)
+        fila.update({k: stats[k] for k in BATCH_STATS_COLUMNS if k in stats})
+
+    contenido = None
+    if success:
+        contenido = buffer.getvalue()
+        fila.update(reporte=reporte, estado="ok")
+    else:
+        fila["error"] = error
+    fila["segundos"] = round(time.perf_counter() - inicio, 3)
+    return contenido, fila
+
+
+def _batch_suffixes(files, fecha_default):
+    """
+    Sufijo YYYYMMDD_HHMMSS de cada reporte del lote
+
+    La fecha sale del nombre del archivo crudo (o `fecha_default`) y la hora es la
+    del lote; si dos archivos caen en la misma fecha se añade _2, _3... para que
+    no se pisen dentro del zip.
+    """
+    hora = datetime.now().strftime("%H%M%S")
+    fecha_default = fecha_default or datetime.now().date()
+    vistos = {}
+    sufijos = []
+    for _, filename in files:
+        base = f"{erp_report_date(filename, fecha_default):%Y%m%d}_{hora}"
+        vistos[base] = vistos.get(base, 0) + 1
+        sufijos.append(base if vistos[base] == 1 else f"{base}_{vistos[base]}")
+    return sufijos
+
+
+def batch_stats_frame(filas):
+    """Tabla de estadísticas del lote (enteros nulables para las filas con error)"""
+    df = pd.DataFrame(filas, columns=BATCH_STATS_COLUMNS)
+    conteos = ["total_productos", "productos_negativos", "pallets_unicos", "filas_filtradas"]
+    return df.astype(dict.fromkeys(conteos, "Int64"))
+
+
+def preprocess_erp_files(files, sheet_index=0, engine=DEFAULT_READER_ENGINE, fecha_default=None, max_workers=None):
+    """
+    Preprocesa un lote de exportaciones crudas en un pool de procesos
+
+    Args:
+        files: lista de tuplas (file_content, filename)
+        sheet_index: hoja a procesar en cada archivo
+        engine: motor de lectura ("fast" o "pandas")
+        fecha_default: fecha para los archivos sin fecha en el nombre (por defecto hoy)
+        max_workers: número de procesos (por defecto default_ingest_workers())
+
+    Yields:
+        tuple: (contenido_xlsx o None, fila de estadísticas) en el orden de `files`
+    """
+    tasks = [
+        (file_content, filename, sheet_index, engine, sufijo)
+        for (file_content, filename), sufijo in zip(files, _batch_suffixes(files, fecha_default))
+    ]
+    if max_workers is None:
+        max_workers = default_ingest_workers()
+    max_workers = max(1, min(max_workers, len(tasks)))
+
+    # Con un solo proceso no compensa el arranque del pool
+    if max_workers == 1:
+        yield from map(_preprocess_erp_task, tasks)
+        return
+
+    # "spawn" evita hacer fork de un servidor con hilos activos (Streamlit)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+        yield from executor.map(_preprocess_erp_task, tasks)
+
+
+def preprocess_erp_batch(files, sheet_index=0, engine=DEFAULT_READER_ENGINE, fecha_default=None, max_workers=None):
+    """
+    Preprocesa un lote y empaqueta los reportes generados en un zip
+
+    Returns:
+        tuple: (zip_buffer, df_stats) con una fila de estadísticas por archivo,
+        incluidos los que fallaron (estado "error")
+    """
+    buffer = io.BytesIO()
+    filas = []
+    # Los .xlsx ya van comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for contenido, fila in preprocess_erp_files(files, sheet_index, engine, fecha_default, max_workers):
+            if contenido is not None:
+                zf.writestr(fila["reporte"], contenido)
+            filas.append(fila)
+
+    buffer.seek(0)
+    return buffer, batch_stats_frame(filas)
@@ -0,0 +1,783 @@
+"""
+Base de datos histórica local (SQLite, tabla inventario) sin dependencia de Streamlit.
+
+El modo Histórico DB lee la tabla `inventario` (una fila por fecha, zona,
+almacén, producto y pallet). Este módulo permite cargar en una copia local de
+esa base el resultado del preprocesado del ERP (erp.read_erp_export) sin pasar
+por un Excel intermedio: upsert_inventario escribe el día completo en una sola
+transacción, con inserciones parametrizadas por lotes y un upsert idempotente
+sobre la clave (fecha, CompanyId, InventLocationId, ProductId, LabelId).
+
+fetch_historico_db mantiene además una copia persistente de la base publicada en
+GitHub: pide el archivo con If-None-Match (ETag) y solo lo descarga si cambió.
+La descarga va por bloques a disco, se reanuda con Range tras un corte y acepta
+el artefacto comprimido (gzip o zstd); la copia nueva se valida, se indexa para
+las consultas del dashboard (ensure_query_indexes + ANALYZE), se activa de forma
+atómica y las anteriores se borran.
+
+Para el modo Histórico DB, query_historico traduce los filtros de la vista a un
+WHERE parametrizado y lee solo las filas y columnas seleccionadas, e
+historico_summary da las opciones de los filtros sin cargar el histórico.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from disk_cache import CACHE_ROOT
+
+try:
+    import zstandard
+except ImportError:  # opcional: solo para artefactos .zst
+    zstandard = None
+
+# Copia local de negativos_inventario.db (configurable para apuntar a un volumen)
+HISTORICO_DB_PATH = Path(os.environ.get("INVENTORY_HISTORICO_DB", CACHE_ROOT / "negativos_inventario.db"))
+
+# Base publicada (repositorio privado, API de contenidos de GitHub; configurable para pruebas o espejos)
+HISTORICO_DB_URL = os.environ.get(
+    "INVENTORY_HISTORICO_DB_URL",
+    "https://api.github.com/repos/Sinsapiar1/alsina-negativos-db/contents/negativos_inventario.db"
+)
+# Copias descargadas: negativos_inventario-<hash>.db y los metadatos de la última descarga
+REMOTE_DB_DIR = CACHE_ROOT / "historico"
+REMOTE_DB_PREFIX = "negativos_inventario-"
+REMOTE_DB_META = "remoto.json"
+REMOTE_PARTIAL_META = "descarga.json"
+# La app pregunta a GitHub como mucho cada 15 minutos
+REMOTE_CHECK_SECONDS = 15 * 60
+DOWNLOAD_TIMEOUT = 30
+# Bloques chicos: un corte solo pierde el bloque en curso, el resto queda en el .part
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# Reintentos dentro de una llamada; cada uno reanuda desde el último byte recibido
+DOWNLOAD_RETRIES = 3
+# Descargas interrumpidas (.part/.tmp) que ya no se reanudan y se pueden borrar
+STALE_DOWNLOAD_SECONDS = 24 * 3600
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+DECOMPRESS_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+_DOWNLOAD_LOCK = threading.Lock()
+
+# La tabla publicada solo trae la clave primaria id: en la copia descargada se crean
+# índices para los filtros del modo Histórico DB (rango de fechas con zona/almacén,
+# que tras ANALYZE también sirve sin fecha por skip-scan, y códigos de producto)
+QUERY_INDEXES = {
+    "ix_inventario_fecha_zona_almacen": ["fecha", "CompanyId", "InventLocationId"],
+    "ix_inventario_producto_pallet_fecha": ["ProductId", "LabelId", "fecha"],
+}
+# Sube al cambiar QUERY_INDEXES: las copias ya descargadas se reindexan una vez
+QUERY_INDEX_VERSION = 1
+
+INVENTARIO_KEY = ["fecha", "CompanyId", "InventLocationId", "ProductId", "LabelId"]
+INVENTARIO_COLUMNS = INVENTARIO_KEY + ["ProductName_es", "Stock", "CostStock", "created_at"]
+
+# Filas que se convierten a tuplas y se pasan a executemany a la vez
+INSERT_BATCH_ROWS = 10000
+# Columnas que usa el modo Histórico DB (sin id ni created_at)
+HISTORICO_QUERY_COLUMNS = [
+    "fecha", "CompanyId", "InventLocationId", "ProductId", "ProductName_es", "LabelId", "Stock", "CostStock"
+]
+# Códigos con pocos valores distintos que se leen como categorías (LabelId es casi
+# único por pallet y queda como texto)
+HISTORICO_CATEGORICAL_COLUMNS = ["CompanyId", "InventLocationId", "ProductId", "ProductName_es"]
+# Filas por bloque al leer del histórico: acota los objetos Python vivos a la vez
+HISTORICO_READ_CHUNK_ROWS = 50000
+
+INVENTARIO_DDL = """
+CREATE TABLE IF NOT EXISTS inventario (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    CompanyId TEXT NOT NULL,
+    InventLocationId TEXT NOT NULL,
+    ProductId TEXT NOT NULL,
+    ProductName_es TEXT,
+    LabelId TEXT,
+    Stock INTEGER NOT NULL,
+    CostStock REAL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# ON CONFLICT necesita un índice único sobre exactamente la clave del upsert
+INVENTARIO_KEY_INDEX = (
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_inventario_clave ON inventario ({', '.join(INVENTARIO_KEY)})"
+)
+
+# Una sola sentencia para todo el lote: sqlite3 la prepara una vez y la reutiliza
+# en cada fila. Al actualizar se conserva created_at y el costo si el nuevo es NULL.
+UPSERT_SQL = f"""
+INSERT INTO inventario ({', '.join(INVENTARIO_COLUMNS)})
+VALUES ({', '.join('?' * len(INVENTARIO_COLUMNS))})
+ON CONFLICT ({', '.join(INVENTARIO_KEY)}) DO UPDATE SET
+    ProductName_es = excluded.ProductName_es,
+    Stock = excluded.Stock,
+    CostStock = COALESCE(excluded.CostStock, inventario.CostStock)
+"""
+
+
+def historico_db_version(db_path):
+    """
+    Versión del archivo de la base (cambia con cada escritura)
+
+    Sirve como argumento extra de st.cache_data para no leer datos viejos tras
+    una carga. None si el archivo no existe.
+    """
+    try:
+        info = os.stat(db_path)
+    except OSError:
+        return None
+    return f"{info.st_mtime_ns}-{info.st_size}"
+
+
+def ensure_inventario_schema(conn):
+    """
+    Crea la tabla inventario y el índice único de la clave si no existen
+
+    Raises:
+        ValueError: si la tabla ya tiene filas repetidas en la clave (no admite el índice único)
+    """
+    conn.execute(INVENTARIO_DDL)
+    try:
+        conn.execute(INVENTARIO_KEY_INDEX)
+    except sqlite3.IntegrityError:
+        raise ValueError(
+            f"La tabla inventario tiene filas repetidas en ({', '.join(INVENTARIO_KEY)}); "
+            "elimina los duplicados antes de cargar datos"
+        ) from None
+
+
+def erp_inventario_frame(df_procesado, fecha, company_id):
+    """
+    Convierte la salida de erp.read_erp_export a las columnas de la tabla inventario
+
+    El export del ERP no trae la zona ni el costo: CompanyId se recibe como
+    parámetro y CostStock queda NULL (el upsert conserva el costo ya cargado).
+
+    Returns:
+        DataFrame con INVENTARIO_COLUMNS
+    """
+    if not company_id:
+        raise ValueError("Falta la zona (CompanyId) de la exportación")
+    return pd.DataFrame({
+        "fecha": pd.Timestamp(fecha).strftime("%Y-%m-%d"),
+        "CompanyId": str(company_id),
+        "InventLocationId": df_procesado["Almacén"].astype(str),
+        "ProductId": df_procesado["Código"].astype(str),
+        "LabelId": df_procesado["ID de Pallet"].astype(str),
+        "ProductName_es": df_procesado["Nombre"].astype(str),
+        "Stock": df_procesado["Inventario Físico"],
+        "CostStock": None,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }, index=df_procesado.index)
+
+
+def _row_batches(df, batch_rows):
+    """Tuplas de parámetros por lotes de `batch_rows` filas (NaN -> NULL)"""
+    for inicio in range(0, len(df), batch_rows):
+        bloque = df.iloc[inicio:inicio + batch_rows]
+        columnas = [s.astype(object).where(s.notna(), None).tolist() for _, s in bloque.items()]
+        yield list(zip(*columnas))
+
+
+def upsert_inventario(df_inventario, db_path=HISTORICO_DB_PATH, batch_rows=INSERT_BATCH_ROWS):
+    """
+    Inserta o actualiza filas de la tabla inventario en una sola transacción
+
+    Si la carga falla no queda nada a medias (rollback). Volver a cargar el
+    mismo día actualiza las filas en lugar de duplicarlas. Si el frame repite
+    una clave, prevalece la última fila.
+
+    Args:
+        df_inventario: DataFrame con INVENTARIO_COLUMNS (ver erp_inventario_frame)
+        db_path: archivo SQLite (se crea con la tabla si no existe)
+        batch_rows: filas por llamada a executemany
+
+    Returns:
+        tuple: (resumen, success, error_message); resumen con filas, nuevas,
+            actualizadas y segundos
+    """
+    inicio = time.perf_counter()
+    try:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_inventario_schema(conn)
+            antes = conn.execute("SELECT COUNT(*) FROM inventario").fetchone()[0]
+            # El context manager hace commit al final o rollback si algo falla
+            with conn:
+                for lote in _row_batches(df_inventario[INVENTARIO_COLUMNS], batch_rows):
+                    conn.executemany(UPSERT_SQL, lote)
+            nuevas = conn.execute("SELECT COUNT(*) FROM inventario").fetchone()[0] - antes
+        finally:
+            conn.close()
+
+        resumen = {
+            "filas": len(df_inventario),
+            "nuevas": nuevas,
+            "actualizadas": len(df_inventario) - nuevas,
+            "segundos": round(time.perf_counter() - inicio, 2),
+        }
+        return resumen, True, None
+
+    except (sqlite3.Error, ValueError) as e:
+        return None, False, str(e)
+
+
+def load_erp_into_historico(df_procesado, fecha, company_id, db_path=HISTORICO_DB_PATH):
+    """
+    Carga un día preprocesado del ERP en la base histórica local
+
+    Returns:
+        tuple: (resumen, success, error_message) como upsert_inventario
+    """
+    try:
+        df_inventario = erp_inventario_frame(df_procesado, fecha, company_id)
+    except (KeyError, ValueError) as e:
+        return None, False, str(e)
+    return upsert_inventario(df_inventario, db_path)
+
+
+def _typed_piece(columna, serie):
+    """Convierte la columna de un bloque leído de SQLite a su tipo de trabajo"""
+    if columna == "fecha":
+        # Pocas fechas distintas: se parsean una vez por valor, no por fila
+        codes, fechas = pd.factorize(serie)
+        return codes.astype(np.int32), pd.to_datetime(fechas)
+    if columna in HISTORICO_CATEGORICAL_COLUMNS:
+        codes, valores = pd.factorize(serie)
+        return codes.astype(np.int32), np.asarray(valores, dtype=object)
+    if columna == "Stock":
+        return pd.to_numeric(serie, errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    if columna == "CostStock":
+        # NO rellenar CostStock con 0, mantener NaN para detectar problemas
+        return pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64)
+    return serie
+
+
+def _concat_codes(piezas, sort=True):
+    """
+    Une bloques (códigos, valores) de pd.factorize en un diccionario común
+
+    Returns:
+        tuple: (códigos int32 sobre las categorías, categorías ordenadas)
+    """
+    categorias = pd.Index(pd.unique(np.concatenate([np.asarray(v, dtype=object) for _, v in piezas])))
+    if sort:
+        categorias = categorias.sort_values()
+    codigos = []
+    for codes, valores in piezas:
+        mapa = categorias.get_indexer(valores).astype(np.int32)
+        codigos.append(np.where(codes < 0, -1, mapa[codes]) if len(mapa) else codes)
+    return np.concatenate(codigos).astype(np.int32), categorias
+
+
+def _concat_column(columna, piezas):
+    """Une los bloques tipados de una columna en su Series final"""
+    if columna == "fecha":
+        codes, fechas = _concat_codes(piezas)
+        fechas = pd.DatetimeIndex(fechas)
+        return pd.Series(fechas.take(np.where(codes < 0, 0, codes)).where(codes >= 0), name=columna)
+    if columna in HISTORICO_CATEGORICAL_COLUMNS:
+        codes, categorias = _concat_codes(piezas)
+        return pd.Series(pd.Categorical.from_codes(codes, categories=categorias), name=columna)
+    if columna == "Stock":
+        stock = np.concatenate(piezas)
+        # Unidades enteras (el caso normal) en int32; si hay decimales se dejan en float64
+        if len(stock) == 0 or (np.all(np.mod(stock, 1) == 0) and np.abs(stock).max() < 2 ** 31):
+            stock = stock.astype(np.int32)
+        return pd.Series(stock, name=columna)
+    if columna == "CostStock":
+        return pd.Series(np.concatenate(piezas), name=columna)
+    return pd.concat(piezas, ignore_index=True).rename(columna)
+
+
+def read_historico_frame(conn, sql, params=(), chunk_rows=HISTORICO_READ_CHUNK_ROWS):
+    """
+    Lee una consulta sobre inventario por bloques y con tipos compactos
+
+    Cada bloque se convierte apenas se lee (fechas parseadas una vez por valor,
+    códigos como categorías, Stock int32 y CostStock float64), así que en
+    memoria solo conviven el resultado y un bloque de objetos Python.
+
+    Returns:
+        DataFrame con las columnas de la consulta
+    """
+    partes = None
+    for bloque in pd.read_sql_query(sql, conn, params=params, chunksize=chunk_rows):
+        if partes is None:
+            partes = {columna: [] for columna in bloque.columns}
+        for columna in bloque.columns:
+            partes[columna].append(_typed_piece(columna, bloque[columna]))
+        del bloque
+
+    datos = {}
+    for columna, piezas in partes.items():
+        datos[columna] = _concat_column(columna, piezas)
+        piezas.clear()
+    return pd.DataFrame(datos)
+
+
+def build_historico_where(zonas=None, almacenes=None, fecha_desde=None, fecha_hasta=None,
+                          solo_negativos=False, buscar=None, excluir=(), incluir=()):
+    """
+    Cláusula WHERE parametrizada con los filtros del modo Histórico DB
+
+    None (o vacío en buscar/excluir/incluir) significa "sin filtro"; una lista
+    vacía de zonas o almacenes no deja pasar ninguna fila, igual que en la app.
+
+    Args:
+        zonas, almacenes: valores de CompanyId / InventLocationId
+        fecha_desde, fecha_hasta: fechas incluidas en el rango (date o Timestamp)
+        solo_negativos: Stock < 0, o Stock = 0 con CostStock < 0 (Stock NULL o no
+            numérico cuenta como 0, como pd.to_numeric(errors="coerce").fillna(0))
+        buscar: texto contenido en ProductId (sin distinguir mayúsculas)
+        excluir, incluir: códigos de ProductId exactos
+
+    Returns:
+        tuple: (sql, params) con sql vacío si no hay filtros
+    """
+    condiciones, params = [], []
+
+    def _in(columna, valores, negado=False):
+        if not valores:
+            condiciones.append("1 = 1" if negado else "0 = 1")
+            return
+        condiciones.append(f"{columna} {'NOT IN' if negado else 'IN'} ({', '.join('?' * len(valores))})")
+        params.extend(valores)
+
+    if zonas is not None:
+        _in("CompanyId", list(zonas))
+    if almacenes is not None:
+        _in("InventLocationId", list(almacenes))
+    # fecha es texto ISO: comparar contra el día siguiente incluye fechas con hora
+    if fecha_desde is not None:
+        condiciones.append("fecha >= ?")
+        params.append(pd.Timestamp(fecha_desde).strftime("%Y-%m-%d"))
+    if fecha_hasta is not None:
+        condiciones.append("fecha < ?")
+        params.append((pd.Timestamp(fecha_hasta) + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+    if solo_negativos:
+        # La base publicada no garantiza Stock NOT NULL ni numérico: se convierte como al leerla
+        stock = "COALESCE(CAST(Stock AS NUMERIC), 0)"
+        condiciones.append(f"({stock} < 0 OR ({stock} = 0 AND CAST(CostStock AS NUMERIC) < 0))")
+    if buscar:
+        condiciones.append("instr(lower(ProductId), lower(?)) > 0")
+        params.append(str(buscar))
+    if excluir:
+        _in("ProductId", list(excluir), negado=True)
+    if incluir:
+        _in("ProductId", list(incluir))
+
+    if not condiciones:
+        return "", params
+    return "WHERE " + " AND ".join(condiciones), params
+
+
+def query_historico(db_path, columnas=HISTORICO_QUERY_COLUMNS, **filtros):
+    """
+    Lee del histórico solo las filas y columnas que pide la vista
+
+    Los filtros (ver build_historico_where) se resuelven en SQLite, así que la
+    memoria y el tiempo dependen de la selección y no del histórico completo.
+    Las filas se leen por bloques con tipos compactos (read_historico_frame).
+
+    Returns:
+        tuple: (df, success, error_message)
+    """
+    where, params = build_historico_where(**filtros)
+    sql = f"SELECT {', '.join(columnas)} FROM inventario {where} ORDER BY fecha DESC"
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            df = read_historico_frame(conn, sql, params)
+        finally:
+            conn.close()
+        return df, True, None
+    except Exception as e:
+        return None, False, f"Error al cargar datos: {str(e)}"
+
+
+def historico_summary(db_path):
+    """
+    Resumen del histórico para la cabecera y las opciones de los filtros
+
+    Returns:
+        tuple: (resumen, success, error_message); resumen con registros (int),
+            fechas (lista ordenada de Timestamp) y zonas_almacenes (DataFrame
+            CompanyId / InventLocationId sin repetidos)
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            registros = conn.execute("SELECT COUNT(*) FROM inventario").fetchone()[0]
+            fechas = pd.read_sql_query("SELECT DISTINCT fecha FROM inventario", conn)["fecha"]
+            zonas_almacenes = pd.read_sql_query(
+                "SELECT DISTINCT CompanyId, InventLocationId FROM inventario", conn
+            )
+        finally:
+            conn.close()
+    except Exception as e:
+        return None, False, f"Error al cargar datos: {str(e)}"
+    return {
+        "registros": registros,
+        "fechas": sorted(pd.to_datetime(fechas).unique()),
+        "zonas_almacenes": zonas_almacenes,
+    }, True, None
+
+
+def validate_historico_db(db_path):
+    """
+    Comprueba que el archivo es una base SQLite con la tabla inventario
+
+    Raises:
+        ValueError: si no tiene la tabla (sqlite3.Error si no es una base SQLite)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='inventario'")
+        if not cursor.fetchone():
+            raise ValueError("La tabla 'inventario' no existe en la base de datos")
+    finally:
+        conn.close()
+
+
+def ensure_query_indexes(db_path):
+    """
+    Crea los índices de QUERY_INDEXES que falten y actualiza las estadísticas
+    del planificador (ANALYZE)
+
+    Returns:
+        float: segundos empleados
+    """
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for nombre, columnas in QUERY_INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON inventario ({', '.join(columnas)})")
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return round(time.perf_counter() - inicio, 2)
+
+
+def _read_remote_meta(directory):
+    """Metadatos de la copia activa ({} si no hay copia o el archivo ya no existe)"""
+    try:
+        meta = json.loads((Path(directory) / REMOTE_DB_META).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return meta if (Path(directory) / meta.get("archivo", "")).is_file() else {}
+
+
+def _write_remote_meta(directory, meta):
+    """Escribe los metadatos de forma atómica (un lector nunca ve un JSON a medias)"""
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, Path(directory) / REMOTE_DB_META)
+
+
+def gc_remote_copies(directory, keep):
+    """Borra las copias descargadas distintas de `keep` y los temporales abandonados"""
+    limite = time.time() - STALE_DOWNLOAD_SECONDS
+    for path in Path(directory).glob(f"{REMOTE_DB_PREFIX}*"):
+        if path.name == keep:
+            continue
+        try:
+            # Una descarga reciente puede estar en curso o pendiente de reanudar
+            if path.suffix in (".part", ".tmp") and path.stat().st_mtime > limite:
+                continue
+            path.unlink()
+        except OSError:
+            # En Windows una copia abierta no se puede borrar: se reintenta en la próxima descarga
+            continue
+
+
+class _ResumableDownload:
+    """
+    Descarga en bloques a un .part que sobrevive a los cortes de red
+
+    Los bytes recibidos se escriben tal cual en el .part (para poder reanudar con
+    Range) y, si el artefacto viene comprimido con gzip o zstd, se descomprimen
+    al vuelo en un temporal aparte. Al reanudar, el tramo ya descargado se vuelve
+    a pasar por el descompresor y el hash desde disco.
+    """
+
+    def __init__(self, directory):
+        self.parcial = Path(directory) / f"{REMOTE_DB_PREFIX}descarga.part"
+        self.meta_path = Path(directory) / REMOTE_PARTIAL_META
+        self.salida_path = Path(directory) / f"{REMOTE_DB_PREFIX}descarga.db.tmp"
+        self._part = None
+        self._salida = None
+
+    def resumable_from(self, url):
+        """Bytes ya descargados de `url` y su ETag ((0, None) si no se puede reanudar)"""
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            offset = self.parcial.stat().st_size
+        except (OSError, ValueError):
+            return 0, None
+        if meta.get("url") != url or not meta.get("etag"):
+            return 0, None
+        return offset, meta["etag"]
+
+    def open(self, url, etag, offset):
+        """Prepara la escritura desde `offset` (0 = empezar de cero)"""
+        self.close()
+        self.sha = hashlib.sha256()
+        self.formato = None
+        self._descompresor = None
+        self._cabecera = b""
+        self.meta_path.write_text(json.dumps({"url": url, "etag": etag}), encoding="utf-8")
+        if offset:
+            with open(self.parcial, "rb") as f:
+                for bloque in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b""):
+                    self._consume(bloque)
+            self._part = open(self.parcial, "ab")
+        else:
+            self._part = open(self.parcial, "wb")
+
+    def write(self, bloque):
+        self._part.write(bloque)
+        self._consume(bloque)
+
+    def _consume(self, bloque):
+        if self.formato is None:
+            self._cabecera += bloque
+            if len(self._cabecera) < 4:
+                return
+            bloque, self._cabecera = self._cabecera, b""
+            self.formato, self._descompresor = _decompressor_for(bloque)
+            if self._descompresor is not None:
+                self._salida = open(self.salida_path, "wb")
+        if self._descompresor is not None:
+            bloque = self._descompresor.decompress(bloque)
+            self._salida.write(bloque)
+        self.sha.update(bloque)
+
+    def finish(self):
+        """Cierra la descarga y devuelve (ruta del archivo descomprimido, sha256)"""
+        if self.formato is None:
+            # Archivo de menos de 4 bytes: no es una base válida, lo rechaza la validación
+            self.formato = "db"
+            self.sha.update(self._cabecera)
+        if self._descompresor is not None:
+            if not getattr(self._descompresor, "eof", True):
+                raise ValueError(f"El artefacto {self.formato} está incompleto o dañado")
+            resto = self._descompresor.flush()
+            self._salida.write(resto)
+            self.sha.update(resto)
+        self.close()
+        self.meta_path.unlink(missing_ok=True)
+        if self._descompresor is not None:
+            self.parcial.unlink(missing_ok=True)
+            return str(self.salida_path), self.sha.hexdigest()
+        return str(self.parcial), self.sha.hexdigest()
+
+    def close(self):
+        for handle in (self._part, self._salida):
+            if handle is not None:
+                handle.close()
+        self._part = self._salida = None
+
+    def discard(self):
+        """Descarta lo descargado (archivo inválido: no tiene sentido reanudarlo)"""
+        self.close()
+        for path in (self.parcial, self.meta_path, self.salida_path):
+            path.unlink(missing_ok=True)
+
+
+def _decompressor_for(cabecera):
+    """(formato, descompresor incremental o None) según los bytes mágicos del artefacto"""
+    if cabecera.startswith(GZIP_MAGIC):
+        return "gzip", zlib.decompressobj(wbits=31)
+    if cabecera.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("La base está comprimida con zstd: instala el paquete 'zstandard' para descargarla")
+        return "zstd", zstandard.ZstdDecompressor().decompressobj()
+    return "db", None
+
+
+def _content_range(response):
+    """(inicio, total) de Content-Range ("bytes 0-99/1000" o "bytes */1000"); None en lo que falte"""
+    coincide = re.fullmatch(r"bytes (?:\*|(\d+)-\d+)/(\d+|\*)", response.headers.get("Content-Range", "").strip())
+    if coincide is None:
+        return None, None
+    inicio, total = coincide.groups()
+    return (int(inicio) if inicio else None), (int(total) if total != "*" else None)
+
+
+def _stream_download(url, headers, timeout, descarga, progress=None):
+    """
+    Descarga `url` con reintentos que reanudan desde el último byte recibido
+
+    Un 416 al reanudar significa que el .part ya tiene el archivo entero (corte
+    entre el último bloque y finish) o que no corresponde al archivo actual: en
+    el primer caso se da por terminada, en el segundo se descarta y se empieza
+    de cero. Lo mismo si un 206 no empieza en el byte pedido.
+
+    Returns:
+        requests.Response de la última petición (304 si no hubo cambios) o None
+            si la descarga terminó
+    """
+    intento = 1
+    while True:
+        offset, etag_parcial = descarga.resumable_from(url)
+        cabeceras = dict(headers)
+        if offset:
+            # If-Range: si el archivo cambió desde el corte, el servidor envía el archivo completo (200)
+            cabeceras["Range"] = f"bytes={offset}-"
+            cabeceras["If-Range"] = etag_parcial
+        try:
+            with requests.get(url, headers=cabeceras, timeout=timeout, stream=True) as response:
+                if response.status_code == 304:
+                    return response
+                if offset and response.status_code == 416:
+                    if _content_range(response)[1] == offset:
+                        descarga.open(url, etag_parcial, offset)
+                        return None
+                    descarga.discard()
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code == 206 and _content_range(response)[0] != offset:
+                    descarga.discard()
+                    continue
+                if response.status_code != 206:
+                    offset = 0
+                descarga.open(url, response.headers.get("ETag"), offset)
+                largo = response.headers.get("Content-Length")
+                total = offset + int(largo) if largo else None
+                descripcion = "Reanudando descarga" if offset else "Descargando base histórica"
+                recibidos = offset
+                for bloque in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                    descarga.write(bloque)
+                    recibidos += len(bloque)
+                    if progress is not None:
+                        progress(recibidos, total, descripcion)
+                if total is not None and recibidos < total:
+                    raise requests.ConnectionError(f"Descarga incompleta: {recibidos} de {total} bytes")
+            return None
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            descarga.close()
+            if intento == DOWNLOAD_RETRIES:
+                raise
+            intento += 1
+
+
+def fetch_historico_db(url=HISTORICO_DB_URL, token=None, directory=REMOTE_DB_DIR, timeout=DOWNLOAD_TIMEOUT,
+                       max_age=0, progress=None):
+    """
+    Copia local de la base histórica publicada, descargada solo si cambió
+
+    Envía If-None-Match con el ETag de la última descarga: con 304 se reutiliza
+    la copia local sin transferir nada. Una descarga nueva se escribe en bloques
+    a disco; si la conexión se corta se reanuda con Range (en la misma llamada
+    o en la siguiente), y un artefacto .gz/.zst se descomprime al vuelo. El
+    resultado se valida (tabla inventario) y se activa con os.replace como
+    negativos_inventario-<hash>.db; las copias anteriores se borran. Si la red
+    falla y hay una copia local, se usa esa copia y se informa en error_message.
+
+    Args:
+        url: URL del archivo (API de contenidos de GitHub o cualquier servidor HTTP)
+        token: token de GitHub (None para servidores sin autenticación)
+        directory: directorio de la caché persistente
+        max_age: segundos durante los que una copia recién comprobada se usa sin
+            preguntar al servidor
+        progress: callable(bytes_recibidos, bytes_totales o None, descripcion)
+
+    Returns:
+        tuple: (db_path, success, error_message, info); info con estado
+            ("descargada", "sin_cambios", "reciente" o "sin_conexion"), etag y descargado
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # Una sola descarga por proceso: las sesiones que esperan encuentran la copia ya comprobada
+    with _DOWNLOAD_LOCK:
+        meta = _read_remote_meta(directory)
+        actual = str(directory / meta["archivo"]) if meta else None
+        if actual is not None and meta.get("indices") != QUERY_INDEX_VERSION:
+            try:
+                ensure_query_indexes(actual)
+                meta["indices"] = QUERY_INDEX_VERSION
+                _write_remote_meta(directory, meta)
+            except sqlite3.Error:
+                # Sin índices la copia sigue siendo válida (solo más lenta); se reintenta en la próxima llamada
+                pass
+        if actual is not None and time.time() - meta.get("comprobado", 0) < max_age:
+            return actual, True, None, dict(meta, estado="reciente")
+
+        # Contenido binario directo (sin JSON/base64) en la API de GitHub; identity
+        # para que los offsets de Range sean bytes del archivo
+        headers = {"Accept": "application/vnd.github.v3.raw", "Accept-Encoding": "identity"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        descarga = _ResumableDownload(directory)
+        try:
+            response = _stream_download(url, headers, timeout, descarga, progress)
+            if response is not None and actual is not None:
+                meta["comprobado"] = time.time()
+                _write_remote_meta(directory, meta)
+                return actual, True, None, dict(meta, estado="sin_cambios")
+            if response is not None:
+                # 304 sin copia local (metadatos borrados a mano): se pide el archivo completo
+                headers.pop("If-None-Match", None)
+                _stream_download(url, headers, timeout, descarga, progress)
+            etag = descarga.resumable_from(url)[1]
+            tmp_path, sha = descarga.finish()
+
+            validate_historico_db(tmp_path)
+            # Antes de activarla, para que ninguna sesión lea la copia sin índices
+            segundos_indices = ensure_query_indexes(tmp_path)
+            nombre = f"{REMOTE_DB_PREFIX}{sha[:16]}.db"
+            # os.replace es atómico: otra sesión ve la copia anterior o la nueva completa
+            os.replace(tmp_path, directory / nombre)
+            meta = {
+                "archivo": nombre, "etag": etag, "sha256": sha, "formato": descarga.formato,
+                "indices": QUERY_INDEX_VERSION, "segundos_indices": segundos_indices,
+                "descargado": datetime.now().isoformat(timespec="seconds"), "comprobado": time.time(),
+            }
+            _write_remote_meta(directory, meta)
+            gc_remote_copies(directory, keep=nombre)
+            return str(directory / nombre), True, None, dict(meta, estado="descargada")
+
+        except requests.HTTPError as e:
+            codigo = e.response.status_code
+            if codigo == 404:
+                return None, False, "Archivo no encontrado (404). Verifica que el archivo 'negativos_inventario.db' existe en el repositorio", None
+            if codigo == 401:
+                return None, False, "Token inválido o sin permisos (401). Verifica que el token tenga scope 'repo'", None
+            error = f"Error HTTP {codigo}: {str(e)}"
+        except requests.RequestException as e:
+            # El .part se conserva: el próximo intento reanuda desde ahí
+            error = f"Error de red: {str(e)}"
+        except sqlite3.Error as e:
+            descarga.discard()
+            return None, False, f"Error de base de datos: {str(e)}", None
+        except DECOMPRESS_ERRORS as e:
+            descarga.discard()
+            return None, False, f"Error descomprimiendo la base ({descarga.formato}): {str(e)}", None
+        except ValueError as e:
+            descarga.discard()
+            return None, False, str(e), None
+        finally:
+            descarga.close()
+
+    # Fallo transitorio (red, 5xx, límite de la API): seguir con la última copia buena
+    if actual is not None:
+        return actual, True, f"{error}. Se usa la copia local del {meta['descargado']}", dict(meta, estado="sin_conexion")
+    return None, False, error, None
@@ -0,0 +1,537 @@
+"""
+Lectura de reportes diarios (reporte_all_YYYYMMDD.xlsx) sin dependencia de Streamlit.
+
+Las funciones de este módulo deben poder importarse desde procesos worker
+(ProcessPoolExecutor), por eso no importan Streamlit ni ejecutan código de UI.
+"""
+import io
+import os
+import importlib.util
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from analysis import compact_pallet_frame
+from disk_cache import CACHE_ROOT, DiskLRUCache, content_hash
+
+# Tabla de renombrado de columnas de los reportes diarios
+REPORT_COLUMN_MAP = {
+    "Código": "Codigo",
+    "Código Producto": "Codigo",
+    "ID de Pallet": "ID_Pallet",
+    "Inventario Físico": "Cantidad_Negativa",
+    "Nombre": "Nombre",
+    "Descripción": "Nombre",
+    "Almacén": "Almacen",
+    "Almacen": "Almacen",
+    "Warehouse": "Almacen",
+    "Ubicación": "Almacen",
+    "Ubicacion": "Almacen",
+}
+
+# Columnas alternativas para la cantidad si no existe "Inventario Físico"
+REPORT_QUANTITY_COLUMNS = ["Cantidad_Negativa", "Cantidad", "Qty", "Inventario", "Stock"]
+REPORT_COLUMNS = ["Codigo", "Nombre", "ID_Pallet", "Almacen"]
+# Sin código y pallet (además de la cantidad) la hoja no es un reporte diario
+REPORT_REQUIRED_COLUMNS = ["Codigo", "ID_Pallet"]
+# Hoja de datos de los reportes diarios (la primera suele ser un resumen)
+REPORT_SHEET_INDEX = 1
+
+# Tabla de renombrado de columnas del export crudo del ERP
+ERP_COLUMN_MAP = {
+    "Código de artículo": "Codigo",
+    "Código": "Codigo",
+    "Codigo de artículo": "Codigo",
+    "Nombre del producto": "Nombre",
+    "Nombre": "Nombre",
+    "Almacén": "Almacen",
+    "Almacen": "Almacen",
+    "Id de pallet": "ID_Pallet",
+    "ID de Pallet": "ID_Pallet",
+    "Id Pallet": "ID_Pallet",
+    "Inventario físico": "Inventario_Fisico",
+    "Inventario Físico": "Inventario_Fisico",
+    "Inventario fisico": "Inventario_Fisico",
+    "Física disponible": "Disponible",
+    "Fisica disponible": "Disponible",
+    "Disponible": "Disponible"
+}
+ERP_REQUIRED_COLUMNS = ["Codigo", "Nombre", "Almacen", "ID_Pallet", "Inventario_Fisico"]
+
+# Motores de lectura: "fast" = openpyxl read-only, solo filas negativas,
+# "pandas" = pd.read_excel de la hoja completa
+READER_ENGINES = ("fast", "pandas")
+DEFAULT_READER_ENGINE = "fast"
+
+EXCEL_SUFFIXES = (".xlsx", ".xls")
+
+# Límite razonable de procesos: openpyxl usa ~1 núcleo por archivo y cada
+# worker carga pandas completo en memoria
+MAX_INGEST_WORKERS = 8
+
+
+# Caché de hojas ya parseadas (Parquet, una entrada por hash de contenido)
+PARSED_CACHE_DIR = CACHE_ROOT / "parsed"
+PARSED_CACHE_MAX_MB = int(os.environ.get("INVENTORY_PARSED_CACHE_MB", "1024"))
+# Subir al cambiar qué se lee de un workbook (hoja, validación, columnas) para no
+# servir entradas viejas. v2: sniff_data_sheet elige la hoja y valida encabezados;
+# el motor rápido conserva todas las columnas
+PARSED_CACHE_VERSION = 2
+
+
+def get_parsed_cache():
+    """
+    Caché en disco de workbooks parseados
+
+    Returns:
+        DiskLRUCache o None si pyarrow no está instalado (Parquet no disponible)
+    """
+    if importlib.util.find_spec("pyarrow") is None:
+        return None
+    return DiskLRUCache(PARSED_CACHE_DIR, PARSED_CACHE_MAX_MB * 1024 * 1024, suffix=".parquet")
+
+
+def arrow_safe_frame(df):
+    """Copia apta para Arrow: nombres de columna de texto y columnas object con tipos mezclados a texto"""
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+
+def to_parquet_safe(df, path):
+    """Escribe Parquet convirtiendo a texto las columnas object con tipos mezclados"""
+    arrow_safe_frame(df).to_parquet(path, index=False)
+
+
+def default_ingest_workers():
+    """Número de procesos por defecto para la ingesta paralela"""
+    return max(1, min(os.cpu_count() or 1, MAX_INGEST_WORKERS))
+
+
+def is_excel_name(name):
+    """True para archivos Excel (ignora temporales de Office "~$" y metadatos de macOS)"""
+    base = Path(name).name
+    return (
+        base.lower().endswith(EXCEL_SUFFIXES)
+        and not base.startswith("~$")
+        and not name.startswith("__MACOSX/")
+    )
+
+
+def read_zip_excel_files(zip_source):
+    """
+    Extrae los archivos Excel de un .zip (ruta o bytes)
+
+    Returns:
+        list: tuplas (file_content, filename) ordenadas por nombre, sin carpetas
+    """
+    if isinstance(zip_source, (bytes, bytearray)):
+        zip_source = io.BytesIO(zip_source)
+    with zipfile.ZipFile(zip_source) as zf:
+        nombres = sorted(
+            (info.filename for info in zf.infolist() if not info.is_dir() and is_excel_name(info.filename)),
+            key=lambda n: Path(n).name
+        )
+        return [(zf.read(n), Path(n).name) for n in nombres]
+
+
+def expand_zip_files(files):
+    """Reemplaza cada .zip de una lista (file_content, filename) por los Excel que contiene"""
+    expanded = []
+    for file_content, filename in files:
+        if filename.lower().endswith(".zip"):
+            expanded.extend(read_zip_excel_files(file_content))
+        else:
+            expanded.append((file_content, filename))
+    return expanded
+
+
+def report_date_from_name(filename):
+    """Fecha del reporte según el nombre (reporte_all_YYYYMMDD...); None si el nombre no la tiene"""
+    parts = filename.split("_")
+    fecha_str = next((p for p in parts if p.isdigit() and len(p) == 8), None)
+
+    if fecha_str:
+        return datetime.strptime(fecha_str, "%Y%m%d")
+    return None
+
+
+def has_report_date(filename):
+    """True si el nombre trae una fecha válida (parse_report_date no recurre a la fecha actual)"""
+    try:
+        return report_date_from_name(filename) is not None
+    except ValueError:
+        return False
+
+
+def parse_report_date(filename):
+    """Obtiene la fecha del reporte a partir del nombre; sin fecha en el nombre usa la actual"""
+    fecha = report_date_from_name(filename)
+    return fecha if fecha is not None else datetime.now()
+
+
+def _cell_number(value):
+    """Convierte una celda a número como pd.to_numeric(errors="coerce"); None si no es numérica"""
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _cell_value(value):
+    """Normaliza una celda igual que pd.read_excel (vacío -> NaN, 5.0 -> 5)"""
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _sheet_header(ws):
+    """Fila de encabezados de una hoja read-only (no se lee el resto de la hoja)"""
+    return next(ws.iter_rows(max_row=1, values_only=True), None) or ()
+
+
+def missing_columns(header, column_map, required, quantity_columns):
+    """
+    Columnas normalizadas que faltan en una fila de encabezados
+
+    Si no hay ninguna de `quantity_columns` se informa la primera.
+    """
+    nombres = {column_map.get(name, name) for name in header}
+    missing = [c for c in required if c not in nombres]
+    if not any(q in nombres for q in quantity_columns) and quantity_columns[0] not in missing:
+        missing.append(quantity_columns[0])
+    return missing
+
+
+def sniff_data_sheet(file_content, preferred, column_map, required, quantity_columns):
+    """
+    Valida un workbook leyendo solo los nombres de hoja y los encabezados
+
+    Abre el archivo en modo read-only y revisa la fila de encabezados de
+    `preferred`; si no tiene las columnas, prueba el resto de hojas en orden.
+    Un archivo equivocado se rechaza en milisegundos, antes de parsear datos.
+
+    Returns:
+        tuple: (indice, nombre) de la hoja con los datos
+
+    Raises:
+        ValueError: si ninguna hoja tiene las columnas requeridas
+    """
+    wb = load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+    try:
+        hojas = wb.worksheets
+        if not hojas:
+            raise ValueError("El archivo no tiene hojas de cálculo")
+        if not 0 <= preferred < len(hojas):
+            preferred = 0
+        faltantes = None
+        for indice in [preferred] + [i for i in range(len(hojas)) if i != preferred]:
+            missing = missing_columns(_sheet_header(hojas[indice]), column_map, required, quantity_columns)
+            if not missing:
+                return indice, hojas[indice].title
+            if faltantes is None:
+                faltantes = missing
+    finally:
+        wb.close()
+
+    detalle = f"en la hoja '{hojas[preferred].title}'" if len(hojas) == 1 else f"en ninguna de las {len(hojas)} hojas"
+    raise ValueError(f"Faltan columnas requeridas {detalle}: {', '.join(faltantes)}")
+
+
+def _header_names(header, column_map):
+    """
+    (nombre, posición) de cada columna de la fila de encabezados, con los
+    nombres que daría pd.read_excel: "Unnamed: N" para celdas vacías y sufijos
+    ".1", ".2"... para repetidos. Las columnas de `column_map` usan el nombre
+    normalizado.
+    """
+    nombres, usados = [], set()
+    for pos, name in enumerate(header):
+        name = f"Unnamed: {pos}" if name is None else column_map.get(name, name)
+        candidato, k = name, 1
+        while candidato in usados:
+            candidato, k = f"{name}.{k}", k + 1
+        usados.add(candidato)
+        name = candidato
+        nombres.append((name, pos))
+    return nombres
+
+
+def iter_negative_rows(file_content, sheet_index, column_map, columns, quantity_columns, required=(),
+                       chunk_rows=None):
+    """
+    Recorre la hoja una sola vez y entrega las filas con cantidad negativa por bloques
+
+    Abre el workbook en modo read-only, mapea la fila de encabezados con
+    `column_map` y nunca materializa la hoja completa: solo se acumulan las
+    filas negativas del bloque en curso.
+
+    Args:
+        file_content: bytes del archivo Excel
+        sheet_index: índice de la hoja a leer
+        column_map: tabla de renombrado {encabezado: nombre normalizado}
+        columns: columnas normalizadas a conservar (si existen); None conserva
+            todas las columnas de la hoja en su orden, como pd.read_excel
+        quantity_columns: candidatas para la cantidad, en orden de preferencia
+        required: columnas normalizadas obligatorias
+        chunk_rows: filas negativas por bloque (None = un solo bloque)
+
+    Yields:
+        tuple: (df, filas_totales, suma_cantidad). df usa nombres normalizados y
+        su columna de cantidad ya es numérica; los contadores son acumulados
+        hasta ese bloque. El último bloque puede estar vacío.
+
+    Raises:
+        ValueError: si faltan columnas requeridas o la columna de cantidad
+    """
+    wb = load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_index]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+
+        # Primera aparición de cada nombre normalizado
+        positions = {}
+        for pos, name in enumerate(header):
+            positions.setdefault(column_map.get(name, name), pos)
+
+        quantity = next((q for q in quantity_columns if q in positions), None)
+        missing = [c for c in required if c not in positions]
+        if quantity is None and quantity_columns[0] not in missing:
+            missing.append(quantity_columns[0])
+        if missing:
+            raise ValueError(f"Faltan columnas requeridas: {', '.join(missing)}")
+
+        q_pos = positions[quantity]
+        if columns is None:
+            keep = [(c, pos) for c, pos in _header_names(header, column_map) if pos != q_pos]
+            names = [c for c, _ in keep]
+            names.insert(sum(pos < q_pos for _, pos in keep), quantity)
+        else:
+            keep = [(c, positions[c]) for c in columns if c in positions and c != quantity]
+            names = [c for c, _ in keep] + [quantity]
+
+        def chunk(data):
+            df = pd.DataFrame(data, columns=names)
+            df[quantity] = pd.to_numeric(df[quantity])
+            return df
+
+        data = {c: [] for c in names}
+        filas_bloque = 0
+        filas_totales = 0
+        filas_vacias = 0
+        suma_cantidad = 0.0
+        for row in rows:
+            # Las filas vacías al final no cuentan (igual que pd.read_excel)
+            if all(v is None for v in row):
+                filas_vacias += 1
+                continue
+            filas_totales += filas_vacias + 1
+            filas_vacias = 0
+
+            celda = row[q_pos] if q_pos < len(row) else None
+            cantidad = _cell_number(celda)
+            if cantidad is None:
+                continue
+            suma_cantidad += cantidad
+            if cantidad >= 0:
+                continue
+
+            for c, pos in keep:
+                data[c].append(_cell_value(row[pos]) if pos < len(row) else np.nan)
+            # Conservar enteros como enteros para obtener el mismo dtype que pd.read_excel
+            data[quantity].append(_cell_value(celda) if not isinstance(celda, str) else cantidad)
+
+            filas_bloque += 1
+            if chunk_rows is not None and filas_bloque >= chunk_rows:
+                yield chunk(data), filas_totales, suma_cantidad
+                data = {c: [] for c in names}
+                filas_bloque = 0
+    finally:
+        wb.close()
+
+    yield chunk(data), filas_totales, suma_cantidad
+
+
+def read_negative_rows(file_content, sheet_index, column_map, columns, quantity_columns, required=()):
+    """
+    Lee solo las filas con cantidad negativa (las columnas de `columns`, o todas con None)
+
+    Returns:
+        tuple: (df, filas_totales, suma_cantidad) (ver iter_negative_rows)
+
+    Raises:
+        ValueError: si faltan columnas requeridas o la columna de cantidad
+    """
+    return next(iter_negative_rows(file_content, sheet_index, column_map, columns, quantity_columns, required))
+
+
+def read_report_file(file_content, filename, use_disk_cache=True, engine=DEFAULT_READER_ENGINE):
+    """
+    Procesa un archivo Excel individual
+
+    La hoja leída se guarda en la caché en disco por hash de contenido, motor y
+    PARSED_CACHE_VERSION, de modo que un workbook ya visto no vuelve a pasar por
+    openpyxl. Fecha_Reporte y
+    Archivo_Origen se derivan siempre del nombre actual del archivo.
+
+    Con engine="fast" solo se convierten las filas negativas (con todas sus
+    columnas); con engine="pandas" se lee la hoja completa con pd.read_excel.
+
+    Antes de leer se validan los encabezados (sniff_data_sheet): un archivo sin
+    las columnas del reporte falla sin parsearse, y si los datos no están en la
+    segunda hoja se usa la hoja que las tenga (df.attrs["hoja"]).
+
+    Returns:
+        tuple: (df, success, error_message)
+    """
+    try:
+        # Detectar fecha en nombre archivo
+        fecha_reporte = parse_report_date(filename)
+
+        cache = get_parsed_cache() if use_disk_cache else None
+        if cache is not None:
+            key = f"{content_hash(file_content)}-{engine}-v{PARSED_CACHE_VERSION}"
+            cached_path = cache.get(key)
+        else:
+            cached_path = None
+
+        if cached_path is not None:
+            df = pd.read_parquet(cached_path)
+            df.attrs["from_cache"] = True
+        else:
+            # Validar encabezados y elegir la hoja (segunda hoja por defecto)
+            hoja, titulo = sniff_data_sheet(
+                file_content, REPORT_SHEET_INDEX, REPORT_COLUMN_MAP, REPORT_REQUIRED_COLUMNS, REPORT_QUANTITY_COLUMNS
+            )
+            if engine == "fast":
+                # Todas las columnas: Datos Crudos conserva las que no usa el análisis (Lote, Unidad...)
+                df, _, _ = read_negative_rows(
+                    file_content, hoja, REPORT_COLUMN_MAP, None, REPORT_QUANTITY_COLUMNS
+                )
+            else:
+                df = pd.read_excel(io.BytesIO(file_content), sheet_name=hoja)
+            if hoja != REPORT_SHEET_INDEX:
+                df.attrs["hoja"] = titulo
+            if cache is not None:
+                try:
+                    cache.put(key, lambda path: to_parquet_safe(df, path))
+                except Exception:
+                    # La caché es opcional: un fallo al escribir no invalida la lectura
+                    pass
+
+        df["Fecha_Reporte"] = pd.to_datetime(fecha_reporte)
+        df["Archivo_Origen"] = filename
+
+        return df, True, None
+
+    except Exception as e:
+        return None, False, str(e)
+
+
+def normalize_report_frame(df, compact=False):
+    """
+    Normaliza nombres de columnas y limpia datos
+
+    Con compact=True las columnas de pallet quedan como categóricas y
+    ID_Unico_Pallet como clave int64 (ver analysis.compact_pallet_frame).
+    """
+    # Normalización de columnas
+    df = df.rename(columns=REPORT_COLUMN_MAP)
+    
+    # Limpiar códigos y pallets
+    for col in ["Codigo", "ID_Pallet"]:
+        if col in df.columns:
+            df[col] = (
+                df[col]
+                .astype(str)
+                .str.replace(",", "", regex=False)
+                .str.split(".").str[0]
+                .str.strip()
+            )
+        else:
+            df[col] = "N/A"
+    
+    # Campos obligatorios
+    if "Nombre" not in df.columns:
+        df["Nombre"] = ""
+    if "Almacen" not in df.columns:
+        df["Almacen"] = "N/A"
+
+    # Convertir Almacen y Nombre a string para evitar problemas de tipos mixtos
+    df["Almacen"] = df["Almacen"].astype(str)
+    df["Nombre"] = df["Nombre"].astype(str)
+    
+    # Cantidad negativa
+    if "Cantidad_Negativa" not in df.columns:
+        for alt in REPORT_QUANTITY_COLUMNS[1:]:
+            if alt in df.columns:
+                df["Cantidad_Negativa"] = df[alt]
+                break
+    
+    df["Cantidad_Negativa"] = pd.to_numeric(df["Cantidad_Negativa"], errors="coerce").fillna(0)
+    
+    # Solo negativos
+    df = df[df["Cantidad_Negativa"] < 0].copy()
+    
+    # ID único pallet
+    if compact:
+        df = compact_pallet_frame(df)
+    else:
+        df["ID_Unico_Pallet"] = df["Codigo"].astype(str) + "_" + df["ID_Pallet"].astype(str)
+    
+    return df
+
+
+def _read_report_task(args):
+    """Adaptador para executor.map (recibe una tupla file_content, filename, engine, use_disk_cache)"""
+    file_content, filename, engine, use_disk_cache = args
+    return read_report_file(file_content, filename, use_disk_cache, engine)
+
+
+def read_report_files_parallel(files, max_workers=None, engine=DEFAULT_READER_ENGINE, use_disk_cache=True):
+    """
+    Lee varios reportes en paralelo con un pool de procesos
+
+    Args:
+        files: lista de tuplas (file_content, filename)
+        max_workers: número de procesos (por defecto default_ingest_workers())
+        engine: motor de lectura ("fast" o "pandas")
+        use_disk_cache: usar la caché en disco de workbooks parseados
+
+    Yields:
+        tuple: (filename, df, success, error_message) en el mismo orden de `files`
+    """
+    if max_workers is None:
+        max_workers = default_ingest_workers()
+    max_workers = max(1, min(max_workers, len(files)))
+
+    # Con un solo proceso no compensa el arranque del pool
+    if max_workers == 1:
+        for file_content, filename in files:
+            yield (filename,) + read_report_file(file_content, filename, use_disk_cache, engine)
+        return
+
+    # "spawn" evita hacer fork de un servidor con hilos activos (Streamlit)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as executor:
+        # executor.map conserva el orden de subida aunque terminen desordenados
+        tasks = [(file_content, filename, engine, use_disk_cache) for file_content, filename in files]
+        results = executor.map(_read_report_task, tasks)
+        for (_, filename), result in zip(files, results):
+            yield (filename,) + result
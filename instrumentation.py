@@ -0,0 +1,153 @@
+"""
+Instrumentación por etapa del pipeline (tiempo, filas y memoria) sin Streamlit.
+
+PipelineMetrics registra cada etapa con su tiempo de reloj, filas de entrada y
+salida, RSS del proceso y, opcionalmente, el pico de memoria asignada según
+tracemalloc. Lo usan InventoryAnalyzerWeb (panel "Rendimiento") y benchmark.py.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGE_COLUMNS = [
+    "etapa", "segundos", "filas_entrada", "filas_salida",
+    "rss_mb", "rss_delta_mb", "rss_pico_mb", "tracemalloc_pico_mb",
+]
+
+_MB = 1024 ** 2
+
+
+def rss_mb():
+    """RSS actual del proceso en MB (None si no se puede leer)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Pico de RSS del proceso en MB desde su inicio (None si no está disponible)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB, macOS en bytes
+    return pico / _MB if sys.platform == "darwin" else pico / 1024
+
+
+def count_rows(valor):
+    """Número de filas de un resultado (None si no aplica)"""
+    if valor is None or isinstance(valor, (bytes, str)):
+        return None
+    try:
+        return len(valor)
+    except TypeError:
+        return None
+
+
+def _round(valor, decimales=1):
+    return None if valor is None else round(valor, decimales)
+
+
+class PipelineMetrics:
+    """
+    Registro de mediciones por etapa
+
+    Args:
+        trace_memory: medir el pico de memoria con tracemalloc (añade sobrecarga)
+        log: función opcional que recibe un resumen de texto de cada etapa
+    """
+
+    def __init__(self, trace_memory=False, log=None):
+        self.trace_memory = trace_memory
+        self.log = log
+        self.stages = []
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+
+    @contextmanager
+    def stage(self, nombre, filas_entrada=None, quiet=False):
+        """
+        Mide el bloque como una etapa
+
+        El bloque recibe el registro y puede completar registro["filas_salida"].
+        Con quiet=True no se envía el resumen a log.
+        """
+        registro = {"etapa": nombre, "filas_entrada": filas_entrada, "filas_salida": None}
+
+        # Solo detiene tracemalloc quien lo inició (permite etapas anidadas)
+        propio = self.trace_memory and not tracemalloc.is_tracing()
+        if propio:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        rss_inicio = rss_mb()
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        except Exception as e:
+            registro["error"] = str(e)
+            raise
+        finally:
+            registro["segundos"] = round(time.perf_counter() - inicio, 4)
+            registro["tracemalloc_pico_mb"] = (
+                round((tracemalloc.get_traced_memory()[1] - base) / _MB, 2) if self.trace_memory else None
+            )
+            if propio:
+                tracemalloc.stop()
+            rss_fin = rss_mb()
+            registro["rss_mb"] = _round(rss_fin)
+            registro["rss_delta_mb"] = (
+                _round(rss_fin - rss_inicio) if rss_fin is not None and rss_inicio is not None else None
+            )
+            registro["rss_pico_mb"] = _round(peak_rss_mb())
+            self.stages.append(registro)
+            if self.log is not None and not quiet:
+                self.log(self.format(registro))
+
+    def has_stage(self, nombre):
+        """True si ya hay una medición con ese nombre"""
+        return any(r["etapa"] == nombre for r in self.stages)
+
+    @staticmethod
+    def format(registro):
+        """Resumen de una línea para el log"""
+        partes = [f"⏱️ {registro['etapa']}: {registro['segundos']:.2f}s"]
+        if registro["filas_entrada"] is not None or registro["filas_salida"] is not None:
+            partes.append(f"{registro['filas_entrada']} → {registro['filas_salida']} filas")
+        if registro["rss_mb"] is not None:
+            delta = registro["rss_delta_mb"]
+            partes.append(f"RSS {registro['rss_mb']:.0f} MB ({delta:+.0f})" if delta is not None
+                          else f"RSS {registro['rss_mb']:.0f} MB")
+        if registro["tracemalloc_pico_mb"] is not None:
+            partes.append(f"pico {registro['tracemalloc_pico_mb']:.1f} MB")
+        return " · ".join(partes)
+
+    def total_seconds(self):
+        """Suma de los tiempos de todas las etapas"""
+        return round(sum(r["segundos"] for r in self.stages), 4)
+
+    def to_frame(self):
+        """Mediciones como DataFrame (una fila por etapa)"""
+        columnas = STAGE_COLUMNS + (["error"] if any("error" in r for r in self.stages) else [])
+        return pd.DataFrame(self.stages, columns=columnas)
+
+    def to_json(self):
+        """Mediciones serializadas como JSON (para descargar o comparar ejecuciones)"""
+        return json.dumps({
+            "inicio": self.started_at,
+            "tracemalloc": self.trace_memory,
+            "total_segundos": self.total_seconds(),
+            "etapas": self.stages,
+        }, ensure_ascii=False, indent=2)
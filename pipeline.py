@@ -0,0 +1,199 @@
+"""
+Pipeline de análisis de inventarios negativos sin dependencia de Streamlit.
+
+InventoryAnalyzer encadena las etapas (lectura, normalización, análisis por
+pallet, súper análisis y reincidencias) y registra el log y las métricas de
+cada una. La app web lo extiende (InventoryAnalyzerWeb) y la CLI lo usa tal cual.
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from analysis import (
+    IncrementalAnalysis, SuperAnalysisStore, build_pallet_analysis, recurrence_table, with_pallet_labels,
+)
+from ingestion import (
+    DEFAULT_READER_ENGINE, normalize_report_frame, read_report_file, read_report_files_parallel,
+)
+from instrumentation import PipelineMetrics
+
+
+class InventoryAnalyzer:
+    """
+    Pipeline de análisis de pallets (lectura, normalización, análisis, súper
+    análisis y reincidencias)
+
+    Las funciones de cada etapa son atributos de clase para que la app web las
+    sustituya por sus versiones con st.cache_data; aquí se usan sin caché.
+
+    Args:
+        compact: usar tipos compactos (ver analysis.compact_pallet_frame)
+        sparse: devolver el súper análisis como SuperAnalysisStore
+        trace_memory: medir memoria por etapa con tracemalloc
+        log_sink: función opcional que recibe cada línea de log
+    """
+
+    read_file = staticmethod(read_report_file)
+    normalize_frame = staticmethod(normalize_report_frame)
+    pallet_analysis = staticmethod(build_pallet_analysis)
+
+    def __init__(self, compact=False, sparse=False, trace_memory=False, log_sink=None):
+        self.logger_messages = []
+        self.compact = compact
+        self.sparse = sparse
+        self.log_sink = log_sink
+        # Tiempo, filas y memoria por etapa (panel "Rendimiento")
+        self.metrics = PipelineMetrics(trace_memory, log=self.log)
+    
+    def log(self, message):
+        linea = f"{datetime.now().strftime('%H:%M:%S')} - {message}"
+        self.logger_messages.append(linea)
+        if self.log_sink is not None:
+            self.log_sink(linea)
+    
+    def process_uploaded_files(self, uploaded_files, max_workers=1, engine=DEFAULT_READER_ENGINE):
+        """Procesa archivos subidos (objetos con read() y name) y normaliza datos"""
+        if not uploaded_files:
+            raise ValueError("No se subieron archivos")
+        
+        files = [(uploaded_file.read(), uploaded_file.name) for uploaded_file in uploaded_files]
+        return self.process_files(files, max_workers, engine)
+    
+    def process_files(self, files, max_workers=1, engine=DEFAULT_READER_ENGINE):
+        """
+        Procesa archivos (lista de tuplas file_content, filename) y normaliza datos
+
+        Con max_workers > 1 los archivos se leen en paralelo en un pool de
+        procesos; los mensajes de log se emiten igualmente en orden de subida.
+        `engine` selecciona el motor de lectura ("fast" o "pandas").
+        """
+        if not files:
+            raise ValueError("No se subieron archivos")
+        
+        self.log(f"Procesando {len(files)} archivos...")
+        
+        with self.metrics.stage("Lectura de archivos", len(files)) as etapa:
+            if max_workers > 1 and len(files) > 1:
+                self.log(f"⚡ Lectura paralela con {min(max_workers, len(files))} procesos")
+                results = read_report_files_parallel(files, max_workers, engine)
+            else:
+                # En la app web es la versión con caché
+                results = ((filename,) + self.read_file(file_content, filename, engine=engine)
+                           for file_content, filename in files)
+            
+            all_dfs = []
+            for filename, df, success, error in results:
+                if success:
+                    all_dfs.append(df)
+                    origen = ", caché en disco" if df.attrs.get("from_cache") else ""
+                    if "hoja" in df.attrs:
+                        origen += f", hoja '{df.attrs['hoja']}'"
+                    self.log(f"✅ Procesado: {filename} ({len(df)} registros{origen})")
+                else:
+                    self.log(f"⚠️ Error en {filename}: {error}")
+                    continue
+            
+            if not all_dfs:
+                raise ValueError("No se pudieron procesar archivos válidos")
+            
+            df_total = pd.concat(all_dfs, ignore_index=True)
+            etapa["filas_salida"] = len(df_total)
+        
+        return self.normalize_data(df_total)
+    
+    def normalize_data(self, df):
+        """Normaliza nombres de columnas y limpia datos"""
+        with self.metrics.stage("Normalización", len(df)) as etapa:
+            # En la app web es la versión con caché
+            normalized_df = self.normalize_frame(df, self.compact)
+            etapa["filas_salida"] = len(normalized_df)
+        self.log(f"📊 Datos normalizados: {len(normalized_df)} registros negativos")
+        return normalized_df
+    
+    def analyze_pallets(self, df_total):
+        """Análisis principal de pallets"""
+        self.log("🔍 Analizando pallets...")
+        
+        with self.metrics.stage("Análisis de pallets", len(df_total)) as etapa:
+            # En la app web es la versión con caché
+            analisis = self.pallet_analysis(df_total)
+            etapa["filas_salida"] = len(analisis)
+        
+        self.log(f"✅ Análisis completado: {len(analisis)} pallets únicos")
+        return analisis
+    
+    def create_super_analysis(self, df_total):
+        """
+        Crea tabla pivote con evolución temporal
+
+        Con sparse=True devuelve un SuperAnalysisStore (formato largo) y la
+        tabla ancha se construye solo al mostrar o exportar.
+        """
+        self.log("📈 Creando súper análisis...")
+        
+        with self.metrics.stage("Súper análisis", len(df_total)) as etapa:
+            if self.sparse:
+                store = SuperAnalysisStore.from_frame(df_total)
+                etapa["filas_salida"] = len(store)
+            else:
+                tabla = df_total.pivot_table(
+                    index=["Codigo", "Nombre", "ID_Pallet", "Almacen"],
+                    columns="Fecha_Reporte", 
+                    values="Cantidad_Negativa",
+                    aggfunc="first",
+                    observed=True
+                ).reset_index()
+                tabla = with_pallet_labels(tabla)
+                
+                # Ordenar columnas por fecha
+                fecha_cols = sorted([c for c in tabla.columns if isinstance(c, pd.Timestamp)])
+                otras = [c for c in tabla.columns if not isinstance(c, pd.Timestamp)]
+                tabla = tabla[otras + fecha_cols]
+                etapa["filas_salida"] = len(tabla)
+        
+        if self.sparse:
+            self.log(f"📊 Súper análisis disperso: {len(store)} × {len(store.fechas)} ({store.nnz} celdas con dato)")
+            return store
+        
+        self.log(f"📊 Súper análisis: {tabla.shape[0]} × {tabla.shape[1]}")
+        return tabla
+    
+    def analyze_incremental(self, df_nuevo, estado=None, df_total=None):
+        """
+        Incorpora días nuevos reutilizando los agregados del análisis anterior
+
+        Si las fechas nuevas no son posteriores a las ya analizadas (o no hay
+        estado previo) se reconstruye el estado completo a partir de df_total.
+
+        Returns:
+            tuple: (estado, analisis, super_analisis, reincidencias)
+        """
+        with self.metrics.stage("Análisis incremental", len(df_nuevo)) as etapa:
+            if estado is not None and estado.can_append(df_nuevo):
+                self.log(f"➕ Análisis incremental: {df_nuevo['Fecha_Reporte'].nunique()} día(s) nuevo(s)")
+                estado.append(df_nuevo)
+            else:
+                if estado is None:
+                    self.log("🧮 Construyendo agregados para análisis incremental...")
+                else:
+                    self.log("🔁 Fechas anteriores a las ya analizadas: recalculando estado completo")
+                estado = IncrementalAnalysis.from_frame(df_total)
+            
+            analisis = estado.analysis()
+            super_analisis = estado.store if self.sparse else estado.super_analysis()
+            reincidencias = estado.recurrences()
+            etapa["filas_salida"] = len(analisis)
+        self.log(f"✅ Análisis completado: {len(analisis)} pallets únicos, {len(reincidencias)} reincidencias")
+        return estado, analisis, super_analisis, reincidencias
+    
+    def detect_recurrences(self, df_total):
+        """Detecta reincidencias (incluye número de huecos y hueco máximo en días)"""
+        self.log("🔄 Detectando reincidencias...")
+        
+        with self.metrics.stage("Reincidencias", len(df_total)) as etapa:
+            # Motor vectorizado (una ordenación y un diff, sin bucle por pallet)
+            reincidencias = recurrence_table(df_total)
+            etapa["filas_salida"] = len(reincidencias)
+        
+        self.log(f"🔄 Reincidencias detectadas: {len(reincidencias)}")
+        return reincidencias
@@ -0,0 +1,157 @@
+"""
+Generación del reporte Excel en segundo plano, sin dependencia de Streamlit.
+
+ReportJob ejecuta reporting.write_excel_report (o write_excel_report_file en
+modo de memoria constante) en un hilo y publica el progreso por hoja. La app lo
+guarda en st.session_state y consulta su estado desde un fragmento que se
+refresca solo, de modo que el resto del dashboard sigue respondiendo mientras
+se genera el archivo.
+
+Se usa un hilo y no un proceso para no copiar los DataFrames del análisis a
+otro proceso: el reporte se escribe a partir de los mismos objetos en memoria.
+
+Con la huella de los archivos de entrada el reporte pasa por la caché en disco
+de reporting (cached_excel_report): un reporte ya generado se sirve desde ahí.
+"""
+import os
+import threading
+import time
+
+from reporting import REPORT_STEPS, cached_excel_report, write_excel_report, write_excel_report_file
+
+ESTADO_GENERANDO = "generando"
+ESTADO_LISTO = "listo"
+ESTADO_ERROR = "error"
+
+
+class ReportJob:
+    """
+    Reporte Excel generado en un hilo de fondo
+
+    Args:
+        clave: identifica la configuración del reporte (p. ej. (top_n, en_disco));
+            la app la compara para saber si el reporte sigue vigente
+        to_disk: escribir en un archivo temporal con memoria constante en lugar
+            de en un buffer en memoria
+        fingerprint: huella de los datos de entrada; si se indica, el reporte se
+            lee de la caché en disco o se guarda en ella
+        opciones: otras opciones que cambian el contenido del reporte en caché
+            (ver reporting.cached_excel_report)
+    """
+
+    def __init__(self, clave, to_disk=False, fingerprint=None, opciones=()):
+        self.clave = clave
+        self.to_disk = to_disk
+        self.fingerprint = fingerprint
+        self.opciones = tuple(opciones)
+        self.desde_cache = False
+        self.estado = ESTADO_GENERANDO
+        self.paso = 0
+        self.total_pasos = len(REPORT_STEPS)
+        self.descripcion = REPORT_STEPS[0]
+        self.error = None
+        self.segundos = None
+        self._resultado = None
+        self._descartado = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, analisis, super_analisis, reincidencias, df_total, top_n=10, metrics=None):
+        """
+        Lanza la generación en un hilo daemon y vuelve de inmediato
+
+        Con `metrics` (instrumentation.PipelineMetrics) la generación se registra
+        como etapa "Reporte Excel" si todavía no está medida.
+        """
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(analisis, super_analisis, reincidencias, df_total, top_n, metrics),
+            name="reporte-excel",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def _progress(self, paso, total, descripcion):
+        with self._lock:
+            self.paso, self.total_pasos, self.descripcion = paso, total, descripcion
+
+    def _write(self, analisis, super_analisis, reincidencias, df_total, top_n):
+        if self.fingerprint is not None:
+            path, self.desde_cache = cached_excel_report(
+                analisis, super_analisis, reincidencias, df_total, top_n, self.fingerprint,
+                self.to_disk, progress=self._progress, opciones=self.opciones
+            )
+            return path
+        if self.to_disk:
+            return write_excel_report_file(
+                analisis, super_analisis, reincidencias, df_total, top_n, progress=self._progress
+            )
+        return write_excel_report(analisis, super_analisis, reincidencias, df_total, top_n, progress=self._progress)
+
+    def _run(self, analisis, super_analisis, reincidencias, df_total, top_n, metrics):
+        inicio = time.perf_counter()
+        try:
+            if metrics is not None and not metrics.has_stage("Reporte Excel"):
+                with metrics.stage("Reporte Excel", len(analisis), quiet=True):
+                    resultado = self._write(analisis, super_analisis, reincidencias, df_total, top_n)
+            else:
+                resultado = self._write(analisis, super_analisis, reincidencias, df_total, top_n)
+        except Exception as e:
+            with self._lock:
+                self.estado, self.error = ESTADO_ERROR, str(e)
+                self.segundos = round(time.perf_counter() - inicio, 2)
+            return
+
+        with self._lock:
+            self._resultado = resultado
+            self.estado = ESTADO_LISTO
+            self.paso = self.total_pasos
+            self.segundos = round(time.perf_counter() - inicio, 2)
+            descartado = self._descartado
+        # Descartado mientras se generaba: nadie va a descargar el archivo
+        if descartado:
+            self.discard()
+
+    @property
+    def running(self):
+        return self.estado == ESTADO_GENERANDO
+
+    @property
+    def failed(self):
+        return self.estado == ESTADO_ERROR
+
+    def fraction(self):
+        """Avance entre 0 y 1 para una barra de progreso"""
+        return min(self.paso / self.total_pasos, 1.0) if self.total_pasos else 0.0
+
+    def read_bytes(self):
+        """Contenido del reporte terminado (para st.download_button)"""
+        with self._lock:
+            resultado = self._resultado
+        if resultado is None:
+            raise RuntimeError("El reporte no está disponible")
+        if hasattr(resultado, "getvalue"):
+            return resultado.getvalue()
+        try:
+            with open(resultado, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Expulsado de la caché entre la generación y la descarga
+            raise RuntimeError("El reporte ya no está en caché: vuelve a generarlo") from None
+
+    def discard(self):
+        """
+        Libera el reporte (borra el temporal en modo disco; las entradas de la
+        caché se conservan)
+
+        Si todavía se está generando, se libera en cuanto termine.
+        """
+        with self._lock:
+            self._descartado = True
+            resultado, self._resultado = self._resultado, None
+        if resultado is not None and self.to_disk and self.fingerprint is None:
+            try:
+                os.remove(resultado)
+            except FileNotFoundError:
+                pass
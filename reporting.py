@@ -0,0 +1,549 @@
+"""
+Reporte Excel del análisis de inventarios negativos sin dependencia de Streamlit.
+
+La app web lo genera en segundo plano (report_jobs.ReportJob) y la CLI lo llama
+directamente. Para historiales largos, write_excel_report_file genera el mismo
+reporte en modo de memoria constante directamente a disco.
+
+Ambas funciones aceptan `progress(paso, total, descripcion)`, que se llama antes
+de escribir cada hoja y antes de guardar el archivo. Las tablas se escriben por
+bloques de filas y las que superan el límite de filas de Excel se reparten en
+hojas numeradas (report_sheet_names).
+
+Para procesos de BI que solo necesitan los datos, write_data_bundle exporta las
+mismas tablas en Parquet, Feather o CSV.gz dentro de un zip con un manifiesto.
+
+Los reportes generados se guardan en una caché en disco con expulsión LRU
+(cached_excel_report), indexada por la huella de los archivos de entrada
+(disk_cache.dataset_fingerprint), el Top N y el motor de lectura: volver a
+descargar el mismo reporte, en otra sesión o tras reiniciar, no lo regenera ni
+vuelve a hashear los DataFrames. Si algún archivo no trae la fecha en el nombre
+(se usaría la fecha actual) la app no usa la caché.
+"""
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from analysis import (
+    SuperAnalysisStore, is_compact, super_dates, super_keys, super_long, super_wide, with_pallet_labels,
+)
+from disk_cache import CACHE_ROOT, DiskLRUCache
+from ingestion import arrow_safe_frame
+
+# Filas de datos crudos a partir de las cuales la app usa el modo de memoria constante
+LARGE_REPORT_ROWS = 500000
+
+# Filas que se convierten a valores Python (o se pasan a to_excel) a la vez
+REPORT_WRITE_CHUNK_ROWS = 50000
+
+# Filas de datos por hoja: el límite de Excel (1.048.576) menos el encabezado.
+# Las tablas más largas se reparten en hojas numeradas ("Datos Crudos 1", "Datos Crudos 2", ...)
+EXCEL_MAX_ROWS = 1048576
+REPORT_SHEET_MAX_ROWS = EXCEL_MAX_ROWS - 1
+
+# Hojas del reporte en el orden en que se escriben
+REPORT_SHEETS = ["Problemas Activos", "Resueltos", "Reincidencias", "Super Análisis", "Datos Crudos", "Top N"]
+
+# Pasos notificados a `progress`: una hoja por paso y el guardado final
+REPORT_STEPS = REPORT_SHEETS + ["Guardando archivo"]
+
+# Paquete de datos: Parquet y Feather necesitan pyarrow; CSV.gz es la alternativa sin él
+BUNDLE_FORMATS = ("parquet", "feather", "csv.gz")
+BUNDLE_MANIFEST = "manifest.json"
+BUNDLE_VERSION = 1
+
+# Caché de reportes generados (un .xlsx por huella de datos y opciones)
+REPORT_CACHE_DIR = CACHE_ROOT / "reports"
+REPORT_CACHE_MAX_MB = int(os.environ.get("INVENTORY_REPORT_CACHE_MB", "512"))
+# Subir al cambiar el contenido o el formato de los reportes para no servir entradas viejas
+REPORT_CACHE_VERSION = 2
+
+HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#1F4E78',
+    'font_color': 'white',
+    'align': 'center',
+    'valign': 'vcenter',
+    'border': 1
+}
+
+
+def _notify(progress, descripcion):
+    """Avisa a `progress` del paso que empieza (si se pasó un callback)"""
+    if progress is not None:
+        progress(REPORT_STEPS.index(descripcion), len(REPORT_STEPS), descripcion)
+
+
+def default_bundle_format():
+    """Parquet si pyarrow está instalado, si no CSV.gz"""
+    return "parquet" if importlib.util.find_spec("pyarrow") else "csv.gz"
+
+
+def _write_table(df, formato):
+    """Serializa una tabla del paquete y devuelve sus bytes"""
+    buffer = io.BytesIO()
+    if formato == "parquet":
+        arrow_safe_frame(df).to_parquet(buffer, index=False)
+    elif formato == "feather":
+        arrow_safe_frame(df).reset_index(drop=True).to_feather(buffer, compression="zstd")
+    else:
+        df.to_csv(buffer, index=False, date_format="%Y-%m-%dT%H:%M:%S.%f",
+                  compression={"method": "gzip", "compresslevel": 6})
+    return buffer.getvalue()
+
+
+def write_data_bundle(analisis, super_analisis, reincidencias, df_total, formato=None):
+    """
+    Exporta las tablas del análisis como datos (sin Excel) en un zip con manifiesto
+
+    Contiene analisis, super_analisis (formato largo: una fila por pallet y
+    fecha con dato), reincidencias y datos (df_total tal cual, incluidos los
+    tipos compactos). El manifiesto registra filas y dtype de cada columna para
+    poder restaurar los tipos exactos también desde CSV (ver read_data_bundle).
+
+    Args:
+        formato: "parquet", "feather" o "csv.gz" (por defecto default_bundle_format())
+
+    Returns:
+        BytesIO con el zip
+    """
+    formato = formato or default_bundle_format()
+    if formato not in BUNDLE_FORMATS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    tablas = {
+        "analisis": analisis,
+        "super_analisis": super_long(super_analisis),
+        "reincidencias": reincidencias,
+        "datos": df_total,
+    }
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "formato": formato,
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "compacto": is_compact(df_total),
+        "tablas": {},
+    }
+
+    buffer = io.BytesIO()
+    # Parquet, Feather (zstd) y CSV.gz ya van comprimidos: el zip solo los agrupa
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for nombre, df in tablas.items():
+            archivo = f"{nombre}.{formato}"
+            zf.writestr(archivo, _write_table(df, formato))
+            manifest["tablas"][nombre] = {
+                "archivo": archivo,
+                "filas": len(df),
+                "columnas": {str(c): str(t) for c, t in df.dtypes.items()},
+            }
+        zf.writestr(BUNDLE_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    buffer.seek(0)
+    return buffer
+
+
+def _restore_dtypes(df, columnas):
+    """Aplica los dtypes del manifiesto a las columnas que no los conservaron (p. ej. object -> str)"""
+    distintos = {c: t for c, t in columnas.items() if c in df.columns and str(df[c].dtype) != t}
+    return df.astype(distintos) if distintos else df
+
+
+def _read_csv_table(contenido, columnas):
+    """Lee una tabla CSV.gz del paquete con los dtypes del manifiesto"""
+    fechas = [c for c, t in columnas.items() if t.startswith("datetime64")]
+    # Las categorías se leen como texto y se convierten al restaurar los dtypes
+    dtypes = {c: ("str" if t == "category" else t) for c, t in columnas.items() if c not in fechas}
+    return pd.read_csv(contenido, compression="gzip", dtype=dtypes, parse_dates=fechas)
+
+
+def read_data_bundle(source):
+    """
+    Lee un paquete de write_data_bundle
+
+    Args:
+        source: ruta o bytes/BytesIO del zip
+
+    Returns:
+        tuple: (dict nombre -> DataFrame, manifiesto)
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as zf:
+        manifest = json.loads(zf.read(BUNDLE_MANIFEST))
+        tablas = {}
+        for nombre, info in manifest["tablas"].items():
+            contenido = io.BytesIO(zf.read(info["archivo"]))
+            if manifest["formato"] == "parquet":
+                df = pd.read_parquet(contenido)
+            elif manifest["formato"] == "feather":
+                df = pd.read_feather(contenido)
+            else:
+                df = _read_csv_table(contenido, info["columnas"])
+            tablas[nombre] = _restore_dtypes(df, info["columnas"])
+    return tablas, manifest
+
+
+def write_excel_report(analisis, super_analisis, reincidencias, df_total, top_n=10, progress=None):
+    """Genera reporte Excel descargable con hoja Top N"""
+    buffer = io.BytesIO()
+    
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        # Escribir hojas principales
+        activos = analisis[analisis["Estado"] == "Activo"]
+        resueltos = analisis[analisis["Estado"] == "Resuelto"]
+        
+        _notify(progress, "Problemas Activos")
+        _to_excel_sheets(writer, "Problemas Activos", _frame_blocks(activos), len(activos))
+        _notify(progress, "Resueltos")
+        _to_excel_sheets(writer, "Resueltos", _frame_blocks(resueltos), len(resueltos))
+        _notify(progress, "Reincidencias")
+        _to_excel_sheets(writer, "Reincidencias", _frame_blocks(reincidencias), len(reincidencias))
+        _notify(progress, "Super Análisis")
+        _to_excel_sheets(writer, "Super Análisis", _super_blocks(super_analisis), len(super_analisis))
+        _notify(progress, "Datos Crudos")
+        # Etiquetas de texto por bloque en lugar de una copia completa de df_total
+        _to_excel_sheets(writer, "Datos Crudos", _frame_blocks(df_total, with_pallet_labels), len(df_total))
+        
+        # NUEVA HOJA: Top N
+        _notify(progress, "Top N")
+        create_top_n_sheet(writer.book, super_analisis, analisis, top_n)
+        
+        # Formato básico para todas las hojas
+        workbook = writer.book
+        header_format = workbook.add_format(HEADER_FORMAT)
+        
+        # Aplicar formato a todas las hojas
+        for sheet_name in writer.sheets:
+            worksheet = writer.sheets[sheet_name]
+            worksheet.set_row(0, 22, header_format)
+        
+        # Al cerrar el writer se genera el XML de todas las celdas
+        _notify(progress, "Guardando archivo")
+    
+    buffer.seek(0)
+    return buffer
+
+
+def _frame_blocks(df, transform=None):
+    """Bloques de REPORT_WRITE_CHUNK_ROWS filas (al menos uno, para el encabezado)"""
+    for inicio in range(0, max(len(df), 1), REPORT_WRITE_CHUNK_ROWS):
+        bloque = df.iloc[inicio:inicio + REPORT_WRITE_CHUNK_ROWS]
+        yield transform(bloque) if transform is not None else bloque
+
+
+def _super_blocks(super_analisis):
+    """Bloques de filas del súper análisis en formato ancho (sin materializar la vista entera)"""
+    if isinstance(super_analisis, SuperAnalysisStore):
+        return super_analisis.iter_wide(REPORT_WRITE_CHUNK_ROWS)
+    return _frame_blocks(super_analisis)
+
+
+def report_sheet_names(nombre, filas):
+    """Hojas en las que se escribe una tabla de `filas` filas: [nombre] o nombre 1..k si no cabe en una"""
+    partes = max(-(-filas // REPORT_SHEET_MAX_ROWS), 1)
+    return [nombre] if partes == 1 else [f"{nombre} {i}" for i in range(1, partes + 1)]
+
+
+def _sheet_blocks(nombre, bloques, filas):
+    """
+    Reparte bloques consecutivos en hojas de como máximo REPORT_SHEET_MAX_ROWS filas
+
+    Un bloque que cruza el límite se corta con iloc (sin copiar la tabla).
+
+    Yields:
+        tuple: (hoja, bloque); una tabla vacía produce un solo bloque vacío (el encabezado)
+    """
+    hojas = report_sheet_names(nombre, filas)
+    parte, filas_hoja = 0, 0
+    for bloque in bloques:
+        if len(bloque) == 0:
+            if parte == 0 and filas_hoja == 0:
+                yield hojas[0], bloque
+            continue
+        inicio = 0
+        while inicio < len(bloque):
+            if filas_hoja == REPORT_SHEET_MAX_ROWS:
+                parte, filas_hoja = parte + 1, 0
+            n = min(len(bloque) - inicio, REPORT_SHEET_MAX_ROWS - filas_hoja)
+            yield hojas[parte], bloque.iloc[inicio:inicio + n]
+            inicio += n
+            filas_hoja += n
+
+
+def _to_excel_sheets(writer, nombre, bloques, filas):
+    """Escribe bloques con to_excel en una o varias hojas (ver _sheet_blocks)"""
+    filas_escritas = {}
+    for hoja, bloque in _sheet_blocks(nombre, bloques, filas):
+        fila = filas_escritas.get(hoja, 0)
+        bloque.to_excel(writer, sheet_name=hoja, index=False, header=fila == 0, startrow=fila + (fila > 0))
+        filas_escritas[hoja] = fila + len(bloque)
+
+
+def _write_blocks(workbook, nombre, bloques, filas, header_format, date_header_format):
+    """
+    Escribe bloques de un DataFrame fila a fila con write_row, en una o varias hojas
+
+    El encabezado de cada hoja sale de su primer bloque. Solo un bloque a la vez
+    se convierte a valores Python (NaN/NaT -> celda vacía), y las filas se
+    escriben en orden como exige constant_memory.
+    """
+    worksheet = None
+    for hoja, bloque in _sheet_blocks(nombre, bloques, filas):
+        if worksheet is None or worksheet.name != hoja:
+            worksheet = workbook.add_worksheet(hoja)
+            # En constant_memory el formato de fila debe fijarse antes de escribirla
+            worksheet.set_row(0, 22, header_format)
+            for j, col in enumerate(bloque.columns):
+                if isinstance(col, datetime):
+                    worksheet.write_datetime(0, j, col, date_header_format)
+                else:
+                    worksheet.write(0, j, col, header_format)
+            fila_excel = 1
+        columnas = [s.astype(object).where(s.notna(), None).tolist() for _, s in bloque.items()]
+        for valores in zip(*columnas):
+            worksheet.write_row(fila_excel, 0, valores)
+            fila_excel += 1
+
+
+def write_excel_report_file(analisis, super_analisis, reincidencias, df_total, top_n=10, path=None, progress=None):
+    """
+    Genera el mismo reporte que write_excel_report en modo de memoria constante
+
+    xlsxwriter (constant_memory) vuelca cada fila a un temporal en cuanto se pasa
+    a la siguiente y el libro se escribe directamente a disco, de modo que nunca
+    coinciden en memoria los DataFrames completos, las celdas y el zip del
+    .xlsx. Datos Crudos y Súper Análisis se convierten por bloques de filas.
+
+    Args:
+        path: archivo de salida (por defecto un temporal que el llamador debe borrar)
+        progress: callback opcional progress(paso, total, descripcion)
+
+    Returns:
+        str: ruta del reporte generado
+    """
+    temporal = path is None
+    if temporal:
+        fd, path = tempfile.mkstemp(prefix="Reporte_Inventarios_Negativos_", suffix=".xlsx")
+        os.close(fd)
+
+    workbook = xlsxwriter.Workbook(str(path), {
+        "constant_memory": True,
+        # Mismo formato que pandas para fechas con hora
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    try:
+        header_format = workbook.add_format(HEADER_FORMAT)
+        date_header_format = workbook.add_format({**HEADER_FORMAT, 'num_format': 'yyyy-mm-dd'})
+
+        def add_sheet(nombre, bloques, filas):
+            _notify(progress, nombre)
+            _write_blocks(workbook, nombre, bloques, filas, header_format, date_header_format)
+
+        activos = analisis[analisis["Estado"] == "Activo"]
+        resueltos = analisis[analisis["Estado"] == "Resuelto"]
+        add_sheet("Problemas Activos", _frame_blocks(activos), len(activos))
+        add_sheet("Resueltos", _frame_blocks(resueltos), len(resueltos))
+        add_sheet("Reincidencias", _frame_blocks(reincidencias), len(reincidencias))
+        add_sheet("Super Análisis", _super_blocks(super_analisis), len(super_analisis))
+        # Etiquetas de texto por bloque en lugar de una copia completa de df_total
+        add_sheet("Datos Crudos", _frame_blocks(df_total, with_pallet_labels), len(df_total))
+
+        _notify(progress, "Top N")
+        create_top_n_sheet(workbook, super_analisis, analisis, top_n)
+    except Exception:
+        workbook.close()
+        if temporal:
+            os.remove(path)
+        raise
+
+    _notify(progress, "Guardando archivo")
+    workbook.close()
+    return path
+
+
+def get_report_cache():
+    """Caché en disco de reportes generados (DiskLRUCache de archivos .xlsx)"""
+    return DiskLRUCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_MB * 1024 * 1024, suffix=".xlsx")
+
+
+def report_cache_key(fingerprint, *opciones):
+    """Clave de un reporte en caché: huella de los datos de entrada y opciones que cambian su contenido"""
+    return "-".join([f"v{REPORT_CACHE_VERSION}", fingerprint, *map(str, opciones)])
+
+
+def cached_report_path(fingerprint, top_n=10, opciones=()):
+    """Ruta del reporte Excel en caché para esos datos, Top N y opciones (None si no está)"""
+    return get_report_cache().get(report_cache_key(fingerprint, f"top{int(top_n)}", *opciones))
+
+
+def cached_excel_report(analisis, super_analisis, reincidencias, df_total, top_n=10, fingerprint=None,
+                        to_disk=False, progress=None, opciones=()):
+    """
+    Reporte Excel servido desde la caché en disco o generado y guardado en ella
+
+    Args:
+        fingerprint: huella de los archivos de entrada (disk_cache.dataset_fingerprint)
+        to_disk: generar en modo de memoria constante (write_excel_report_file)
+        progress: callback opcional progress(paso, total, descripcion)
+        opciones: otras opciones que cambian el contenido (p. ej. el motor de
+            lectura de los datos); forman parte de la clave
+
+    Returns:
+        tuple: (ruta, desde_cache). La ruta pertenece a la caché: no se debe borrar
+    """
+    cache = get_report_cache()
+    key = report_cache_key(fingerprint, f"top{int(top_n)}", *opciones)
+    path = cache.get(key)
+    if path is not None:
+        return path, True
+
+    def writer(tmp_path):
+        if to_disk:
+            write_excel_report_file(analisis, super_analisis, reincidencias, df_total, top_n, tmp_path, progress)
+        else:
+            buffer = write_excel_report(analisis, super_analisis, reincidencias, df_total, top_n, progress)
+            Path(tmp_path).write_bytes(buffer.getvalue())
+
+    return cache.put(key, writer), False
+
+
+def _top_n_super_rows(super_analisis, top_data):
+    """
+    Posición en super_keys de cada pallet del Top N (-1 si no está)
+
+    Busca por la clave (Codigo, ID_Pallet) en un índice en lugar de construir
+    una cadena por fila y recorrer la tabla por cada pallet. Si un pallet tiene
+    varias filas (varios almacenes) se usa la primera.
+    """
+    indice = pd.MultiIndex.from_frame(super_keys(super_analisis)[["Codigo", "ID_Pallet"]])
+    primeras = np.flatnonzero(~indice.duplicated())
+    posiciones = indice[primeras].get_indexer(pd.MultiIndex.from_frame(top_data[["Codigo", "ID_Pallet"]]))
+    return np.where(posiciones >= 0, primeras[posiciones], -1), len(indice)
+
+
+def _top_n_values(super_analisis, top_data, date_cols):
+    """Matriz (Top N × fechas) de cantidades numéricas; NaN donde no hay dato"""
+    valores = np.full((len(top_data), len(date_cols)), np.nan)
+    if top_data.empty or not date_cols:
+        return valores
+
+    filas, total_filas = _top_n_super_rows(super_analisis, top_data)
+    encontradas = filas >= 0
+    if not encontradas.any():
+        return valores
+
+    # Vista ancha solo de las filas del Top N (en el orden de super_keys)
+    mascara = np.zeros(total_filas, dtype=bool)
+    mascara[filas[encontradas]] = True
+    tabla = super_wide(super_analisis, mascara, date_cols)[date_cols]
+    matriz = tabla.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    valores[encontradas] = matriz[np.searchsorted(np.flatnonzero(mascara), filas[encontradas])]
+    return valores
+
+
+def create_top_n_sheet(workbook, super_analisis, analisis, top_n):
+    """
+    Crea hoja dedicada Top N con evolución temporal
+
+    Las columnas se preparan de forma vectorizada y cada fila se escribe en
+    bloque con write_row, así que el costo crece con el tamaño de la hoja y no
+    con el del súper análisis. Escribe las filas en orden, por lo que sirve
+    también para un workbook en modo constant_memory.
+    """
+    worksheet = workbook.add_worksheet("Top N")
+    worksheet.set_zoom(120)
+    worksheet.set_row(0, 22)
+    
+    # Obtener Top N por criticidad
+    top_data = analisis.sort_values("Score_Criticidad", ascending=False).head(top_n)
+    
+    # Preparar columnas base
+    cols_base = [
+        "Rank", "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
+        "Score_Criticidad", "Dias_Acumulados", "Cantidad_Promedio", "Severidad",
+        "Primera_Aparicion", "Ultima_Aparicion", "Estado"
+    ]
+    
+    # Formato de encabezados
+    header_format = workbook.add_format({
+        'bold': True, 
+        'font_size': 11, 
+        'bg_color': '#27466B', 
+        'font_color': 'white',
+        'align': 'center', 
+        'valign': 'vcenter', 
+        'border': 1
+    })
+    
+    # Obtener columnas de fechas del super análisis
+    date_cols = sorted(super_dates(super_analisis))
+    
+    # Escribir encabezados base y de fechas
+    worksheet.write_row(0, 0, cols_base, header_format)
+    worksheet.write_row(0, len(cols_base), [fecha.strftime("%Y-%m-%d") for fecha in date_cols], header_format)
+    
+    # Formatos para datos
+    number_format = workbook.add_format({'num_format': '#,##0.00'})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    
+    def texto(col):
+        return top_data[col].astype(object).where(top_data[col].notna(), "").astype(str).tolist()
+    
+    # Columnas base ya convertidas (texto, números y fechas)
+    texto_base = list(zip(
+        top_data["ID_Unico_Pallet"].astype(str).tolist(),
+        top_data["Codigo"].astype(str).tolist(),
+        texto("Nombre"),
+        top_data["ID_Pallet"].astype(str).tolist(),
+        top_data["Almacen"].astype(str).tolist(),
+    ))
+    scores = top_data["Score_Criticidad"].to_numpy(dtype=float).tolist()
+    dias = top_data["Dias_Acumulados"].to_numpy(dtype=np.int64).tolist()
+    promedios = top_data["Cantidad_Promedio"].to_numpy(dtype=float).tolist()
+    severidades = texto("Severidad")
+    primeras = pd.to_datetime(top_data["Primera_Aparicion"]).tolist()
+    ultimas = pd.to_datetime(top_data["Ultima_Aparicion"]).tolist()
+    estados = top_data["Estado"].astype(str).tolist()
+    
+    # Evolución temporal: solo se escriben los tramos de días con dato
+    valores = _top_n_values(super_analisis, top_data, date_cols)
+    presentes = ~np.isnan(valores)
+    
+    # Escribir datos del Top N
+    for k in range(len(top_data)):
+        i = k + 1
+        worksheet.write_row(i, 0, (i,) + texto_base[k])  # Rank y claves
+        worksheet.write_number(i, 6, scores[k], number_format)
+        worksheet.write_number(i, 7, dias[k])
+        worksheet.write_number(i, 8, promedios[k], number_format)
+        worksheet.write_string(i, 9, severidades[k])
+        worksheet.write_datetime(i, 10, primeras[k], date_format)
+        worksheet.write_datetime(i, 11, ultimas[k], date_format)
+        worksheet.write_string(i, 12, estados[k])
+        
+        columnas = np.flatnonzero(presentes[k])
+        for tramo in np.split(columnas, np.flatnonzero(np.diff(columnas) > 1) + 1):
+            if len(tramo):
+                worksheet.write_row(i, len(cols_base) + tramo[0], valores[k, tramo].tolist(), number_format)
+    
+    # Ajustar anchos de columnas
+    worksheet.set_column(0, 0, 6)   # Rank
+    worksheet.set_column(1, 1, 24)  # ID_Unico_Pallet
+    worksheet.set_column(2, 3, 12)  # Codigo, Nombre
+    worksheet.set_column(4, 5, 12)  # ID_Pallet, Almacen
+    worksheet.set_column(6, 8, 14)  # Scores y promedios
+    worksheet.set_column(9, 9, 10)  # Severidad
+    worksheet.set_column(10, 12, 12) # Fechas y estado
+    
+    # Columnas de evolución temporal
+    if date_cols:
+        worksheet.set_column(len(cols_base), len(cols_base) + len(date_cols) - 1, 10)
@@ -0,0 +1,161 @@
+"""
+Equivalencias del análisis: tipos compactos frente a texto y reincidencias
+vectorizadas frente al bucle por pallet original
+
+    python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analysis import IncrementalAnalysis, concat_frames, recurrence_table, with_pallet_labels  # noqa: E402
+from ingestion import normalize_report_frame  # noqa: E402
+from pipeline import InventoryAnalyzer  # noqa: E402
+
+
+def _reporte(fecha, filas):
+    """Reporte diario crudo con filas (codigo, id_pallet, almacen, cantidad)"""
+    return pd.DataFrame({
+        "Código": [f[0] for f in filas],
+        "Nombre": [f"Producto {f[0]}" for f in filas],
+        "Almacén": [f[2] for f in filas],
+        "ID de Pallet": [f[1] for f in filas],
+        "Inventario Físico": [float(f[3]) for f in filas],
+        "Fecha_Reporte": pd.Timestamp(fecha),
+        "Archivo_Origen": f"reporte_all_{pd.Timestamp(fecha):%Y%m%d}_080000.xlsx",
+    })
+
+
+def _texto(tabla):
+    """Tabla con texto en lugar de categorías e índice limpio, para comparar"""
+    tabla = with_pallet_labels(tabla)
+    texto = [c for c in ("ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen") if c in tabla.columns]
+    return tabla.astype({c: str for c in texto}).reset_index(drop=True)
+
+
+class CompactConcatOrderTest(unittest.TestCase):
+    """Tras concatenar días con categorías distintas el orden de filas es el del modo texto"""
+
+    def setUp(self):
+        # Día 1 [Z9, M5] y día 2 [A1, Z9]: el orden de aparición no es el lexicográfico
+        self.dias = [
+            _reporte("2025-01-01", [("Z9", "1", "A", -3), ("M5", "2", "B", -1)]),
+            _reporte("2025-01-02", [("A1", "3", "A", -2), ("Z9", "1", "A", -4)]),
+        ]
+
+    def total(self, compact):
+        return concat_frames([normalize_report_frame(d, compact) for d in self.dias])
+
+    def test_categorias_ordenadas(self):
+        total = self.total(compact=True)
+        categorias = list(total["Codigo"].cat.categories)
+        self.assertEqual(categorias, sorted(categorias))
+
+    def test_super_analisis_denso_y_disperso(self):
+        for sparse in (False, True):
+            with self.subTest(sparse=sparse):
+                salidas = []
+                for compact in (False, True):
+                    super_analisis = InventoryAnalyzer(compact=compact, sparse=sparse).create_super_analysis(
+                        self.total(compact)
+                    )
+                    salidas.append(_texto(super_analisis.wide() if sparse else super_analisis))
+                self.assertEqual(list(salidas[0]["Codigo"]), ["A1", "M5", "Z9"])
+                pd.testing.assert_frame_equal(salidas[1], salidas[0], check_dtype=False)
+
+    def test_analisis_de_pallets(self):
+        salidas = [
+            _texto(InventoryAnalyzer(compact=compact).analyze_pallets(self.total(compact)))
+            for compact in (False, True)
+        ]
+        pd.testing.assert_frame_equal(salidas[1], salidas[0], check_dtype=False)
+
+
+
+def _reincidencias_en_bucle(df_total):
+    """Algoritmo original (un grupo por pallet) más Huecos y Hueco_Maximo_Dias"""
+    reincidencias = []
+    for pallet, data in df_total.groupby("ID_Unico_Pallet"):
+        fechas = sorted(pd.to_datetime(data["Fecha_Reporte"]).unique())
+        if len(fechas) < 2:
+            continue
+        gaps = np.diff(fechas)
+        huecos = [gap for gap in gaps if gap > np.timedelta64(1, "D")]
+        if huecos:
+            reincidencias.append({
+                "ID_Unico_Pallet": pallet,
+                "Codigo": data["Codigo"].iloc[0],
+                "Nombre": data["Nombre"].iloc[0],
+                "Almacen": data["Almacen"].iloc[0],
+                "Fechas": ", ".join(pd.Series(fechas).dt.strftime("%d-%m-%Y")),
+                "Huecos": len(huecos),
+                "Hueco_Maximo_Dias": int(max(huecos) // np.timedelta64(1, "D")),
+            })
+    return pd.DataFrame(reincidencias)
+
+
+class RecurrenceTableTest(unittest.TestCase):
+    """recurrence_table da lo mismo que el bucle por pallet original"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(6)
+        dias = pd.date_range("2025-01-01", periods=20)
+        filas = []
+        for pallet in range(300):
+            # Días al azar (con huecos) o, uno de cada tres, días seguidos; con repetidos
+            n = int(rng.integers(1, 8))
+            if pallet % 3 == 0:
+                inicio = int(rng.integers(0, len(dias) - n))
+                elegidos = np.repeat(dias[inicio:inicio + n], rng.integers(1, 3, size=n))
+            else:
+                elegidos = rng.choice(dias, size=n, replace=True)
+            for fecha in elegidos:
+                filas.append((fecha, f"C{pallet % 40}", f"{pallet}", rng.choice(["A", "B"]), -float(rng.integers(1, 9))))
+        # Casos fijos: un solo día repetido, días consecutivos y un hueco exacto de 2 días
+        filas += [(dias[3], "S1", "9001", "A", -1.0), (dias[3], "S1", "9001", "A", -2.0)]
+        filas += [(dias[5], "S2", "9002", "A", -1.0), (dias[4], "S2", "9002", "A", -1.0)]
+        filas += [(dias[9], "S3", "9003", "B", -1.0), (dias[7], "S3", "9003", "B", -1.0)]
+        crudo = pd.DataFrame(
+            [filas[i] for i in rng.permutation(len(filas))],
+            columns=["Fecha_Reporte", "Código", "ID de Pallet", "Almacén", "Inventario Físico"],
+        )
+        crudo["Nombre"] = "Producto " + crudo["Código"]
+        crudo["Archivo_Origen"] = "reporte"
+        cls.crudo = crudo
+
+    def assert_igual_al_bucle(self, obtenido, df_total):
+        esperado = _reincidencias_en_bucle(with_pallet_labels(df_total))
+        obtenido = _texto(obtenido)[esperado.columns]
+        pd.testing.assert_frame_equal(obtenido, _texto(esperado), check_dtype=False)
+
+    def test_modo_texto_y_compacto(self):
+        for compact in (False, True):
+            with self.subTest(compact=compact):
+                df_total = normalize_report_frame(self.crudo, compact)
+                reincidencias = recurrence_table(df_total)
+                pallets = set(reincidencias["ID_Unico_Pallet"])
+                self.assertIn("S3_9003", pallets)
+                self.assertNotIn("S1_9001", pallets)
+                self.assertNotIn("S2_9002", pallets)
+                self.assert_igual_al_bucle(reincidencias, df_total)
+
+    def test_estado_incremental(self):
+        df_total = normalize_report_frame(self.crudo)
+        fechas = sorted(df_total["Fecha_Reporte"].unique())
+        partes = [df_total[df_total["Fecha_Reporte"] <= fechas[9]]]
+        partes += [df_total[df_total["Fecha_Reporte"] == fecha] for fecha in fechas[10:]]
+        estado = IncrementalAnalysis.from_frame(partes[0])
+        for dia in partes[1:]:
+            estado.append(dia)
+        # Como en la app, df_total es la concatenación de los días en el orden en que llegaron
+        self.assert_igual_al_bucle(estado.recurrences(), concat_frames(partes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,301 @@
+"""
+Base histórica: descarga (historico_db.fetch_historico_db) contra un servidor
+HTTP local que hace de GitHub (200, 304 con copia local, 304 sin copia y
+reanudación con Range: 206, 416 y Content-Range que no empieza donde se pidió)
+y filtros en SQLite (build_historico_where / query_historico) frente al filtro
+en pandas que usaba la app.
+
+    python -m unittest discover tests
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import historico_db  # noqa: E402
+
+
+def _sqlite_bytes(directory):
+    """Base SQLite mínima con la tabla inventario, como bytes"""
+    path = Path(directory) / "origen.db"
+    conn = sqlite3.connect(path)
+    try:
+        historico_db.ensure_inventario_schema(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return path.read_bytes()
+
+
+class _ServidorFalso(BaseHTTPRequestHandler):
+    """
+    Sirve `cuerpo` con ETag; responde 304 si coincide o si se fuerza con `forzar_304`
+
+    Atiende Range con If-Range como GitHub (206, o 416 con "bytes */total" si el
+    rango empieza al final); con `rango_desde_cero` responde 206 con el archivo
+    entero aunque se pida otro rango.
+    """
+
+    cuerpo = b""
+    forzar_304 = 0
+    rango_desde_cero = False
+    peticiones = []
+    rangos = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        cls.peticiones.append(self.headers.get("If-None-Match"))
+        cls.rangos.append(self.headers.get("Range"))
+        etag = '"%s"' % hashlib.sha1(cls.cuerpo).hexdigest()
+        if cls.forzar_304 or self.headers.get("If-None-Match") == etag:
+            cls.forzar_304 = max(cls.forzar_304 - 1, 0)
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        rango = self.headers.get("Range")
+        if rango and self.headers.get("If-Range") == etag:
+            inicio = 0 if cls.rango_desde_cero else int(rango.split("=")[1].rstrip("-"))
+            total = len(cls.cuerpo)
+            if inicio >= total:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{total}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Range", f"bytes {inicio}-{total - 1}/{total}")
+            self.send_header("Content-Length", str(total - inicio))
+            self.end_headers()
+            self.wfile.write(cls.cuerpo[inicio:])
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(cls.cuerpo)))
+        self.end_headers()
+        self.wfile.write(cls.cuerpo)
+
+
+class FetchHistoricoDbTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = ThreadingHTTPServer(("127.0.0.1", 0), _ServidorFalso)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.servidor.server_port}/negativos_inventario.db"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directorio = Path(self.tmp.name) / "cache"
+        _ServidorFalso.cuerpo = _sqlite_bytes(self.tmp.name)
+        _ServidorFalso.forzar_304 = 0
+        _ServidorFalso.rango_desde_cero = False
+        _ServidorFalso.peticiones = []
+        _ServidorFalso.rangos = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self):
+        return historico_db.fetch_historico_db(self.url, directory=self.directorio, timeout=5)
+
+    def test_200_descarga_y_activa_la_copia(self):
+        path, success, error, info = self.fetch()
+        self.assertTrue(success, error)
+        self.assertEqual(info["estado"], "descargada")
+        # La copia activa es una base válida (con índices no es igual byte a byte al origen)
+        historico_db.validate_historico_db(path)
+        self.assertTrue(path.startswith(str(self.directorio)))
+        self.assertEqual(_ServidorFalso.peticiones, [None])
+
+    def test_304_con_copia_local_reutiliza_la_copia(self):
+        primera = self.fetch()
+        path, success, error, info = self.fetch()
+        self.assertTrue(success, error)
+        self.assertEqual(info["estado"], "sin_cambios")
+        self.assertEqual(path, primera[0])
+        # La segunda petición envía el ETag guardado y no transfiere el archivo
+        self.assertEqual(_ServidorFalso.peticiones, [None, primera[3]["etag"]])
+
+    def test_304_sin_copia_local_pide_el_archivo_completo(self):
+        # Sin metadatos no hay ETag que enviar; el servidor responde 304 igualmente
+        _ServidorFalso.forzar_304 = 1
+        path, success, error, info = self.fetch()
+        self.assertTrue(success, error)
+        self.assertEqual(info["estado"], "descargada")
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(_ServidorFalso.peticiones, [None, None])
+
+
+    def dejar_parcial(self, contenido):
+        """Simula una descarga cortada: .part con `contenido` y sus metadatos (url y ETag)"""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        etag = '"%s"' % hashlib.sha1(_ServidorFalso.cuerpo).hexdigest()
+        (self.directorio / f"{historico_db.REMOTE_DB_PREFIX}descarga.part").write_bytes(contenido)
+        (self.directorio / historico_db.REMOTE_PARTIAL_META).write_text(
+            json.dumps({"url": self.url, "etag": etag}), encoding="utf-8"
+        )
+
+    def assert_descargada(self, resultado):
+        path, success, error, info = resultado
+        self.assertTrue(success, error)
+        self.assertEqual(info["estado"], "descargada")
+        historico_db.validate_historico_db(path)
+        self.assertFalse((self.directorio / f"{historico_db.REMOTE_DB_PREFIX}descarga.part").exists())
+
+    def test_reanuda_con_206(self):
+        cuerpo = _ServidorFalso.cuerpo
+        self.dejar_parcial(cuerpo[:len(cuerpo) // 2])
+        self.assert_descargada(self.fetch())
+        self.assertEqual(_ServidorFalso.rangos, [f"bytes={len(cuerpo) // 2}-"])
+
+    def test_416_con_parcial_completo_termina_la_descarga(self):
+        # Cortada entre el último bloque y finish(): el .part ya es el archivo entero
+        self.dejar_parcial(_ServidorFalso.cuerpo)
+        self.assert_descargada(self.fetch())
+        self.assertEqual(_ServidorFalso.rangos, [f"bytes={len(_ServidorFalso.cuerpo)}-"])
+
+    def test_416_con_parcial_mas_largo_empieza_de_cero(self):
+        self.dejar_parcial(_ServidorFalso.cuerpo + b"basura")
+        self.assert_descargada(self.fetch())
+        self.assertEqual(_ServidorFalso.rangos, [f"bytes={len(_ServidorFalso.cuerpo) + 6}-", None])
+
+    def test_206_que_no_empieza_en_el_offset_empieza_de_cero(self):
+        _ServidorFalso.rango_desde_cero = True
+        cuerpo = _ServidorFalso.cuerpo
+        self.dejar_parcial(cuerpo[:len(cuerpo) // 2])
+        self.assert_descargada(self.fetch())
+        self.assertEqual(_ServidorFalso.rangos, [f"bytes={len(cuerpo) // 2}-", None])
+
+
+
+# Tabla como la publicada: sin NOT NULL en Stock (la app no crea esa base)
+_TABLA_PUBLICADA = """
+CREATE TABLE inventario (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT, CompanyId TEXT, InventLocationId TEXT,
+    ProductId TEXT, ProductName_es TEXT, LabelId TEXT, Stock INTEGER, CostStock REAL
+)
+"""
+
+_FILAS = [
+    # fecha, zona, almacén, producto, pallet, Stock, CostStock
+    ("2025-01-01 00:00:00", "Z1", "A1", "P-100", "L1", -5, -50.0),
+    ("2025-01-01 12:00:00", "Z1", "A2", "P-200", "L2", 3, 30.0),
+    ("2025-01-02 08:30:00", "Z1", "A1", "P-100", "L1", 0, -12.5),
+    ("2025-01-02 17:45:00", "Z2", "B1", "p-300", "L3", None, -7.0),
+    ("2025-01-02 00:00:00", "Z2", "B1", "P-400", "L4", "n/d", -1.0),
+    ("2025-01-03 00:00:01", "Z2", "B2", "P-200", "L5", None, 4.0),
+    ("2025-01-03 23:59:59", "Z3", "C1", "X-900", "L6", -1, None),
+    ("2025-01-04 23:59:59", "Z1", "A2", "P-300", "L7", 0, 0.0),
+]
+
+
+def _filtro_pandas(df, zonas=None, almacenes=None, fecha_desde=None, fecha_hasta=None,
+                   solo_negativos=False, buscar=None, excluir=(), incluir=()):
+    """Filtro del modo Histórico DB tal como lo hacía la app sobre el histórico completo"""
+    if solo_negativos:
+        df = df[(df["Stock"] < 0) | ((df["Stock"] == 0) & (df["CostStock"] < 0))]
+    if zonas is not None:
+        df = df[df["CompanyId"].isin(zonas)]
+    if almacenes is not None:
+        df = df[df["InventLocationId"].isin(almacenes)]
+    if buscar:
+        df = df[df["ProductId"].astype(str).str.contains(buscar, case=False, na=False)]
+    if excluir:
+        df = df[~df["ProductId"].astype(str).isin(excluir)]
+    if incluir:
+        df = df[df["ProductId"].astype(str).isin(incluir)]
+    if fecha_desde is not None and fecha_hasta is not None:
+        # La app recibía date de st.date_input
+        desde, hasta = pd.Timestamp(fecha_desde).date(), pd.Timestamp(fecha_hasta).date()
+        df = df[(df["fecha"].dt.date >= desde) & (df["fecha"].dt.date <= hasta)]
+    return df
+
+
+class QueryHistoricoTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.tmp.name) / "historico.db")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(_TABLA_PUBLICADA)
+            conn.executemany(
+                "INSERT INTO inventario (fecha, CompanyId, InventLocationId, ProductId, LabelId, Stock, CostStock) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                _FILAS,
+            )
+            conn.commit()
+            # Carga completa y conversiones de la versión anterior de la app
+            self.completo = pd.read_sql_query("SELECT * FROM inventario ORDER BY fecha DESC", conn)
+        finally:
+            conn.close()
+        self.completo["fecha"] = pd.to_datetime(self.completo["fecha"])
+        self.completo["Stock"] = pd.to_numeric(self.completo["Stock"], errors="coerce").fillna(0)
+        self.completo["CostStock"] = pd.to_numeric(self.completo["CostStock"], errors="coerce")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_igual_a_pandas(self, **filtros):
+        df, success, error = historico_db.query_historico(self.db_path, **filtros)
+        self.assertTrue(success, error)
+        esperado = _filtro_pandas(self.completo, **filtros)
+        self.assertEqual(sorted(df["LabelId"]), sorted(esperado["LabelId"]), filtros)
+        return df
+
+    def test_sin_filtros(self):
+        self.assertEqual(historico_db.build_historico_where(), ("", []))
+        self.assertEqual(len(self.assert_igual_a_pandas()), len(_FILAS))
+
+    def test_lista_vacia_de_zonas_o_almacenes_no_deja_pasar_nada(self):
+        self.assertEqual(len(self.assert_igual_a_pandas(zonas=[])), 0)
+        self.assertEqual(len(self.assert_igual_a_pandas(zonas=["Z1", "Z2"], almacenes=[])), 0)
+
+    def test_zonas_y_almacenes(self):
+        self.assert_igual_a_pandas(zonas=["Z1", "Z2"])
+        self.assert_igual_a_pandas(zonas=["Z2"], almacenes=["B1", "A1"])
+
+    def test_rango_de_fechas_incluye_horas(self):
+        df = self.assert_igual_a_pandas(fecha_desde=date(2025, 1, 2), fecha_hasta=date(2025, 1, 3))
+        self.assertEqual(sorted(df["LabelId"]), ["L1", "L3", "L4", "L5", "L6"])
+        self.assert_igual_a_pandas(fecha_desde=pd.Timestamp("2025-01-04"), fecha_hasta=pd.Timestamp("2025-01-04"))
+        self.assert_igual_a_pandas(fecha_desde=date(2025, 1, 1), fecha_hasta=date(2025, 1, 1))
+
+    def test_solo_negativos_con_stock_nulo_o_no_numerico(self):
+        df = self.assert_igual_a_pandas(solo_negativos=True)
+        # Stock NULL y "n/d" cuentan como 0 con CostStock negativo
+        self.assertIn("L3", set(df["LabelId"]))
+        self.assertIn("L4", set(df["LabelId"]))
+
+    def test_busqueda_exclusion_e_inclusion(self):
+        self.assert_igual_a_pandas(buscar="p-3")
+        self.assert_igual_a_pandas(excluir=["P-100", "P-200"])
+        self.assert_igual_a_pandas(incluir=["P-200", "X-900"])
+        self.assert_igual_a_pandas(incluir=["P-200"], excluir=["P-200"])
+        self.assert_igual_a_pandas(
+            zonas=["Z1", "Z2"], almacenes=["A1", "A2", "B1"], fecha_desde=date(2025, 1, 1),
+            fecha_hasta=date(2025, 1, 2), solo_negativos=True, buscar="P", excluir=["P-400"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+"""
+Hojas del reporte Excel: Top N frente al escritor original fila a fila y
+reparto de tablas grandes en hojas numeradas (límite de filas reducido)
+
+    python -m unittest discover tests
+"""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import xlsxwriter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ingestion import normalize_report_frame  # noqa: E402
+from pipeline import InventoryAnalyzer  # noqa: E402
+import reporting  # noqa: E402
+from reporting import create_top_n_sheet, report_sheet_names, write_excel_report, write_excel_report_file  # noqa: E402
+
+
+def _top_n_original(writer, super_analisis, analisis, top_n):
+    """Hoja Top N como la escribía la app antes (búsqueda por pallet y una celda a la vez)"""
+    workbook = writer.book
+    worksheet = workbook.add_worksheet("Top N")
+    top_data = analisis.sort_values("Score_Criticidad", ascending=False).head(top_n).copy()
+    cols_base = [
+        "Rank", "ID_Unico_Pallet", "Codigo", "Nombre", "ID_Pallet", "Almacen",
+        "Score_Criticidad", "Dias_Acumulados", "Cantidad_Promedio", "Severidad",
+        "Primera_Aparicion", "Ultima_Aparicion", "Estado"
+    ]
+    for j, col in enumerate(cols_base):
+        worksheet.write(0, j, col)
+    date_cols = [c for c in super_analisis.columns if isinstance(c, pd.Timestamp)]
+    for j, fecha in enumerate(sorted(date_cols), start=len(cols_base)):
+        worksheet.write(0, j, fecha.strftime("%Y-%m-%d"))
+    super_copy = super_analisis.copy()
+    super_copy["_ID_UNICO_"] = super_copy["Codigo"].astype(str) + "_" + super_copy["ID_Pallet"].astype(str)
+    number_format = workbook.add_format({'num_format': '#,##0.00'})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    for i, (_, row) in enumerate(top_data.iterrows(), start=1):
+        worksheet.write_number(i, 0, i)
+        worksheet.write(i, 1, row["ID_Unico_Pallet"])
+        worksheet.write(i, 2, str(row["Codigo"]))
+        worksheet.write(i, 3, str(row["Nombre"]) if pd.notna(row["Nombre"]) else "")
+        worksheet.write(i, 4, str(row["ID_Pallet"]))
+        worksheet.write(i, 5, str(row["Almacen"]))
+        worksheet.write_number(i, 6, float(row["Score_Criticidad"]), number_format)
+        worksheet.write_number(i, 7, int(row["Dias_Acumulados"]))
+        worksheet.write_number(i, 8, float(row["Cantidad_Promedio"]), number_format)
+        worksheet.write(i, 9, str(row["Severidad"]) if pd.notna(row["Severidad"]) else "")
+        worksheet.write_datetime(i, 10, pd.to_datetime(row["Primera_Aparicion"]), date_format)
+        worksheet.write_datetime(i, 11, pd.to_datetime(row["Ultima_Aparicion"]), date_format)
+        worksheet.write(i, 12, str(row["Estado"]))
+        fila_super = super_copy[super_copy["_ID_UNICO_"] == row["ID_Unico_Pallet"]]
+        if not fila_super.empty:
+            row_super = fila_super.iloc[0]
+            for j, fecha in enumerate(sorted(date_cols), start=len(cols_base)):
+                val = pd.to_numeric(row_super.get(fecha, np.nan), errors='coerce')
+                if pd.notna(val):
+                    worksheet.write_number(i, j, float(val), number_format)
+
+
+def _celdas(path, hoja):
+    """Valores y formato numérico de cada celda con dato de una hoja"""
+    worksheet = openpyxl.load_workbook(path)[hoja]
+    return {
+        celda.coordinate: (celda.value, celda.number_format)
+        for fila in worksheet.iter_rows() for celda in fila if celda.value is not None
+    }
+
+
+def _reportes():
+    """Cinco días con huecos; el mismo Codigo/ID_Pallet aparece en dos almacenes"""
+    rng = np.random.default_rng(14)
+    filas = []
+    for dia, fecha in enumerate(pd.date_range("2025-03-01", periods=5)):
+        for pallet in range(30):
+            if (pallet + dia) % 4 == 0:
+                continue
+            almacen = "A" if pallet % 2 else "B"
+            filas.append((f"C{pallet % 12}", f"P{pallet}", almacen, -rng.uniform(1, 500), fecha))
+            if pallet % 5 == 0:
+                # Mismo pallet en otro almacén con otra cantidad
+                filas.append((f"C{pallet % 12}", f"P{pallet}", "Z", -rng.uniform(1, 500), fecha))
+    crudo = pd.DataFrame(filas, columns=["Código", "ID de Pallet", "Almacén", "Inventario Físico", "Fecha_Reporte"])
+    crudo["Nombre"] = "Producto " + crudo["Código"]
+    crudo["Archivo_Origen"] = "reporte"
+    return crudo
+
+
+class TopNSheetTest(unittest.TestCase):
+    top_n = 15
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.crudo = _reportes()
+        analyzer = InventoryAnalyzer()
+        df_total = normalize_report_frame(cls.crudo)
+        original = Path(cls.tmp.name) / "original.xlsx"
+        with pd.ExcelWriter(original, engine="xlsxwriter") as writer:
+            _top_n_original(
+                writer, analyzer.create_super_analysis(df_total), analyzer.analyze_pallets(df_total), cls.top_n
+            )
+        cls.esperado = _celdas(original, "Top N")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_mismas_celdas_que_el_escritor_original(self):
+        for compact in (False, True):
+            for sparse in (False, True):
+                with self.subTest(compact=compact, sparse=sparse):
+                    analyzer = InventoryAnalyzer(compact=compact, sparse=sparse)
+                    df_total = normalize_report_frame(self.crudo, compact)
+                    path = Path(self.tmp.name) / f"nuevo_{compact}_{sparse}.xlsx"
+                    workbook = xlsxwriter.Workbook(path)
+                    create_top_n_sheet(
+                        workbook, analyzer.create_super_analysis(df_total), analyzer.analyze_pallets(df_total),
+                        self.top_n
+                    )
+                    workbook.close()
+                    self.assertEqual(_celdas(path, "Top N"), self.esperado)
+
+    def test_fixture_cubre_pallets_en_varios_almacenes(self):
+        top = {valor for (valor, _) in self.esperado.values() if isinstance(valor, str) and "_P" in valor}
+        repetidos = {f"C{p % 12}_P{p}" for p in range(0, 30, 5)}
+        self.assertTrue(top & repetidos)
+        self.assertEqual(len([c for c in self.esperado if c.startswith("A") and c != "A1"]), self.top_n)
+
+
+class SheetSplitTest(unittest.TestCase):
+    """Con REPORT_SHEET_MAX_ROWS reducido, las tablas se reparten como pasado el límite de Excel"""
+
+    limite = 40
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        analyzer = InventoryAnalyzer()
+        df_total = normalize_report_frame(_reportes())
+        analisis = analyzer.analyze_pallets(df_total)
+        cls.tablas = (analisis, analyzer.create_super_analysis(df_total), analyzer.detect_recurrences(df_total), df_total)
+        cls.filas = {
+            "Problemas Activos": int((analisis["Estado"] == "Activo").sum()),
+            "Resueltos": int((analisis["Estado"] == "Resuelto").sum()),
+            "Reincidencias": len(cls.tablas[2]),
+            "Super Análisis": len(cls.tablas[1]),
+            "Datos Crudos": len(df_total),
+        }
+        # Referencia sin límite reducido: cada tabla en una sola hoja
+        cls.completo = Path(cls.tmp.name) / "completo.xlsx"
+        write_excel_report_file(*cls.tablas, path=cls.completo)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_nombres_de_hoja(self):
+        with mock.patch.object(reporting, "REPORT_SHEET_MAX_ROWS", 7):
+            self.assertEqual(report_sheet_names("Datos Crudos", 0), ["Datos Crudos"])
+            self.assertEqual(report_sheet_names("Datos Crudos", 7), ["Datos Crudos"])
+            self.assertEqual(report_sheet_names("Datos Crudos", 8), ["Datos Crudos 1", "Datos Crudos 2"])
+            self.assertEqual(report_sheet_names("Datos Crudos", 21), [f"Datos Crudos {i}" for i in (1, 2, 3)])
+
+    def test_tablas_repartidas_en_hojas(self):
+        self.assertGreater(self.filas["Datos Crudos"], 2 * self.limite)
+        libro_completo = openpyxl.load_workbook(self.completo)
+        for nombre, escribir in (("pandas", self.escribir_con_pandas), ("constant_memory", self.escribir_en_disco)):
+            with self.subTest(escritor=nombre):
+                # Bloques de escritura que no coinciden con el límite: alguno cruza de una hoja a otra
+                with mock.patch.object(reporting, "REPORT_SHEET_MAX_ROWS", self.limite), \
+                        mock.patch.object(reporting, "REPORT_WRITE_CHUNK_ROWS", 15):
+                    libro = openpyxl.load_workbook(escribir())
+                    hojas_por_tabla = {tabla: report_sheet_names(tabla, n) for tabla, n in self.filas.items()}
+                esperadas = [hoja for hojas in hojas_por_tabla.values() for hoja in hojas]
+                self.assertEqual(libro.sheetnames, esperadas + ["Top N"])
+                self.assertIn("Datos Crudos 3", esperadas)
+                for tabla, n in self.filas.items():
+                    filas_completas = list(libro_completo[tabla].values)
+                    hojas = hojas_por_tabla[tabla]
+                    filas_repartidas = []
+                    for k, hoja in enumerate(hojas):
+                        filas_hoja = list(libro[hoja].values)
+                        # Cada hoja repite el encabezado y tiene como máximo el límite de filas
+                        self.assertEqual(filas_hoja[0], filas_completas[0], hoja)
+                        esperado = self.limite if k < len(hojas) - 1 else n - self.limite * (len(hojas) - 1)
+                        self.assertEqual(len(filas_hoja) - 1, esperado, hoja)
+                        filas_repartidas += filas_hoja[1:]
+                    self.assertEqual(filas_repartidas, filas_completas[1:], tabla)
+
+    def escribir_con_pandas(self):
+        path = Path(self.tmp.name) / "pandas.xlsx"
+        path.write_bytes(write_excel_report(*self.tablas).getvalue())
+        return path
+
+    def escribir_en_disco(self):
+        return write_excel_report_file(*self.tablas, path=Path(self.tmp.name) / "disco.xlsx")
+
+
+if __name__ == "__main__":
+    unittest.main()